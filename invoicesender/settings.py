@@ -50,6 +50,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'myapp.middleware.PerformanceMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -98,6 +99,27 @@ DATABASES = {
 }
 
 
+# Local memory by default; set REDIS_URL to share the cache between workers.
+CACHES = {
+    'default': (
+        {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+        if os.getenv('REDIS_URL')
+        else {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    )
+}
+
+# Seconds a cached Company/Client/Item row lives (see myapp/cache.py).
+TENANT_CACHE_TIMEOUT = int(os.getenv('TENANT_CACHE_TIMEOUT', '300'))
+# Invalidation only reaches workers sharing the cache backend, so the tenant
+# cache stays off unless REDIS_URL is set.
+TENANT_CACHE_ENABLED = bool(os.getenv('REDIS_URL'))
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -159,10 +181,34 @@ EMAIL_HOST_USER = os.getenv("EMAIL_HOST_USER")
 EMAIL_HOST_PASSWORD = os.getenv("EMAIL_HOST_PASSWORD")
 DEFAULT_FROM_EMAIL = EMAIL_HOST_USER
 
+# Invoice emails are queued and delivered by `manage.py send_queued_emails`.
+INVOICE_EMAIL_MAX_ATTEMPTS = int(os.getenv("INVOICE_EMAIL_MAX_ATTEMPTS", "5"))
+INVOICE_EMAIL_RETRY_BASE_SECONDS = int(os.getenv("INVOICE_EMAIL_RETRY_BASE_SECONDS", "60"))
+
+# Processes in each web worker's shared PDF render pool, used by the ZIP
+# export endpoint (myapp/utils.py render_pool). 1 renders in the request.
+PDF_EXPORT_WORKERS = int(os.getenv("PDF_EXPORT_WORKERS", "2"))
+
+# Invoice activity events are buffered per thread and written in one insert
+# when the request finishes, or earlier once this many are pending or the
+# oldest has waited this many seconds (myapp/activity.py).
+ACTIVITY_BUFFER_SIZE = int(os.getenv("ACTIVITY_BUFFER_SIZE", "100"))
+ACTIVITY_FLUSH_SECONDS = float(os.getenv("ACTIVITY_FLUSH_SECONDS", "5"))
+
+# Request instrumentation (myapp/middleware.py). Requests running more SQL
+# statements than their budget are logged and counted in /metrics.
+PERFORMANCE_QUERY_BUDGET = int(os.getenv("PERFORMANCE_QUERY_BUDGET", "50"))
+PERFORMANCE_QUERY_BUDGETS = {
+    # URL name -> budget, e.g. "invoice-list": 10
+}
+# Bearer token the Prometheus scraper sends to /metrics; admins can always read it.
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework.authentication.SessionAuthentication',
         'rest_framework_simplejwt.authentication.JWTAuthentication',
     ),
+    'DEFAULT_PAGINATION_CLASS': 'myapp.pagination.IdCursorPagination',
 }
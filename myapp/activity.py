@@ -0,0 +1,94 @@
+"""
+Buffered invoice audit log.
+
+Receivers in ``signals.py`` call ``record_activity`` for lifecycle events.
+Events are queued when the surrounding transaction commits, so rolled-back
+writes leave no audit rows, and collect in a per-thread buffer and are written with one
+``bulk_create`` when the request finishes (after the response has been
+sent), when ``ACTIVITY_BUFFER_SIZE`` events are pending, or on the first
+event after the oldest pending one is ``ACTIVITY_FLUSH_SECONDS`` old.
+Workers outside the request cycle call ``flush_activities`` themselves.
+"""
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.dispatch import Signal
+from django.utils import timezone
+
+from .models import Activity, Invoice
+
+logger = logging.getLogger(__name__)
+
+# Events that have no model save to hook into.
+invoice_pdf_downloaded = Signal()  # sender=Invoice, invoice_id
+invoice_email_sent = Signal()  # sender=Invoice, invoice_id, to_email
+
+_state = threading.local()
+
+
+def _pending():
+    if not hasattr(_state, "events"):
+        _state.events = []
+        _state.oldest = None
+    return _state.events
+
+
+def record_activity(invoice_id, event):
+    """
+    Queue an event for ``invoice_id`` once the current transaction commits
+    (right away outside one); it is written on the next flush.
+    """
+    activity = Activity(invoice_id=invoice_id, event=event[:150], created_at=timezone.now())
+    transaction.on_commit(lambda: _buffer(activity))
+
+
+def _buffer(activity):
+    events = _pending()
+    if not events:
+        _state.oldest = time.monotonic()
+    events.append(activity)
+
+    if (
+        len(events) >= settings.ACTIVITY_BUFFER_SIZE
+        or time.monotonic() - _state.oldest >= settings.ACTIVITY_FLUSH_SECONDS
+    ):
+        flush_activities()
+
+
+def payment_event(payment):
+    return f"Payment of {payment.amount} recorded ({payment.payment_method})"
+
+
+def flush_activities(**kwargs):
+    """
+    Write the pending events with one insert. Events of invoices deleted
+    since are dropped. Also connected to ``request_finished``.
+    """
+    events = _pending()
+    if not events:
+        return 0
+    batch = events[:]
+    events.clear()
+    _state.oldest = None
+
+    try:
+        existing = set(
+            Invoice.objects.filter(pk__in={event.invoice_id for event in batch}).values_list("pk", flat=True)
+        )
+        batch = [event for event in batch if event.invoice_id in existing]
+        # Savepoint, so a failed audit write never breaks the caller's transaction.
+        with transaction.atomic():
+            Activity.objects.bulk_create(batch)
+    except Exception:
+        logger.exception("Failed to write %s invoice activities", len(batch))
+        return 0
+    return len(batch)
+
+
+def discard_activities():
+    """Drop pending events without writing them."""
+    _pending().clear()
+    _state.oldest = None
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Company, Invoice, Client , Activity , Item , InvoiceItem, Payment
+from .models import Company, Invoice, Client , Activity , Item , InvoiceEmail, InvoiceItem, InvoiceSequence, Payment, RecurringInvoice, RecurringInvoiceLine
 # Register your models here.
 
 admin.site.register(Company)
@@ -9,3 +9,7 @@ admin.site.register(Activity)
 admin.site.register(Item)
 admin.site.register(InvoiceItem)
 admin.site.register(Payment)
+admin.site.register(InvoiceSequence)
+admin.site.register(InvoiceEmail)
+admin.site.register(RecurringInvoice)
+admin.site.register(RecurringInvoiceLine)
@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.utils.crypto import constant_time_compare
+from rest_framework.authentication import BaseAuthentication
+
+
+class MetricsTokenAuthentication(BaseAuthentication):
+    """
+    Accepts ``Authorization: Bearer <METRICS_TOKEN>`` from the Prometheus
+    scraper. Any other header falls through to the next authenticator.
+    """
+
+    def authenticate(self, request):
+        token = settings.METRICS_TOKEN
+        header = request.headers.get("Authorization", "")
+        if token and constant_time_compare(header, f"Bearer {token}"):
+            return AnonymousUser(), MetricsTokenAuthentication
+        return None
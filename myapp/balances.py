@@ -0,0 +1,156 @@
+from django.db.models import Count, F, Sum
+from django.utils import timezone
+
+from .models import Client, ClientBalance, Company, CompanyBalance, Invoice
+
+BALANCE_FIELDS = ("invoice_count", "invoiced_total", "paid_total", "outstanding")
+
+# (balance model, owner field on Invoice)
+LEDGERS = (
+    (ClientBalance, "client"),
+    (CompanyBalance, "company"),
+)
+
+
+def balance_totals(invoices, owner_field):
+    """Aggregate balance columns per owner; cancelled invoices do not count."""
+    rows = (
+        invoices.exclude(status="cancelled")
+        .order_by()
+        .values(f"{owner_field}_id")
+        .annotate(
+            invoice_count=Count("id"),
+            invoiced_total=Sum("item_total", default=0),
+            paid_total=Sum("total_paid_amount", default=0),
+            outstanding=Sum("remaining_amount", default=0),
+        )
+    )
+    return {row.pop(f"{owner_field}_id"): row for row in rows}
+
+
+def refresh_balances(client_ids=(), company_ids=(), create=True):
+    """
+    Recompute the ledger rows for the given owners from their invoices and
+    upsert them in one statement per ledger. Writes keep the ledgers current
+    with deltas (``apply_invoice_change``); this full re-sum is only for
+    rebuilding and for owners that have no ledger row yet. With
+    ``create=False`` only existing rows are updated, which is what deletes
+    need while the owner itself may be going away.
+    """
+    for (model, owner_field), ids in zip(LEDGERS, (client_ids, company_ids)):
+        ids = {owner_id for owner_id in ids if owner_id is not None}
+        if not ids:
+            continue
+
+        totals = balance_totals(Invoice.objects.filter(**{f"{owner_field}_id__in": ids}), owner_field)
+        empty = dict.fromkeys(BALANCE_FIELDS, 0)
+        if create:
+            model.objects.bulk_create(
+                [model(pk=owner_id, **totals.get(owner_id, empty)) for owner_id in ids],
+                update_conflicts=True,
+                unique_fields=[owner_field],
+                update_fields=[*BALANCE_FIELDS, "updated_at"],
+            )
+        else:
+            for owner_id in ids:
+                model.objects.filter(pk=owner_id).update(**totals.get(owner_id, empty))
+
+
+# Invoice columns that decide what an invoice adds to its ledgers.
+LEDGER_COLUMNS = ("status", "client_id", "company_id", "item_total", "total_paid_amount", "remaining_amount")
+
+
+def invoice_contribution(row):
+    """What one invoice (a dict of ``LEDGER_COLUMNS``, or None) adds to its owners' ledgers."""
+    if row is None or row["status"] == "cancelled":
+        return dict.fromkeys(BALANCE_FIELDS, 0)
+    return {
+        "invoice_count": 1,
+        "invoiced_total": row["item_total"],
+        "paid_total": row["total_paid_amount"],
+        "outstanding": row["remaining_amount"],
+    }
+
+
+def shift_balances(model, owner_field, changes_by_owner, create=True):
+    """
+    Add ``{owner_id: {balance field: amount}}`` to ledger rows with ``F()``
+    updates, so concurrent writers never overwrite each other. Owners with
+    the same change share one UPDATE. An owner without a ledger row yet gets
+    one built from its invoices (unless ``create=False``, as on deletes).
+    """
+    groups = {}
+    for owner_id, changes in changes_by_owner.items():
+        changes = tuple((name, value) for name, value in changes.items() if value)
+        if owner_id is not None and changes:
+            groups.setdefault(changes, []).append(owner_id)
+
+    missing = []
+    for changes, owner_ids in groups.items():
+        updated = model.objects.filter(pk__in=owner_ids).update(
+            updated_at=timezone.now(), **{name: F(name) + value for name, value in changes}
+        )
+        if updated < len(owner_ids):
+            existing = set(model.objects.filter(pk__in=owner_ids).values_list("pk", flat=True))
+            missing.extend(owner_id for owner_id in owner_ids if owner_id not in existing)
+    if missing and create:
+        refresh_balances(**{f"{owner_field}_ids": missing})
+
+
+def apply_invoice_change(before, after, create=True):
+    """
+    Move both ledgers from invoice row ``before`` to ``after`` (dicts of
+    ``LEDGER_COLUMNS``; None for a created or deleted invoice).
+    """
+    old = invoice_contribution(before)
+    new = invoice_contribution(after)
+    for model, owner_field in LEDGERS:
+        old_owner = before and before[f"{owner_field}_id"]
+        new_owner = after and after[f"{owner_field}_id"]
+        if old_owner == new_owner:
+            changes = {old_owner: {name: new[name] - old[name] for name in BALANCE_FIELDS}}
+        else:
+            changes = {
+                old_owner: {name: -old[name] for name in BALANCE_FIELDS},
+                new_owner: new,
+            }
+        shift_balances(model, owner_field, changes, create=create)
+
+
+def add_invoices_to_balances(rows):
+    """Add freshly inserted invoices (dicts of ``LEDGER_COLUMNS``) to their ledgers in bulk."""
+    for model, owner_field in LEDGERS:
+        changes = {}
+        for row in rows:
+            owner = changes.setdefault(row[f"{owner_field}_id"], dict.fromkeys(BALANCE_FIELDS, 0))
+            for name, value in invoice_contribution(row).items():
+                owner[name] += value
+        shift_balances(model, owner_field, changes)
+
+
+def apply_balance_delta(invoice_id, total=0, paid=0):
+    """
+    Shift both ledgers by a change in one invoice's total and/or paid
+    amount, without re-aggregating. Cancelled invoices do not count.
+    """
+    if not total and not paid:
+        return
+    invoice = Invoice.objects.filter(pk=invoice_id).exclude(status="cancelled")
+    changes = {"invoiced_total": total, "paid_total": paid, "outstanding": total - paid}
+    for model, owner_field in LEDGERS:
+        model.objects.filter(pk__in=invoice.values(f"{owner_field}_id")).update(
+            updated_at=timezone.now(),
+            **{name: F(name) + value for name, value in changes.items() if value},
+        )
+
+
+def rebuild_all_balances(batch_size=1000):
+    """Recompute every ledger row from scratch; returns the number of rows written."""
+    written = 0
+    for (model, owner_field), owners in zip(LEDGERS, (Client.objects, Company.objects)):
+        owner_ids = list(owners.values_list("id", flat=True))
+        for start in range(0, len(owner_ids), batch_size):
+            chunk = owner_ids[start:start + batch_size]
+            refresh_balances(**{f"{owner_field}_ids": chunk})
+            written += len(chunk)
+    return written
@@ -0,0 +1,218 @@
+"""
+Synthetic data and timing helpers for the benchmark management commands.
+
+Seeded rows belong to users named ``bench-tenant-<n>`` so they can be told
+apart from real data and removed with ``delete_benchmark_data``. Always
+point DATABASE_URL at a scratch database when running benchmarks.
+"""
+import statistics
+import time
+import tracemalloc
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from .models import Client, Company, Invoice, InvoiceItem, Item, Payment
+
+BENCH_USER_PREFIX = "bench-tenant-"
+
+
+def seed_tenants(count):
+    """Create (or reuse) ``count`` tenants, each with one company, client and item."""
+    tenants = []
+    for index in range(count):
+        user, _ = User.objects.get_or_create(username=f"{BENCH_USER_PREFIX}{index}")
+        company = Company.objects.filter(user=user).first() or Company.objects.create(
+            user=user,
+            owner_name="Bench Owner",
+            business_name=f"Bench Company {index}",
+            email=f"owner{index}@bench.example.com",
+            mobile_number="9999999999",
+            state="Punjab",
+            city="Ludhiana",
+            pincode="141001",
+            invoice_prefix=f"B{index}",
+        )
+        client = Client.objects.filter(user=user).first() or Client.objects.create(
+            user=user,
+            company=company,
+            business_name=f"Bench Client {index}",
+            email=f"client{index}@bench.example.com",
+            mobile_number="8888888888",
+            state="Punjab",
+            city="Ludhiana",
+            pincode="141001",
+        )
+        item = Item.objects.filter(user=user).first() or Item.objects.create(
+            user=user,
+            item_code=f"BENCH-{index}",
+            item_name="Bench Widget",
+            gst_rate=Decimal("18.00"),
+            quantity=1,
+            price=Decimal("100.00"),
+        )
+        tenants.append((user, company, client, item))
+    return tenants
+
+
+def seed_catalogue(tenants, clients, items):
+    """Top every tenant up to ``clients`` clients and ``items`` items."""
+    for index, (user, company, _, _) in enumerate(tenants):
+        Client.objects.bulk_create(
+            [
+                Client(
+                    user=user,
+                    company=company,
+                    business_name=f"Bench Client {index}-{number}",
+                    mobile_number="8888888888",
+                    state="Punjab",
+                    city="Ludhiana",
+                    pincode="141001",
+                )
+                for number in range(1, clients)
+            ],
+            ignore_conflicts=True,
+        )
+        Item.objects.bulk_create(
+            [
+                Item(
+                    user=user,
+                    item_code=f"BENCH-{index}-{number}",
+                    item_name=f"Bench Item {number}",
+                    gst_rate=Decimal("18.00"),
+                    quantity=1,
+                    price=Decimal("100.00"),
+                )
+                for number in range(1, items)
+            ],
+            ignore_conflicts=True,
+        )
+
+
+def seed_invoices(tenants, count, batch_size=5000, payment_every=10, lines=0):
+    """
+    Insert ``count`` more invoices spread round-robin over ``tenants`` with
+    bulk_create, plus a payment on every ``payment_every``-th invoice.
+    Totals are written directly. With ``lines``, each invoice also gets
+    that many 1 x 100.00 @ 18% lines of the tenant's seeded item.
+    """
+    start = Invoice.objects.filter(user__username__startswith=BENCH_USER_PREFIX).count()
+    statuses = [choice for choice, _ in Invoice.STATUS_CHOICES]
+    first_day = date(2020, 1, 1)
+    units = lines or 1
+    items = {tenant[0].pk: tenant[3] for tenant in tenants}
+
+    for offset in range(0, count, batch_size):
+        invoices = []
+        for number in range(start + offset, start + min(offset + batch_size, count)):
+            user, company, client, _ = tenants[number % len(tenants)]
+            total = Decimal("118.00") * units
+            paid = total if number % payment_every == 0 else Decimal("0")
+            invoices.append(
+                Invoice(
+                    user=user,
+                    company=company,
+                    client=client,
+                    selected_template="classic",
+                    invoice_no=f"{company.invoice_prefix}-BENCH-{number:08d}",
+                    invoice_date=first_day + timedelta(days=number % 2000),
+                    status=statuses[number % len(statuses)],
+                    item_subtotal_amount=Decimal("100.00") * units,
+                    item_subtotal_gst=Decimal("18.00") * units,
+                    item_total=total,
+                    total_paid_amount=paid,
+                    remaining_amount=total - paid,
+                    payment_status="paid" if paid else "pending",
+                )
+            )
+        with transaction.atomic():
+            created = Invoice.objects.bulk_create(invoices)
+            Payment.objects.bulk_create(
+                Payment(invoice=invoice, amount=invoice.total_paid_amount, payment_method="online")
+                for invoice in created
+                if invoice.total_paid_amount
+            )
+            if lines:
+                InvoiceItem.objects.bulk_create(
+                    [
+                        InvoiceItem(
+                            invoice=invoice,
+                            item=items[invoice.user_id],
+                            quantity=1,
+                            price=Decimal("100.00"),
+                            gst_rate=Decimal("18.00"),
+                            line_amount=Decimal("100.00"),
+                            line_gst=Decimal("18.00"),
+                        )
+                        for invoice in created
+                        for _ in range(lines)
+                    ],
+                    batch_size=batch_size,
+                )
+
+
+def dataset_counts(users):
+    """Rows the benchmark tenants actually own, which may differ from the seeding options."""
+    return {
+        "tenants": len(users),
+        "clients": Client.objects.filter(user__in=users).count(),
+        "items": Item.objects.filter(user__in=users).count(),
+        "invoices": Invoice.objects.filter(user__in=users).count(),
+        "invoice_items": InvoiceItem.objects.filter(invoice__user__in=users).count(),
+        "payments": Payment.objects.filter(invoice__user__in=users).count(),
+    }
+
+
+def delete_benchmark_data():
+    users = User.objects.filter(username__startswith=BENCH_USER_PREFIX)
+    with transaction.atomic():
+        # InvoiceItem.item is PROTECT, so lines must go before the items they use.
+        InvoiceItem.objects.filter(invoice__user__in=users).delete()
+        return users.delete()
+
+
+def time_call(func, repeat=5):
+    """Run ``func`` ``repeat`` times and return the median wall time in milliseconds."""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def measure(func, repeat=5, setup=None):
+    """
+    Run ``func`` ``repeat`` times and return median/min/max wall time (ms),
+    the SQL statements of one run and the peak Python memory of one run
+    (KiB, via tracemalloc, measured in a separate untimed run).
+    ``setup`` is called before every run, outside the measurement.
+    """
+    timings = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        started = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started) * 1000)
+
+    if setup:
+        setup()
+    with CaptureQueriesContext(connection) as queries:
+        tracemalloc.start()
+        try:
+            func()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+    return {
+        "median_ms": round(statistics.median(timings), 3),
+        "min_ms": round(min(timings), 3),
+        "max_ms": round(max(timings), 3),
+        "queries": len(queries),
+        "peak_kib": round(peak / 1024, 1),
+    }
@@ -0,0 +1,90 @@
+"""
+Per-tenant read-through cache for Company, Client and Item rows.
+
+Entries are keyed by ``(model, user, version, pk)``. Any save or delete of
+one of a user's rows replaces that user's version token (see signals.py),
+so every cached row of that model for the user is dropped at once without
+tracking individual keys. Hit and miss counts are kept per process and
+read with ``cache_stats()``.
+
+Version tokens only reach the workers that share the cache backend, so
+lookups go straight to the database unless ``TENANT_CACHE_ENABLED`` is set
+(it is whenever ``REDIS_URL`` configures a shared cache).
+"""
+import threading
+import uuid
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+
+_lock = threading.Lock()
+_stats = Counter()
+
+
+def _prefix(model, user_id):
+    return f"tenant:{model._meta.label_lower}:{user_id}"
+
+
+def _version(model, user_id):
+    key = f"{_prefix(model, user_id)}:version"
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def _record(model, hits, misses):
+    name = model._meta.model_name
+    with _lock:
+        _stats[(name, "hits")] += hits
+        _stats[(name, "misses")] += misses
+
+
+def invalidate_tenant(model, user_id):
+    """Drop every cached ``model`` row belonging to ``user_id``."""
+    if not settings.TENANT_CACHE_ENABLED:
+        return
+    cache.set(f"{_prefix(model, user_id)}:version", uuid.uuid4().hex, timeout=None)
+
+
+def get_tenant_objects(model, user_id, pks):
+    """Return ``{pk: instance}`` for those of ``pks`` owned by ``user_id``."""
+    if not settings.TENANT_CACHE_ENABLED:
+        return model.objects.filter(user_id=user_id).in_bulk(list(pks))
+    prefix = f"{_prefix(model, user_id)}:{_version(model, user_id)}"
+    keys = {pk: f"{prefix}:{pk}" for pk in pks}
+    cached = cache.get_many(keys.values())
+    found = {pk: cached[key] for pk, key in keys.items() if key in cached}
+
+    missing = [pk for pk in keys if pk not in found]
+    if missing:
+        loaded = model.objects.filter(user_id=user_id).in_bulk(missing)
+        cache.set_many(
+            {keys[pk]: obj for pk, obj in loaded.items()},
+            timeout=settings.TENANT_CACHE_TIMEOUT,
+        )
+        found.update(loaded)
+
+    _record(model, len(keys) - len(missing), len(missing))
+    return found
+
+
+def get_tenant_object(model, user_id, pk):
+    """Return the ``model`` row ``pk`` if ``user_id`` owns it, else None."""
+    return get_tenant_objects(model, user_id, [pk]).get(pk)
+
+
+def cache_stats():
+    """``{model_name: {"hits": n, "misses": n}}`` for this process."""
+    with _lock:
+        stats = {}
+        for (name, kind), count in _stats.items():
+            stats.setdefault(name, {"hits": 0, "misses": 0})[kind] = count
+        return stats
+
+
+def reset_cache_stats():
+    with _lock:
+        _stats.clear()
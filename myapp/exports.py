@@ -0,0 +1,111 @@
+"""
+Streaming CSV / JSON Lines exports.
+
+Rows are read with ``values_list().iterator()`` so neither model instances
+nor the full result set are ever held in memory, and the output is yielded
+in blocks of ``chunk_size`` rows for a ``StreamingHttpResponse``.
+"""
+import csv
+import io
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import Invoice, InvoiceItem, Payment
+
+EXPORT_CHUNK_SIZE = 2000
+
+EXPORT_FORMATS = {
+    "csv": "text/csv",
+    "jsonl": "application/x-ndjson",
+}
+
+# Output column name -> ORM lookup.
+EXPORTS = {
+    "invoices": (
+        Invoice,
+        {
+            "id": "id",
+            "invoice_no": "invoice_no",
+            "invoice_date": "invoice_date",
+            "status": "status",
+            "payment_status": "payment_status",
+            "company": "company__business_name",
+            "client": "client__business_name",
+            "item_subtotal_amount": "item_subtotal_amount",
+            "item_subtotal_gst": "item_subtotal_gst",
+            "item_total": "item_total",
+            "total_paid_amount": "total_paid_amount",
+            "remaining_amount": "remaining_amount",
+        },
+    ),
+    "invoice-items": (
+        InvoiceItem,
+        {
+            "id": "id",
+            "invoice_no": "invoice__invoice_no",
+            "item_code": "item__item_code",
+            "item_name": "item__item_name",
+            "quantity": "quantity",
+            "price": "price",
+            "gst_rate": "gst_rate",
+        },
+    ),
+    "payments": (
+        Payment,
+        {
+            "id": "id",
+            "invoice_no": "invoice__invoice_no",
+            "amount": "amount",
+            "payment_method": "payment_method",
+            "reference": "reference",
+            "created_at": "created_at",
+        },
+    ),
+}
+
+
+def export_queryset(kind, invoices):
+    """Return ``(columns, queryset)`` for export ``kind`` limited to ``invoices``."""
+    model, columns = EXPORTS[kind]
+    if model is Invoice:
+        rows = invoices
+    else:
+        rows = model.objects.filter(invoice__in=invoices.values("id"))
+    return list(columns), rows.order_by("id").values_list(*columns.values())
+
+
+def _chunks(rows, chunk_size):
+    chunk = []
+    for row in rows.iterator(chunk_size=chunk_size):
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def stream_csv(columns, rows, chunk_size=EXPORT_CHUNK_SIZE):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for chunk in _chunks(rows, chunk_size):
+        writer.writerows(chunk)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        # Nothing matched; still send the header row.
+        yield buffer.getvalue()
+
+
+def stream_jsonl(columns, rows, chunk_size=EXPORT_CHUNK_SIZE):
+    encoder = DjangoJSONEncoder()
+    for chunk in _chunks(rows, chunk_size):
+        yield "".join(encoder.encode(dict(zip(columns, row))) + "\n" for row in chunk)
+
+
+def stream_export(fmt, columns, rows, chunk_size=EXPORT_CHUNK_SIZE):
+    if fmt == "jsonl":
+        return stream_jsonl(columns, rows, chunk_size)
+    return stream_csv(columns, rows, chunk_size)
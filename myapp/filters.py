@@ -0,0 +1,29 @@
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend, OrderingFilter
+
+
+class QueryParamFilterBackend(BaseFilterBackend):
+    """
+    Filters list responses with the view's ``filter_serializer_class``: the
+    serializer validates the query string and its ``filter_queryset()``
+    narrows the queryset. Other actions are left untouched.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        serializer_class = getattr(view, "filter_serializer_class", None)
+        if serializer_class is None or getattr(view, "action", None) != "list":
+            return queryset
+
+        serializer = serializer_class(data=request.query_params)
+        if not serializer.is_valid():
+            raise ValidationError(serializer.errors)
+        return serializer.filter_queryset(queryset)
+
+
+class ListOrderingFilter(OrderingFilter):
+    """``?ordering=`` restricted to the view's ``ordering_fields``; list action only."""
+
+    def filter_queryset(self, request, queryset, view):
+        if getattr(view, "action", None) != "list":
+            return queryset
+        return super().filter_queryset(request, queryset, view)
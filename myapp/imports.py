@@ -0,0 +1,135 @@
+"""
+CSV onboarding imports for clients and items.
+
+Rows are read one at a time from a ``csv.DictReader`` and validated without
+touching the database (the tenant's company ids and existing keys are
+loaded up front). A row whose key (client business name, item code)
+matches one existing record updates only the columns in the header, so
+other columns keep their stored values; other rows create new records and
+must carry every required column.
+Keys are not unique in the schema, so a key shared by several existing
+records is reported on the row instead of guessing which one to update.
+Rows are written in batches with ``bulk_create`` and ``bulk_update``; a
+batch that hits an ``IntegrityError`` is retried row by row so only the
+offending rows are rejected.
+"""
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import serializers
+from rest_framework.settings import api_settings
+
+from .cache import invalidate_tenant
+from .models import Client, Company, Item
+from .serializers import ClientImportRowSerializer, ItemImportRowSerializer
+
+IMPORT_BATCH_SIZE = 1000
+
+# kind -> (model, row serializer, matching column)
+IMPORTERS = {
+    "clients": (Client, ClientImportRowSerializer, "business_name"),
+    "items": (Item, ItemImportRowSerializer, "item_code"),
+}
+
+
+def import_records(kind, user, reader, batch_size=IMPORT_BATCH_SIZE):
+    """
+    Create or update ``user``'s clients or items from the rows of
+    ``reader`` (a ``csv.DictReader``). Columns left out of the header are
+    not touched on existing rows. Returns counts plus the errors of
+    rejected rows, keyed by their line number in the file.
+    """
+    model, serializer_class, key = IMPORTERS[kind]
+    columns = [name for name in reader.fieldnames or () if name in serializer_class.Meta.fields]
+    if key not in columns:
+        raise ValueError(f"The CSV header must include '{key}'.")
+
+    update_fields = [name for name in columns if name != key]
+    if update_fields:
+        # Invoice validators include the shown client's and items' updated_at.
+        update_fields.append("updated_at")
+    context = {"company_ids": set(Company.objects.filter(user=user).values_list("id", flat=True))}
+    # One serializer validates every new row and a partial one every matched
+    # row, so their fields are only built once.
+    validator = serializer_class(context=context)
+    partial_validator = serializer_class(context=context, partial=True)
+    fields = validator.fields
+    existing = {}
+    for pk, value in model.objects.filter(user=user).values_list("pk", key):
+        existing.setdefault(value, []).append(pk)
+    matched = set()
+    seen = {}
+    report = {"created": 0, "updated": 0, "errors": []}
+    batch = []
+
+    def write(rows):
+        # Matched rows only set the header's columns; an upsert would insert
+        # the missing ones as NULL before it ever reached the conflict.
+        updates = [obj for _, obj in rows if obj.pk in matched]
+        inserts = [obj for _, obj in rows if obj.pk not in matched]
+        if updates and update_fields:
+            # bulk_update skips auto_now.
+            now = timezone.now()
+            for obj in updates:
+                obj.updated_at = now
+            model.objects.bulk_update(updates, update_fields)
+        if inserts:
+            model.objects.bulk_create(inserts)
+        report["updated"] += len(updates)
+        report["created"] += len(inserts)
+
+    def flush():
+        try:
+            with transaction.atomic():
+                write(batch)
+        except IntegrityError:
+            for line, obj in batch:
+                try:
+                    with transaction.atomic():
+                        write([(line, obj)])
+                except IntegrityError as exc:
+                    errors = {api_settings.NON_FIELD_ERRORS_KEY: [f"Could not be saved: {exc}"]}
+                    report["errors"].append({"row": line, "errors": errors})
+        invalidate_tenant(model, user.id)
+        batch.clear()
+
+    for row in reader:
+        line = reader.line_num
+        data = {
+            name: None if row[name] == "" and fields[name].allow_null else row[name]
+            for name in columns
+        }
+        try:
+            value = fields[key].run_validation(data[key])
+        except serializers.ValidationError as exc:
+            report["errors"].append({"row": line, "errors": {key: exc.detail}})
+            continue
+
+        if value in seen:
+            report["errors"].append({"row": line, "errors": {key: [f"Duplicate of row {seen[value]}."]}})
+            continue
+        seen[value] = line
+        pks = existing.get(value, ())
+        if len(pks) > 1:
+            report["errors"].append(
+                {"row": line, "errors": {key: [f"Matches {len(pks)} existing records; edit them individually."]}}
+            )
+            continue
+
+        try:
+            validated = (partial_validator if pks else validator).run_validation(data)
+        except serializers.ValidationError as exc:
+            report["errors"].append({"row": line, "errors": exc.detail})
+            continue
+
+        obj = model(user=user, **validated)
+        if pks:
+            obj.pk = pks[0]
+            matched.add(obj.pk)
+        batch.append((line, obj))
+        if len(batch) >= batch_size:
+            flush()
+
+    if batch:
+        flush()
+    report["errors"].sort(key=lambda error: error["row"])
+    return report
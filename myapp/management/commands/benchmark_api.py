@@ -0,0 +1,139 @@
+import json
+import platform
+import subprocess
+from decimal import Decimal
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import override_settings
+from rest_framework.test import APIClient
+
+from myapp.benchmarks import dataset_counts, delete_benchmark_data, measure, seed_catalogue, seed_invoices, seed_tenants
+from myapp.models import Invoice
+from myapp.utils import build_invoice_email, render_invoice_pdf_bytes
+
+# Lets build_invoice_email run without real SMTP credentials; nothing is sent.
+EMAIL_SETTINGS = {
+    "EMAIL_BACKEND": "django.core.mail.backends.locmem.EmailBackend",
+    "EMAIL_HOST_USER": "bench",
+    "EMAIL_HOST_PASSWORD": "bench",
+    "DEFAULT_FROM_EMAIL": "bench@example.com",
+}
+
+
+def succeeded(response):
+    if response.status_code >= 400:
+        raise CommandError(f"{response.request['PATH_INFO']} returned {response.status_code}: {response.content[:200]!r}")
+    return response
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a synthetic dataset and measure latency, query count and peak memory of the "
+        "API hot paths, writing a JSON report that can be diffed between commits. Writes to "
+        "the configured database; point DATABASE_URL at a scratch SQLite or PostgreSQL database. "
+        "Benchmark rows are reused between runs, so use --cleanup before changing the dataset shape."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--tenants", type=int, default=2)
+        parser.add_argument("--clients", type=int, default=5, help="Clients per tenant.")
+        parser.add_argument("--items", type=int, default=20, help="Items per tenant.")
+        parser.add_argument("--invoices", type=int, default=1000, help="Invoices in total.")
+        parser.add_argument("--lines", type=int, default=10, help="Lines per seeded invoice.")
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--output", help="Write the JSON report to this file.")
+        parser.add_argument("--baseline", help="Earlier report to compare medians against.")
+        parser.add_argument("--cleanup", action="store_true", help="Delete the benchmark tenants afterwards.")
+
+    def handle(self, *args, **options):
+        tenants = seed_tenants(options["tenants"])
+        seed_catalogue(tenants, options["clients"], options["items"])
+        users = [tenant[0] for tenant in tenants]
+        existing = Invoice.objects.filter(user__in=users).count()
+        if options["invoices"] > existing:
+            self.stdout.write(f"Seeding {options['invoices'] - existing} invoices...")
+            seed_invoices(tenants, options["invoices"] - existing, lines=options["lines"])
+
+        dataset = dataset_counts(users)
+
+        user, _, _, item = tenants[0]
+        invoice = (
+            Invoice.objects.filter(user=user, status="due")
+            .select_related("company", "client")
+            .order_by("id")
+            .first()
+        )
+        if invoice is None:
+            raise CommandError("The dataset has no due invoice to benchmark against; seed more invoices.")
+        api = APIClient()
+        api.force_authenticate(user)
+
+        scenarios = {
+            "invoice_list": lambda: succeeded(api.get("/api/invoices/")),
+            "invoice_list_expanded": lambda: succeeded(api.get("/api/invoices/", {"expand": "invoice_items"})),
+            "invoice_detail": lambda: succeeded(api.get(f"/api/invoices/{invoice.id}/")),
+            "line_create": lambda: succeeded(
+                api.post(
+                    "/api/invoice-items/",
+                    {"invoice": invoice.id, "item": item.id, "quantity": 1, "price": "1.00", "gst_rate": "18.00"},
+                )
+            ),
+            "payment_post": lambda: succeeded(
+                api.post(f"/api/invoices/{invoice.id}/payments/", {"amount": "0.01", "payment_method": "online"})
+            ),
+            "pdf_render": lambda: render_invoice_pdf_bytes(invoice),
+            "email_prepare": lambda: build_invoice_email(invoice, pdf_bytes=b"%PDF-bench"),
+        }
+
+        results = {}
+        # Writes made by the scenarios are rolled back so every run sees the same data.
+        with transaction.atomic(), override_settings(**EMAIL_SETTINGS):
+            for name, scenario in scenarios.items():
+                results[name] = measure(scenario, options["repeat"])
+                self.stdout.write(
+                    f"{name}: {results[name]['median_ms']} ms, {results[name]['queries']} queries, "
+                    f"{results[name]['peak_kib']} KiB"
+                )
+            transaction.set_rollback(True)
+
+        report = {
+            "meta": {
+                "git_revision": git_revision(),
+                "database": connection.vendor,
+                "python": platform.python_version(),
+                "django": django.get_version(),
+                "dataset": dataset,
+                "repeat": options["repeat"],
+            },
+            "scenarios": results,
+        }
+
+        if options["baseline"]:
+            with open(options["baseline"]) as handle:
+                baseline = json.load(handle)["scenarios"]
+            for name, row in results.items():
+                if name in baseline and baseline[name]["median_ms"]:
+                    before = Decimal(str(baseline[name]["median_ms"]))
+                    change = (Decimal(str(row["median_ms"])) - before) / before * 100
+                    self.stdout.write(
+                        f"{name}: {change:+.1f}% time, "
+                        f"{row['queries'] - baseline[name]['queries']:+d} queries vs baseline"
+                    )
+
+        if options["output"]:
+            with open(options["output"], "w") as handle:
+                json.dump(report, handle, indent=2, sort_keys=True)
+
+        if options["cleanup"]:
+            delete_benchmark_data()
@@ -0,0 +1,77 @@
+import json
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from myapp.benchmarks import delete_benchmark_data, seed_invoices, seed_tenants, time_call
+from myapp.models import Invoice, Payment
+
+
+def tenant_queries(user):
+    """The tenant-scoped lookups the composite indexes are meant to serve."""
+    invoices = Invoice.objects.filter(user=user)
+    return {
+        "list_page": invoices.order_by("-id")[:50],
+        "unpaid": invoices.filter(payment_status="pending").order_by("-id")[:50],
+        "due_status": invoices.filter(status="due").order_by("-id")[:50],
+        "date_range": invoices.filter(
+            invoice_date__gte=date(2021, 3, 1), invoice_date__lte=date(2021, 3, 31)
+        )[:50],
+        "invoice_no_prefix": Invoice.objects.filter(invoice_no__startswith="B0-BENCH-0000")[:50],
+        "payments_for_invoice": Payment.objects.filter(
+            invoice=invoices.order_by("id").values("id")[:1]
+        ).order_by("-created_at"),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed synthetic invoices in growing steps and time tenant-scoped queries at each "
+        "size to check that latency stays flat. Writes to the configured database; "
+        "point DATABASE_URL at a scratch database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", default="10000,100000,1000000", help="Comma-separated invoice totals to measure at.")
+        parser.add_argument("--tenants", type=int, default=100)
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--explain", action="store_true", help="Print the query plan of each query at the end.")
+        parser.add_argument("--cleanup", action="store_true", help="Delete the benchmark tenants afterwards.")
+        parser.add_argument("--output", help="Write the results as JSON to this file.")
+
+    def handle(self, *args, **options):
+        try:
+            sizes = sorted(int(size) for size in options["sizes"].split(","))
+        except ValueError:
+            raise CommandError("--sizes must be a comma-separated list of integers.")
+
+        tenants = seed_tenants(options["tenants"])
+        user = tenants[0][0]
+        results = []
+        seeded = Invoice.objects.filter(user__in=[tenant[0] for tenant in tenants]).count()
+
+        for size in sizes:
+            if size > seeded:
+                self.stdout.write(f"Seeding {size - seeded} invoices...")
+                seed_invoices(tenants, size - seeded)
+                seeded = size
+
+            row = {"invoices": seeded}
+            for name, queryset in tenant_queries(user).items():
+                row[name] = round(time_call(lambda: list(queryset.all()), options["repeat"]), 3)
+            results.append(row)
+            self.stdout.write(
+                ", ".join(f"{key}={value}" for key, value in row.items() if key != "invoices")
+                + f"  [{seeded} invoices, ms]"
+            )
+
+        if options["explain"]:
+            for name, queryset in tenant_queries(user).items():
+                self.stdout.write(f"\n{name}:\n{queryset.explain()}")
+
+        if options["output"]:
+            with open(options["output"], "w") as handle:
+                json.dump(results, handle, indent=2)
+
+        if options["cleanup"]:
+            delete_benchmark_data()
@@ -0,0 +1,64 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from myapp.benchmarks import measure, seed_invoices, seed_tenants
+from myapp.models import Invoice
+from myapp.pdf_templates import TEMPLATES
+from myapp.utils import render_invoice_pdf_bytes
+
+
+class Command(BaseCommand):
+    help = (
+        "Time PDF rendering per template for invoices of the given line counts. "
+        "The first render in the process (template compile) is reported separately. "
+        "Seeded rows are rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--lines", default="10,1000", help="Comma-separated line counts.")
+        parser.add_argument("--templates", default=",".join(TEMPLATES))
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--output", help="Write the results as JSON to this file.")
+
+    def handle(self, *args, **options):
+        try:
+            line_counts = [int(count) for count in options["lines"].split(",")]
+        except ValueError:
+            raise CommandError("--lines must be a comma-separated list of integers.")
+        names = options["templates"].split(",")
+        unknown = set(names) - set(TEMPLATES)
+        if unknown:
+            raise CommandError(f"Unknown templates: {', '.join(sorted(unknown))}")
+
+        results = []
+        with transaction.atomic():
+            tenants = seed_tenants(1)
+            for lines in line_counts:
+                seed_invoices(tenants, 1, lines=lines)
+                invoice = (
+                    Invoice.objects.filter(user=tenants[0][0])
+                    .select_related("company", "client")
+                    .prefetch_related("invoice_items__item")
+                    .latest("id")
+                )
+                for name in names:
+                    invoice.selected_template = name
+                    started = time.perf_counter()
+                    render_invoice_pdf_bytes(invoice)
+                    first_ms = (time.perf_counter() - started) * 1000
+
+                    row = {"template": name, "lines": lines, "first_ms": round(first_ms, 3)}
+                    row.update(measure(lambda: render_invoice_pdf_bytes(invoice), options["repeat"]))
+                    results.append(row)
+                    self.stdout.write(
+                        f"{name} x {lines} lines: first {row['first_ms']} ms, "
+                        f"median {row['median_ms']} ms, peak {row['peak_kib']} KiB"
+                    )
+            transaction.set_rollback(True)
+
+        if options["output"]:
+            with open(options["output"], "w") as handle:
+                json.dump(results, handle, indent=2)
@@ -0,0 +1,45 @@
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from myapp.recurring import RECURRING_BATCH_SIZE, generate_due_invoices
+
+
+class Command(BaseCommand):
+    help = (
+        "Create the invoices of every due recurring schedule in batches and queue "
+        "their emails. Run it daily from cron, or keep it running with --loop."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--date", help="Generate what is due by this date (YYYY-MM-DD) instead of today.")
+        parser.add_argument("--batch-size", type=int, default=RECURRING_BATCH_SIZE)
+        parser.add_argument("--no-email", action="store_true", help="Do not queue invoice emails.")
+        parser.add_argument("--loop", action="store_true", help="Keep running, checking for due schedules periodically.")
+        parser.add_argument("--poll-interval", type=float, default=3600.0, help="Seconds between checks with --loop.")
+
+    def handle(self, *args, **options):
+        try:
+            today = date.fromisoformat(options["date"]) if options["date"] else None
+        except ValueError:
+            raise CommandError("--date must be in YYYY-MM-DD format.")
+        if today and options["loop"]:
+            raise CommandError("--date cannot be combined with --loop.")
+
+        while True:
+            started = time.perf_counter()
+            report = generate_due_invoices(
+                today=today, batch_size=options["batch_size"], send_email=not options["no_email"]
+            )
+            elapsed = time.perf_counter() - started
+            if report["schedules"] or not options["loop"]:
+                self.stdout.write(
+                    self.style.SUCCESS(
+                        f"{report['invoices']} invoices from {report['schedules']} schedules in {elapsed:.2f}s; "
+                        f"{report['emails_queued']} emails queued, {report['emails_skipped']} skipped."
+                    )
+                )
+            if not options["loop"]:
+                break
+            time.sleep(options["poll_interval"])
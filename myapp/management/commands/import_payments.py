@@ -0,0 +1,47 @@
+import csv
+import json
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from myapp.models import Invoice
+from myapp.payments import import_payments, read_payment_rows
+
+
+class Command(BaseCommand):
+    help = (
+        "Post a bank statement of (invoice_no, amount, method, reference) rows as payments. "
+        "Rows whose reference was already posted to the same invoice are skipped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV file with a header row, or a JSON list of objects.")
+        parser.add_argument("--user", help="Only match invoices owned by this username.")
+        parser.add_argument("--format", choices=["csv", "json"], help="Defaults to the file extension.")
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        fmt = options["format"] or ("json" if path.lower().endswith(".json") else "csv")
+        try:
+            with open(path, "rb") as handle:
+                rows = read_payment_rows(handle, fmt)
+        except (OSError, ValueError, UnicodeDecodeError, csv.Error) as exc:
+            raise CommandError(f"Could not read {path}: {exc}")
+
+        invoices = Invoice.objects.all()
+        if options["user"]:
+            try:
+                invoices = invoices.filter(user=User.objects.get(username=options["user"]))
+            except User.DoesNotExist:
+                raise CommandError(f"Unknown user {options['user']!r}.")
+
+        report = import_payments(invoices, rows)
+        for row in report:
+            if row["status"] != "created":
+                line = f"row {row['row']} ({row['invoice_no']}): {row['status']}"
+                if row.get("errors"):
+                    line += f" {json.dumps(row['errors'])}"
+                self.stdout.write(line)
+
+        created = sum(1 for row in report if row["status"] == "created")
+        self.stdout.write(self.style.SUCCESS(f"Posted {created} of {len(report)} payments."))
@@ -0,0 +1,40 @@
+import csv
+import json
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from myapp.imports import IMPORTERS, import_records
+
+
+class Command(BaseCommand):
+    help = "Create or update a user's clients or items from a CSV file with a header row."
+
+    def add_arguments(self, parser):
+        parser.add_argument("kind", choices=sorted(IMPORTERS))
+        parser.add_argument("path")
+        parser.add_argument("--user", required=True, help="Username that will own the imported rows.")
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options["user"])
+        except User.DoesNotExist:
+            raise CommandError(f"Unknown user {options['user']!r}.")
+
+        try:
+            with open(options["path"], encoding="utf-8-sig", newline="") as handle:
+                report = import_records(
+                    options["kind"], user, csv.DictReader(handle), batch_size=options["batch_size"]
+                )
+        except (OSError, ValueError, UnicodeDecodeError, csv.Error) as exc:
+            raise CommandError(f"Could not import {options['path']}: {exc}")
+
+        for error in report["errors"]:
+            self.stdout.write(f"line {error['row']}: {json.dumps(error['errors'])}")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{report['created']} created, {report['updated']} updated, "
+                f"{len(report['errors'])} rejected."
+            )
+        )
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from myapp.balances import rebuild_all_balances
+
+
+class Command(BaseCommand):
+    help = "Recompute every client and company balance from their invoices."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        written = rebuild_all_balances(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {written} balances."))
@@ -0,0 +1,52 @@
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db.models import Prefetch
+
+from myapp.models import Invoice, InvoiceItem
+
+
+class Command(BaseCommand):
+    help = "Compare stored invoice totals with their line items and optionally repair them."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--fix", action="store_true", help="Recompute totals for mismatched invoices.")
+        parser.add_argument("--chunk-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        invoices = Invoice.objects.prefetch_related(
+            Prefetch(
+                "invoice_items",
+                queryset=InvoiceItem.objects.only("invoice_id", "quantity", "price", "gst_rate"),
+            )
+        ).order_by("id")
+
+        checked = 0
+        mismatched = 0
+        for invoice in invoices.iterator(chunk_size=options["chunk_size"]):
+            checked += 1
+            subtotal = Decimal("0")
+            gst = Decimal("0")
+            for line in invoice.invoice_items.all():
+                amount, gst_amount = line.line_totals()
+                subtotal += amount
+                gst += gst_amount
+
+            if (invoice.item_subtotal_amount, invoice.item_subtotal_gst, invoice.item_total) == (
+                subtotal,
+                gst,
+                subtotal + gst,
+            ):
+                continue
+
+            mismatched += 1
+            self.stdout.write(
+                f"{invoice.invoice_no}: stored total {invoice.item_total}, expected {subtotal + gst}"
+            )
+            if options["fix"]:
+                invoice.calculate_totals()
+
+        action = "fixed" if options["fix"] else "found"
+        self.stdout.write(
+            self.style.SUCCESS(f"Checked {checked} invoices, {action} {mismatched} mismatches.")
+        )
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from myapp.models import Invoice
+from myapp.outbox import send_invoice_emails
+from myapp.serializers import InvoiceSelectionSerializer
+
+
+class Command(BaseCommand):
+    help = "Email a filtered set of invoices over a single SMTP connection."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--company", type=int)
+        parser.add_argument("--date-from")
+        parser.add_argument("--date-to")
+        parser.add_argument("--status", choices=[choice for choice, _ in Invoice.STATUS_CHOICES])
+        parser.add_argument("--workers", type=int, default=None, help="Processes used to render PDFs.")
+
+    def handle(self, *args, **options):
+        selection = InvoiceSelectionSerializer(
+            data={
+                key: options[key]
+                for key in ("company", "date_from", "date_to", "status")
+                if options[key] is not None
+            }
+        )
+        if not selection.is_valid():
+            raise CommandError(selection.errors)
+
+        invoices = selection.filter_queryset(
+            Invoice.objects.select_related("company", "client").prefetch_related("invoice_items__item")
+        ).order_by("id")
+
+        report = send_invoice_emails(invoices, max_workers=options["workers"])
+        for row in report:
+            line = f"{row['invoice_no']}: {row['status']}"
+            if row["detail"]:
+                line += f" ({row['detail']})"
+            self.stdout.write(line)
+
+        sent = sum(1 for row in report if row["status"] == "sent")
+        self.stdout.write(self.style.SUCCESS(f"Sent {sent} of {len(report)} invoices."))
@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from myapp.outbox import process_email_outbox
+
+
+class Command(BaseCommand):
+    help = "Deliver queued invoice emails, retrying failures with backoff."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=50)
+        parser.add_argument("--poll-interval", type=float, default=5.0, help="Seconds to sleep when the queue is empty.")
+        parser.add_argument("--once", action="store_true", help="Process a single batch and exit.")
+
+    def handle(self, *args, **options):
+        while True:
+            batch = process_email_outbox(options["batch_size"])
+            sent = sum(1 for outbox in batch if outbox.status == "sent")
+            if batch:
+                self.stdout.write(f"Processed {len(batch)} emails, {sent} sent.")
+            if options["once"]:
+                break
+            if not batch:
+                time.sleep(options["poll_interval"])
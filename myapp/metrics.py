@@ -0,0 +1,100 @@
+"""
+In-process request metrics rendered in the Prometheus text format.
+
+Each worker process keeps its own registry; scrape every worker (or run a
+single one) to get complete numbers. Routes are labelled by URL name
+(e.g. ``invoice-detail``) so label cardinality stays bounded.
+"""
+import threading
+from collections import defaultdict
+
+from .cache import cache_stats
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class RouteStats:
+    def __init__(self):
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+        self.count = 0
+        self.duration = 0.0
+        self.queries = 0
+        self.db_duration = 0.0
+        self.render_duration = 0.0
+        self.response_bytes = 0
+        self.over_budget = 0
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes = defaultdict(RouteStats)
+        self._responses = defaultdict(int)
+
+    def observe(self, route, method, status_code, duration, queries, db_duration,
+                render_duration, response_bytes, over_budget):
+        with self._lock:
+            stats = self._routes[(route, method)]
+            stats.count += 1
+            stats.duration += duration
+            for index, bound in enumerate(LATENCY_BUCKETS):
+                if duration <= bound:
+                    stats.buckets[index] += 1
+            stats.queries += queries
+            stats.db_duration += db_duration
+            stats.render_duration += render_duration
+            stats.response_bytes += response_bytes
+            stats.over_budget += int(over_budget)
+            self._responses[(route, method, status_code)] += 1
+
+    def reset(self):
+        with self._lock:
+            self._routes.clear()
+            self._responses.clear()
+
+    def render(self):
+        lines = []
+
+        def family(name, kind, help_text):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        with self._lock:
+            routes = sorted(self._routes.items())
+            responses = sorted(self._responses.items())
+
+        family("http_requests_total", "counter", "Responses by route, method and status.")
+        for (route, method, status_code), count in responses:
+            lines.append(f'http_requests_total{{route="{route}",method="{method}",status="{status_code}"}} {count}')
+
+        family("http_request_duration_seconds", "histogram", "Time spent producing the response.")
+        for (route, method), stats in routes:
+            labels = f'route="{route}",method="{method}"'
+            for bound, count in zip(LATENCY_BUCKETS, stats.buckets):
+                lines.append(f'http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {count}')
+            lines.append(f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} {stats.count}')
+            lines.append(f"http_request_duration_seconds_sum{{{labels}}} {stats.duration:.6f}")
+            lines.append(f"http_request_duration_seconds_count{{{labels}}} {stats.count}")
+
+        for name, attribute, help_text in (
+            ("http_db_queries_total", "queries", "SQL statements executed."),
+            ("http_db_duration_seconds_total", "db_duration", "Time spent in SQL statements."),
+            ("http_render_duration_seconds_total", "render_duration", "Time spent serializing and rendering response bodies."),
+            ("http_response_bytes_total", "response_bytes", "Response body bytes (non-streaming responses)."),
+            ("http_query_budget_exceeded_total", "over_budget", "Requests that ran more queries than their budget."),
+        ):
+            family(name, "counter", help_text)
+            for (route, method), stats in routes:
+                value = getattr(stats, attribute)
+                value = f"{value:.6f}" if isinstance(value, float) else value
+                lines.append(f'{name}{{route="{route}",method="{method}"}} {value}')
+
+        family("tenant_cache_requests_total", "counter", "Tenant cache lookups by model and result.")
+        for model, counts in sorted(cache_stats().items()):
+            for result in ("hits", "misses"):
+                lines.append(f'tenant_cache_requests_total{{model="{model}",result="{result}"}} {counts[result]}')
+
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
@@ -0,0 +1,126 @@
+import functools
+import logging
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from rest_framework.serializers import ListSerializer
+
+from .metrics import registry
+
+logger = logging.getLogger(__name__)
+
+
+class QueryTimer:
+    """``connection.execute_wrapper`` hook counting statements and their time."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - started
+
+
+def add_render_time(request, seconds):
+    """Count ``seconds`` towards the request's ``render`` timing."""
+    request = getattr(request, "_request", request)  # unwrap DRF's Request
+    if hasattr(request, "_render_duration"):
+        request._render_duration += seconds
+
+
+@functools.cache
+def timed_serializer_class(serializer_class):
+    """
+    A subclass of ``serializer_class`` with the time spent building ``data``
+    counted as render time, also when it is instantiated with ``many=True``.
+    """
+
+    class TimedSerializer(serializer_class):
+        @property
+        def data(self):
+            started = time.perf_counter()
+            try:
+                return super().data
+            finally:
+                add_render_time(self.context.get("request"), time.perf_counter() - started)
+
+    if not issubclass(serializer_class, ListSerializer):
+        meta = getattr(serializer_class, "Meta", object)
+        list_class = getattr(meta, "list_serializer_class", ListSerializer)
+        TimedSerializer.Meta = type("Meta", (meta,), {"list_serializer_class": timed_serializer_class(list_class)})
+    TimedSerializer.__name__ = TimedSerializer.__qualname__ = serializer_class.__name__
+    return TimedSerializer
+
+
+class PerformanceMiddleware:
+    """
+    Time each request and its SQL, expose the numbers as a ``Server-Timing``
+    header and in the ``/metrics`` registry, and log requests that run more
+    queries than ``PERFORMANCE_QUERY_BUDGETS`` (by URL name) or
+    ``PERFORMANCE_QUERY_BUDGET`` allow.
+
+    ``render`` covers building ``serializer.data`` in views that use
+    ``TimedSerializationMixin`` plus rendering the response body. Work done
+    while a streaming response is consumed is not included.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timer = QueryTimer()
+        request._render_duration = 0.0
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(timer))
+            response = self.get_response(request)
+        duration = time.perf_counter() - started
+
+        match = getattr(request, "resolver_match", None)
+        route = (match.view_name or match.route) if match else "unmatched"
+        budget = settings.PERFORMANCE_QUERY_BUDGETS.get(route, settings.PERFORMANCE_QUERY_BUDGET)
+        over_budget = timer.count > budget
+        if over_budget:
+            logger.warning(
+                "Query budget exceeded on %s %s (%s): %s queries, budget %s",
+                request.method, request.path, route, timer.count, budget,
+            )
+
+        size = 0 if response.streaming else len(response.content)
+        response["Server-Timing"] = ", ".join(
+            [
+                f'db;dur={timer.duration * 1000:.1f};desc="{timer.count} queries"',
+                f"render;dur={request._render_duration * 1000:.1f}",
+                f"total;dur={duration * 1000:.1f}",
+            ]
+        )
+        registry.observe(
+            route,
+            request.method,
+            response.status_code,
+            duration,
+            timer.count,
+            timer.duration,
+            request._render_duration,
+            size,
+            over_budget,
+        )
+        return response
+
+    def process_template_response(self, request, response):
+        # Called right before DRF/Django render the body; time the rendering.
+        started = time.perf_counter()
+
+        def finished(rendered):
+            add_render_time(request, time.perf_counter() - started)
+
+        response.add_post_render_callback(finished)
+        return response
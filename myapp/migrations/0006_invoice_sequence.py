@@ -0,0 +1,31 @@
+# Generated by Django 5.2.9 on 2026-10-17 09:00
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0005_create_demo_user'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='company',
+            name='invoice_prefix',
+            field=models.CharField(default='INV', max_length=20, validators=[django.core.validators.RegexValidator('^[A-Za-z0-9]+$', 'Use letters and digits only.')]),
+        ),
+        migrations.CreateModel(
+            name='InvoiceSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('prefix', models.CharField(max_length=20)),
+                ('year', models.PositiveIntegerField()),
+                ('last_number', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('prefix', 'year'), name='unique_invoice_sequence')],
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+import re
+from django.db import migrations
+
+
+INVOICE_NO_PATTERN = re.compile(r"^(?P<prefix>.+)-(?P<year>\d{4})-(?P<number>\d+)$")
+
+
+def seed_invoice_sequences(apps, schema_editor):
+    Invoice = apps.get_model("myapp", "Invoice")
+    InvoiceSequence = apps.get_model("myapp", "InvoiceSequence")
+
+    highest = {}
+    for invoice_no in Invoice.objects.values_list("invoice_no", flat=True).iterator():
+        match = INVOICE_NO_PATTERN.match(invoice_no or "")
+        if not match:
+            continue
+        key = (match.group("prefix"), int(match.group("year")))
+        highest[key] = max(highest.get(key, 0), int(match.group("number")))
+
+    InvoiceSequence.objects.bulk_create(
+        InvoiceSequence(prefix=prefix, year=year, last_number=number)
+        for (prefix, year), number in highest.items()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("myapp", "0006_invoice_sequence"),
+    ]
+
+    operations = [
+        migrations.RunPython(seed_invoice_sequences, migrations.RunPython.noop),
+    ]
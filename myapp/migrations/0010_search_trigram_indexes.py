@@ -0,0 +1,39 @@
+from django.db import migrations
+
+
+# icontains compiles to UPPER(column::text) LIKE UPPER(%s) on PostgreSQL, so
+# the trigram indexes are built on that expression. SQLite falls back to a
+# scan and gets no index.
+TRIGRAM_INDEXES = (
+    ("invoice_no_trgm_idx", "myapp_invoice", "invoice_no"),
+    ("client_business_name_trgm_idx", "myapp_client", "business_name"),
+)
+
+
+def create_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    for name, table, column in TRIGRAM_INDEXES:
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS "{name}" ON "{table}" '
+            f'USING gin ((UPPER("{column}"::text)) gin_trgm_ops)'
+        )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for name, _, _ in TRIGRAM_INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS "{name}"')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("myapp", "0009_tenant_indexes"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.9 on 2026-10-17 12:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0010_search_trigram_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClientBalance',
+            fields=[
+                ('invoice_count', models.PositiveIntegerField(default=0)),
+                ('invoiced_total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('paid_total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('outstanding', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('client', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='balance', serialize=False, to='myapp.client')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='CompanyBalance',
+            fields=[
+                ('invoice_count', models.PositiveIntegerField(default=0)),
+                ('invoiced_total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('paid_total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('outstanding', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('company', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='balance', serialize=False, to='myapp.company')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+    ]
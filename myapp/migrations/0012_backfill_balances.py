@@ -0,0 +1,45 @@
+from django.db import migrations
+from django.db.models import Count, Sum
+
+
+BALANCE_FIELDS = ("invoice_count", "invoiced_total", "paid_total", "outstanding")
+
+
+def backfill_balances(apps, schema_editor):
+    Invoice = apps.get_model("myapp", "Invoice")
+    ledgers = (
+        (apps.get_model("myapp", "ClientBalance"), apps.get_model("myapp", "Client"), "client"),
+        (apps.get_model("myapp", "CompanyBalance"), apps.get_model("myapp", "Company"), "company"),
+    )
+    for Balance, Owner, owner_field in ledgers:
+        totals = {
+            row.pop(f"{owner_field}_id"): row
+            for row in Invoice.objects.exclude(status="cancelled")
+            .order_by()
+            .values(f"{owner_field}_id")
+            .annotate(
+                invoice_count=Count("id"),
+                invoiced_total=Sum("item_total"),
+                paid_total=Sum("total_paid_amount"),
+                outstanding=Sum("remaining_amount"),
+            )
+        }
+        empty = dict.fromkeys(BALANCE_FIELDS, 0)
+        Balance.objects.bulk_create(
+            [
+                Balance(pk=owner_id, **totals.get(owner_id, empty))
+                for owner_id in Owner.objects.values_list("id", flat=True).iterator()
+            ],
+            batch_size=1000,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("myapp", "0011_client_company_balances"),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_balances, migrations.RunPython.noop),
+    ]
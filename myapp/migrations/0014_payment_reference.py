@@ -0,0 +1,18 @@
+# Generated by Django 5.2.9 on 2026-10-17 14:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0013_payment_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='payment',
+            name='reference',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+    ]
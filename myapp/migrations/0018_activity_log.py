@@ -0,0 +1,23 @@
+# Generated by Django 5.2.9 on 2026-10-17 18:00
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0017_recurring_invoices'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='activity',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddIndex(
+            model_name='activity',
+            index=models.Index(fields=['invoice', 'id'], name='activity_invoice_id_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.9 on 2026-10-17 20:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0019_related_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='payment',
+            name='balance_after',
+            field=models.JSONField(blank=True, editable=False, null=True),
+        ),
+    ]
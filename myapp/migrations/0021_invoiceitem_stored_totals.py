@@ -0,0 +1,47 @@
+# Generated by Django 5.2.9 on 2026-10-17 21:00
+
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db import migrations, models
+
+CENTS = Decimal("0.01")
+
+
+def line_totals(quantity, price, gst_rate):
+    # Frozen copy of myapp.models.line_totals as of this migration.
+    amount = (Decimal(quantity) * Decimal(price)).quantize(CENTS, rounding=ROUND_HALF_UP)
+    gst = (amount * Decimal(gst_rate) / 100).quantize(CENTS, rounding=ROUND_HALF_UP)
+    return amount, gst
+
+
+def store_line_totals(apps, schema_editor):
+    InvoiceItem = apps.get_model("myapp", "InvoiceItem")
+    batch = []
+    for line in InvoiceItem.objects.only("quantity", "price", "gst_rate").iterator(chunk_size=2000):
+        line.line_amount, line.line_gst = line_totals(line.quantity, line.price, line.gst_rate)
+        batch.append(line)
+        if len(batch) == 2000:
+            InvoiceItem.objects.bulk_update(batch, ["line_amount", "line_gst"])
+            batch = []
+    InvoiceItem.objects.bulk_update(batch, ["line_amount", "line_gst"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0020_payment_balance_after'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoiceitem',
+            name='line_amount',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='invoiceitem',
+            name='line_gst',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.RunPython(store_line_totals, migrations.RunPython.noop),
+    ]
@@ -1,8 +1,22 @@
-from django.db import models
+import calendar
+from datetime import timedelta
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db import IntegrityError, connection, models, transaction
 from django.utils import timezone
 from django.contrib.auth.models import User
+from django.core.validators import RegexValidator
+
+
+
+
+CENTS = Decimal('0.01')
 
 
+def line_totals(quantity, price, gst_rate):
+    amount = (Decimal(quantity) * Decimal(price)).quantize(CENTS, rounding=ROUND_HALF_UP)
+    gst = (amount * Decimal(gst_rate) / 100).quantize(CENTS, rounding=ROUND_HALF_UP)
+    return amount, gst
 
 
 class Company(models.Model):
@@ -21,11 +35,72 @@ class Company(models.Model):
 
     stamp = models.ImageField(upload_to='stamps/', blank=True, null=True)
     signature = models.ImageField(upload_to='signatures/', blank=True, null=True)
+    invoice_prefix = models.CharField(
+        max_length=20,
+        default='INV',
+        validators=[RegexValidator(r'^[A-Za-z0-9]+$', 'Use letters and digits only.')],
+    )
+    # Part of the ETag/Last-Modified of invoices showing this company.
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.business_name
 
 
+class InvoiceSequence(models.Model):
+    """
+    Counter row per (prefix, year) handing out invoice numbers.
+
+    Numbers are reserved with a single ``UPDATE ... RETURNING`` so the row
+    lock serialises concurrent creates and nothing scans ``Invoice``.
+    """
+    prefix = models.CharField(max_length=20)
+    year = models.PositiveIntegerField()
+    last_number = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['prefix', 'year'], name='unique_invoice_sequence'),
+        ]
+
+    def __str__(self):
+        return f"{self.prefix}-{self.year} ({self.last_number})"
+
+    @staticmethod
+    def format_number(prefix, year, number):
+        return f"{prefix}-{year}-{str(number).zfill(4)}"
+
+    @classmethod
+    def allocate(cls, prefix, year, count=1):
+        """Reserve ``count`` consecutive numbers and return the first one."""
+        sql = (
+            f"UPDATE {cls._meta.db_table} SET last_number = last_number + %s "
+            "WHERE prefix = %s AND year = %s RETURNING last_number"
+        )
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute(sql, [count, prefix, year])
+                row = cursor.fetchone()
+            if row is None:
+                try:
+                    with transaction.atomic():
+                        cls.objects.create(prefix=prefix, year=year, last_number=count)
+                    return 1
+                except IntegrityError:
+                    # Another request created the row first; take the next block.
+                    with connection.cursor() as cursor:
+                        cursor.execute(sql, [count, prefix, year])
+                        row = cursor.fetchone()
+            return row[0] - count + 1
+
+    @classmethod
+    def reserve_numbers(cls, prefix, count, year=None):
+        """Pre-allocate a block of invoice numbers, e.g. for bulk imports."""
+        year = year or timezone.now().year
+        first = cls.allocate(prefix, year, count)
+        return [cls.format_number(prefix, year, number) for number in range(first, first + count)]
+
+
 class Client(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     company = models.ForeignKey(
@@ -45,6 +120,7 @@ class Client(models.Model):
     city = models.CharField(max_length=50)
     pincode = models.CharField(max_length=10)
     address = models.TextField(blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.business_name
@@ -59,6 +135,7 @@ class Item(models.Model):
     gst_rate = models.DecimalField(max_digits=5, decimal_places=2)
     quantity = models.PositiveIntegerField()
     price = models.DecimalField(max_digits=10, decimal_places=2)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def amount(self):
         return self.quantity * self.price
@@ -105,22 +182,27 @@ class Invoice(models.Model):
     total_paid_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
     remaining_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
     payment_status = models.CharField(max_length=20, choices=PAYMENT_STATUS_CHOICES, default='pending')
+    # Bumped by every write to the invoice, its lines and its payments.
+    # ETag/Last-Modified also take the shown company, client and items'
+    # own updated_at, so renaming those never rewrites invoices.
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Tenant-scoped list pages (cursor pagination seeks on id).
+            models.Index(fields=['user', 'id'], name='invoice_user_id_idx'),
+            models.Index(fields=['user', 'invoice_date'], name='invoice_user_date_idx'),
+            models.Index(fields=['user', 'status'], name='invoice_user_status_idx'),
+            models.Index(fields=['user', 'payment_status'], name='invoice_user_paystatus_idx'),
+            models.Index(fields=['user', 'updated_at'], name='invoice_user_updated_idx'),
+            # LIKE 'prefix%' lookups; opclasses only take effect on PostgreSQL.
+            models.Index(fields=['invoice_no'], name='invoice_no_prefix_idx', opclasses=['varchar_pattern_ops']),
+        ]
 
     def save(self, *args, **kwargs):
         # Auto generate invoice number
         if not self.invoice_no:
-            year = timezone.now().year
-            last_invoice = Invoice.objects.filter(
-                invoice_no__startswith=f"INV-{year}"
-            ).order_by('id').last()
-
-            if last_invoice:
-                last_number = int(last_invoice.invoice_no.split('-')[-1])
-                new_number = last_number + 1
-            else:
-                new_number = 1
-
-            self.invoice_no = f"INV-{year}-{str(new_number).zfill(4)}"
+            self.invoice_no = InvoiceSequence.reserve_numbers(self.company.invoice_prefix, 1)[0]
 
         # Lock invoice if paid or cancelled
         if self.status in ['paid', 'cancelled']:
@@ -139,15 +221,18 @@ class Invoice(models.Model):
         else:
             self.payment_status = 'paid'
 
-        super().save(*args, **kwargs)
+        # Balance ledgers are refreshed from post_save; keep them in the same transaction.
+        with transaction.atomic():
+            super().save(*args, **kwargs)
 
     def calculate_totals(self):
-        subtotal = 0
-        gst = 0
+        subtotal = Decimal('0')
+        gst = Decimal('0')
 
         for item in self.invoice_items.all():
-            subtotal += item.amount()
-            gst += item.gst_amount()
+            amount, gst_amount = item.line_totals()
+            subtotal += amount
+            gst += gst_amount
 
         self.item_subtotal_amount = subtotal
         self.item_subtotal_gst = gst
@@ -160,15 +245,25 @@ class Invoice(models.Model):
         else:
             self.payment_status = 'paid'
 
-        super().save(
-            update_fields=[
-                'item_subtotal_amount',
-                'item_subtotal_gst',
-                'item_total',
-                'remaining_amount',
-                'payment_status',
-            ]
-        )
+        with transaction.atomic():
+            super().save(
+                update_fields=[
+                    'item_subtotal_amount',
+                    'item_subtotal_gst',
+                    'item_total',
+                    'remaining_amount',
+                    'payment_status',
+                    'updated_at',
+                ]
+            )
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Lets the activity log notice when a save locks the invoice.
+        instance._saved_locked = instance.__dict__.get('is_locked')
+        return instance
+
     def __str__(self):
         return self.invoice_no
 
@@ -183,7 +278,15 @@ class Activity(models.Model):
     )
 
     event = models.CharField(max_length=150)
-    created_at = models.DateTimeField(auto_now_add=True)
+    # Set when the event happens; buffered events are written later.
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['invoice', 'created_at'], name='activity_invoice_created_idx'),
+            # Cursor pages of one invoice's log seek on id.
+            models.Index(fields=['invoice', 'id'], name='activity_invoice_id_idx'),
+        ]
 
     def __str__(self):
         return f"{self.invoice.invoice_no} - {self.event}"
@@ -204,6 +307,9 @@ class InvoiceItem(models.Model):
     quantity = models.PositiveIntegerField()
     price = models.DecimalField(max_digits=10, decimal_places=2)
     gst_rate = models.DecimalField(max_digits=5, decimal_places=2)
+    # line_totals() as stored, so reports sum exactly what invoices summed.
+    line_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    line_gst = models.DecimalField(max_digits=12, decimal_places=2, default=0)
 
     def amount(self):
         return self.quantity * self.price
@@ -214,6 +320,31 @@ class InvoiceItem(models.Model):
     def total_amount(self):
         return self.amount() + self.gst_amount()
 
+    def line_totals(self):
+        """Amount and GST rounded to cents, as they are summed into the invoice."""
+        return line_totals(self.quantity, self.price, self.gst_rate)
+
+    def store_line_totals(self):
+        """Copy line_totals() onto the stored columns and return them; bulk_create callers must call it."""
+        self.line_amount, self.line_gst = self.line_totals()
+        return self.line_amount, self.line_gst
+
+    def save(self, *args, **kwargs):
+        self.store_line_totals()
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'line_amount', 'line_gst'}
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember what this line contributed to its invoice so a later save
+        # or delete can apply just the difference. Lines loaded without these
+        # columns are read back in pre_save/pre_delete instead.
+        if all(name in field_names for name in ('invoice_id', 'line_amount', 'line_gst')):
+            instance._saved_line = (instance.invoice_id, instance.line_amount, instance.line_gst)
+        return instance
+
     def __str__(self):
         return f"{self.invoice.invoice_no} - {self.item.item_name}"
 
@@ -232,7 +363,157 @@ class Payment(models.Model):
     amount = models.DecimalField(max_digits=12, decimal_places=2)
     payment_method = models.CharField(max_length=20, choices=PAYMENT_METHOD_CHOICES)
     created_at = models.DateTimeField(auto_now_add=True)
+    idempotency_key = models.CharField(max_length=100, blank=True, null=True)
+    reference = models.CharField(max_length=100, blank=True, default='')
+    # Invoice totals right after a payment made with an idempotency key, so a
+    # retry replays the original response.
+    balance_after = models.JSONField(null=True, blank=True, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['invoice', 'created_at'], name='payment_invoice_created_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['invoice', 'idempotency_key'],
+                name='unique_payment_idempotency_key',
+            ),
+        ]
 
     def __str__(self):
         return f"{self.invoice.invoice_no} - {self.amount}"
-    
+
+
+def add_months(value, months, day):
+    """``value`` moved by ``months``, on ``day`` or the last day of a shorter month."""
+    month_index = value.year * 12 + value.month - 1 + months
+    year, month = divmod(month_index, 12)
+    month += 1
+    return value.replace(year=year, month=month, day=min(day, calendar.monthrange(year, month)[1]))
+
+
+class RecurringInvoice(models.Model):
+    """
+    Schedule that bills a client the same lines every interval. Due
+    schedules are turned into invoices in batches by the
+    ``generate_recurring_invoices`` command.
+    """
+    INTERVAL_CHOICES = (
+        ('weekly', 'Weekly'),
+        ('monthly', 'Monthly'),
+        ('quarterly', 'Quarterly'),
+        ('yearly', 'Yearly'),
+    )
+    INTERVAL_MONTHS = {'monthly': 1, 'quarterly': 3, 'yearly': 12}
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name='recurring_invoices')
+    client = models.ForeignKey(Client, on_delete=models.CASCADE, related_name='recurring_invoices')
+
+    selected_template = models.CharField(max_length=50, default='classic')
+    invoice_title = models.CharField(max_length=100, default='Invoice')
+    interval = models.CharField(max_length=20, choices=INTERVAL_CHOICES, default='monthly')
+    start_date = models.DateField()
+    next_run_date = models.DateField()
+    end_date = models.DateField(blank=True, null=True)
+    is_active = models.BooleanField(default=True)
+    send_email = models.BooleanField(default=False)
+    last_run_at = models.DateTimeField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['is_active', 'next_run_date'], name='recurring_due_idx'),
+            models.Index(fields=['user', 'id'], name='recurring_user_id_idx'),
+        ]
+
+    def following_run_date(self, run_date):
+        """The run after ``run_date``; monthly schedules keep the start date's day."""
+        if self.interval == 'weekly':
+            return run_date + timedelta(weeks=1)
+        return add_months(run_date, self.INTERVAL_MONTHS[self.interval], self.start_date.day)
+
+    def __str__(self):
+        return f"{self.client} - {self.interval} from {self.start_date}"
+
+
+class RecurringInvoiceLine(models.Model):
+    """Template line; an empty price or GST rate takes the item's value at generation time."""
+    schedule = models.ForeignKey(RecurringInvoice, on_delete=models.CASCADE, related_name='lines')
+    item = models.ForeignKey(Item, on_delete=models.PROTECT)
+    quantity = models.PositiveIntegerField()
+    price = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True)
+    gst_rate = models.DecimalField(max_digits=5, decimal_places=2, blank=True, null=True)
+
+    def __str__(self):
+        return f"{self.schedule} - {self.item}"
+
+
+class InvoiceEmail(models.Model):
+    """
+    Outbox row for an invoice email. Requests enqueue these and return
+    immediately; the ``send_queued_emails`` worker delivers them with retries.
+    """
+    STATUS_CHOICES = (
+        ('queued', 'Queued'),
+        ('sending', 'Sending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    )
+
+    invoice = models.ForeignKey(
+        Invoice,
+        on_delete=models.CASCADE,
+        related_name='emails'
+    )
+    to_email = models.EmailField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True, default='')
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='invoice_email_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.invoice.invoice_no} -> {self.to_email} ({self.status})"
+
+
+class Balance(models.Model):
+    """Running totals over the non-cancelled invoices of one owner."""
+    invoice_count = models.PositiveIntegerField(default=0)
+    invoiced_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    paid_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    outstanding = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        abstract = True
+
+
+class ClientBalance(Balance):
+    client = models.OneToOneField(
+        Client,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='balance'
+    )
+
+    def __str__(self):
+        return f"{self.client} - {self.outstanding}"
+
+
+class CompanyBalance(Balance):
+    company = models.OneToOneField(
+        Company,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='balance'
+    )
+
+    def __str__(self):
+        return f"{self.company} - {self.outstanding}"
@@ -0,0 +1,172 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import get_connection
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .activity import flush_activities, invoice_email_sent
+from .models import Invoice, InvoiceEmail
+from .utils import build_invoice_email, check_invoice_email, iter_invoice_pdfs
+
+logger = logging.getLogger(__name__)
+
+# How long a claimed row stays reserved before another worker may retry it.
+SENDING_LEASE = timedelta(minutes=10)
+
+
+def enqueue_invoice_email(invoice):
+    """Validate the email can be sent and queue it; raises ValueError like check_invoice_email."""
+    to_email = check_invoice_email(invoice)
+    return InvoiceEmail.objects.create(invoice=invoice, to_email=to_email)
+
+
+def enqueue_invoice_emails(invoices):
+    """
+    Queue one email per invoice with a single insert. Returns a per-invoice
+    report; invoices that cannot be emailed are reported as skipped.
+    """
+    report = []
+    rows = []
+    for invoice in invoices:
+        try:
+            to_email = check_invoice_email(invoice)
+        except ValueError as exc:
+            report.append(_report_row(invoice, "skipped", str(exc)))
+            continue
+        rows.append(InvoiceEmail(invoice=invoice, to_email=to_email))
+
+    for outbox in InvoiceEmail.objects.bulk_create(rows):
+        report.append(_report_row(outbox.invoice, "queued", email_id=outbox.id))
+    return report
+
+
+def send_invoice_emails(invoices, max_workers=None):
+    """
+    Send invoice emails right away over one SMTP session, rendering the PDFs
+    in parallel. Returns a per-invoice report.
+    """
+    report = []
+    sendable = []
+    for invoice in invoices:
+        try:
+            check_invoice_email(invoice)
+        except ValueError as exc:
+            report.append(_report_row(invoice, "skipped", str(exc)))
+            continue
+        sendable.append(invoice)
+
+    if not sendable:
+        return report
+
+    connection = get_connection(fail_silently=False)
+    try:
+        connection.open()
+    except Exception as exc:
+        logger.exception("Failed to open email connection")
+        return report + [_report_row(invoice, "failed", str(exc)) for invoice in sendable]
+
+    try:
+        for invoice, pdf_bytes in iter_invoice_pdfs(sendable, max_workers=max_workers):
+            try:
+                message = build_invoice_email(invoice, connection=connection, pdf_bytes=pdf_bytes)
+                connection.send_messages([message])
+            except Exception as exc:
+                logger.exception("Failed to send invoice email for invoice_id=%s", invoice.id)
+                report.append(_report_row(invoice, "failed", str(exc)))
+            else:
+                report.append(_report_row(invoice, "sent"))
+                invoice_email_sent.send(sender=Invoice, invoice_id=invoice.id, to_email=message.to[0])
+    finally:
+        connection.close()
+        flush_activities()
+    return report
+
+
+def _report_row(invoice, status, detail="", email_id=None):
+    row = {"invoice_id": invoice.id, "invoice_no": invoice.invoice_no, "status": status, "detail": detail}
+    if email_id is not None:
+        row["email_id"] = email_id
+    return row
+
+
+def retry_delay(attempts):
+    base = settings.INVOICE_EMAIL_RETRY_BASE_SECONDS
+    return timedelta(seconds=min(base * 2 ** (attempts - 1), 3600))
+
+
+def claim_due_emails(batch_size, now=None):
+    """
+    Reserve up to ``batch_size`` due rows for this worker. Rows locked by
+    another worker are skipped rather than waited on.
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        ids = list(
+            InvoiceEmail.objects.select_for_update(skip_locked=True)
+            .filter(status__in=["queued", "sending"], next_attempt_at__lte=now)
+            .order_by("next_attempt_at")
+            .values_list("id", flat=True)[:batch_size]
+        )
+        InvoiceEmail.objects.filter(id__in=ids).update(
+            status="sending",
+            attempts=F("attempts") + 1,
+            next_attempt_at=now + SENDING_LEASE,
+        )
+    return list(
+        InvoiceEmail.objects.filter(id__in=ids)
+        .select_related("invoice__company", "invoice__client")
+        .prefetch_related("invoice__invoice_items__item")
+        .order_by("id")
+    )
+
+
+def record_delivery(outbox, error=None):
+    now = timezone.now()
+    if error is None:
+        outbox.status = "sent"
+        outbox.sent_at = now
+        outbox.last_error = ""
+    elif outbox.attempts >= settings.INVOICE_EMAIL_MAX_ATTEMPTS:
+        outbox.status = "failed"
+        outbox.last_error = str(error)
+    else:
+        outbox.status = "queued"
+        outbox.last_error = str(error)
+        outbox.next_attempt_at = now + retry_delay(outbox.attempts)
+    outbox.save(update_fields=["status", "sent_at", "last_error", "next_attempt_at"])
+
+
+def process_email_outbox(batch_size=50):
+    """Send one batch of due emails; returns the processed outbox rows."""
+    batch = claim_due_emails(batch_size)
+    if not batch:
+        return batch
+
+    # One SMTP session for the whole batch instead of one per message.
+    connection = get_connection(fail_silently=False)
+    try:
+        connection.open()
+    except Exception as exc:
+        logger.exception("Failed to open email connection")
+        for outbox in batch:
+            record_delivery(outbox, error=exc)
+        return batch
+
+    try:
+        for outbox in batch:
+            try:
+                message = build_invoice_email(outbox.invoice, to_email=outbox.to_email, connection=connection)
+                connection.send_messages([message])
+            except Exception as exc:
+                logger.exception("Failed to send invoice email outbox_id=%s", outbox.id)
+                record_delivery(outbox, error=exc)
+            else:
+                record_delivery(outbox)
+                invoice_email_sent.send(sender=Invoice, invoice_id=outbox.invoice_id, to_email=outbox.to_email)
+    finally:
+        connection.close()
+        flush_activities()
+    return batch
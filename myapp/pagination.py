@@ -0,0 +1,22 @@
+from rest_framework.pagination import CursorPagination
+
+
+class IdCursorPagination(CursorPagination):
+    """
+    Keyset pagination over the primary key, newest first.
+
+    Seeking on ``id`` keeps every page an index range scan no matter how
+    deep the client pages, unlike OFFSET-based pagination.
+    """
+
+    ordering = "-id"
+    page_size = 50
+    page_size_query_param = "page_size"
+    max_page_size = 200
+
+
+class FixedIdCursorPagination(IdCursorPagination):
+    """``IdCursorPagination`` that ignores the view's ordering filter."""
+
+    def get_ordering(self, request, queryset, view):
+        return (self.ordering,)
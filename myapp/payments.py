@@ -0,0 +1,268 @@
+import csv
+import io
+import json
+from decimal import Decimal
+from itertools import islice
+
+from django.db import IntegrityError, transaction
+from django.db.models import Case, DecimalField, F, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.db.models.lookups import LessThan, LessThanOrEqual
+from django.utils import timezone
+
+from .activity import payment_event, record_activity
+from .balances import LEDGERS, apply_balance_delta, shift_balances
+from .models import Invoice, Payment
+from .serializers import PaymentImportRowSerializer
+
+IMPORT_FIELDS = ("invoice_no", "amount", "method", "reference")
+
+
+IDEMPOTENCY_KEY_MAX_LENGTH = Payment._meta.get_field("idempotency_key").max_length
+
+
+class IdempotencyConflict(ValueError):
+    """An idempotency key was reused for a different payment."""
+
+
+def record_payment(invoice, amount, payment_method, idempotency_key=None, reference=""):
+    """
+    Record a payment against ``invoice`` and return ``(payment, created)``.
+
+    The invoice row is locked and its paid total is bumped with a conditional
+    ``F()`` update, so concurrent payments can neither overpay nor lose an
+    update. A repeated ``idempotency_key`` returns the original payment,
+    whose ``balance_after`` holds the totals it produced, instead of
+    creating another. Raises ValueError when the amount exceeds the
+    remaining balance or the key is too long.
+    """
+    if idempotency_key and len(idempotency_key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+        raise ValueError(f"Idempotency-Key must be at most {IDEMPOTENCY_KEY_MAX_LENGTH} characters.")
+    try:
+        payment = _record_payment(invoice, amount, payment_method, idempotency_key, reference)
+    except IntegrityError:
+        # A concurrent request with the same key committed first.
+        if not idempotency_key:
+            raise
+        payment = None
+
+    if payment is None:
+        payment = Payment.objects.get(invoice=invoice, idempotency_key=idempotency_key)
+        if (payment.amount, payment.payment_method) != (amount, payment_method):
+            raise IdempotencyConflict("This Idempotency-Key was already used for a different payment.")
+        created = False
+    else:
+        created = True
+
+    invoice.refresh_from_db(fields=["total_paid_amount", "remaining_amount", "payment_status"])
+    return payment, created
+
+
+def _record_payment(invoice, amount, payment_method, idempotency_key, reference):
+    with transaction.atomic():
+        locked = (
+            Invoice.objects.select_for_update()
+            .only("id", "client_id", "company_id", "item_total", "total_paid_amount", "remaining_amount")
+            .get(pk=invoice.pk)
+        )
+        if idempotency_key and Payment.objects.filter(
+            invoice=locked, idempotency_key=idempotency_key
+        ).exists():
+            return None
+
+        updated = Invoice.objects.filter(
+            pk=locked.pk,
+            total_paid_amount__lte=F("item_total") - amount,
+        ).update(
+            total_paid_amount=F("total_paid_amount") + amount,
+            remaining_amount=F("remaining_amount") - amount,
+            updated_at=timezone.now(),
+            # Right-hand side columns still hold the pre-update values.
+            payment_status=Case(
+                When(item_total__gt=F("total_paid_amount") + amount, then=Value("partially_paid")),
+                default=Value("paid"),
+            ),
+        )
+        if not updated:
+            raise ValueError("Payment amount cannot exceed remaining balance")
+
+        balance_after = None
+        if idempotency_key:
+            # The locked row is what the update above started from.
+            balance_after = {
+                "total_paid_amount": str(locked.total_paid_amount + amount),
+                "remaining_amount": str(locked.remaining_amount - amount),
+                "payment_status": "partially_paid" if locked.item_total > locked.total_paid_amount + amount else "paid",
+            }
+        payment = Payment.objects.create(
+            invoice=locked,
+            amount=amount,
+            payment_method=payment_method,
+            idempotency_key=idempotency_key or None,
+            reference=reference,
+            balance_after=balance_after,
+        )
+        apply_balance_delta(locked.pk, paid=amount)
+    return payment
+
+
+def remove_payment(payment):
+    """
+    Take a deleted ``payment`` back out of its invoice: the paid totals are
+    recomputed from the remaining payments, which also bumps ``updated_at``,
+    and the ledgers are shifted by its amount.
+    """
+    with transaction.atomic():
+        _sync_paid_totals([payment.invoice_id])
+        apply_balance_delta(payment.invoice_id, paid=-payment.amount)
+
+
+def read_payment_rows(stream, fmt="csv", limit=None):
+    """
+    Parse an uploaded statement (a binary file) into a list of row dicts.
+    CSV needs a header row naming the ``IMPORT_FIELDS``; JSON must be a
+    list of objects. Raises ValueError when there are more than ``limit``
+    rows; CSV is read row by row and stops there.
+    """
+    if fmt == "json":
+        rows = json.loads(stream.read().decode("utf-8-sig"))
+        if not isinstance(rows, list):
+            raise ValueError("Expected a JSON list of payment rows.")
+    else:
+        reader = csv.DictReader(io.TextIOWrapper(stream, encoding="utf-8-sig", newline=""))
+        rows = list(reader if limit is None else islice(reader, limit + 1))
+    if limit is not None and len(rows) > limit:
+        raise ValueError(f"At most {limit} rows can be imported at once.")
+    return rows
+
+
+def import_payments(invoices, rows):
+    """
+    Post a batch of statement rows against ``invoices`` (a tenant-scoped
+    queryset) and return a per-row report.
+
+    Invoices are resolved with one lookup and locked for the batch. Each row
+    is checked against the balance left after the rows before it, valid rows
+    are inserted with one ``bulk_create`` and the paid totals of every
+    touched invoice are rewritten by a single UPDATE. A row whose non-empty
+    ``reference`` was already posted to the same invoice is reported as a
+    duplicate, so re-importing a statement is harmless.
+    """
+    report = []
+    valid = []
+    for index, row in enumerate(rows, start=1):
+        serializer = PaymentImportRowSerializer(data=row if isinstance(row, dict) else {})
+        if serializer.is_valid():
+            valid.append((index, serializer.validated_data))
+            report.append(None)
+        else:
+            report.append(_import_row(index, row, "error", errors=serializer.errors))
+
+    with transaction.atomic():
+        by_number = (
+            invoices.select_for_update()
+            .only("id", "invoice_no", "status", "client_id", "company_id", "item_total", "total_paid_amount")
+            .in_bulk({data["invoice_no"] for _, data in valid}, field_name="invoice_no")
+        )
+        seen = set(
+            Payment.objects.filter(invoice__in=[invoice.pk for invoice in by_number.values()])
+            .exclude(reference="")
+            .values_list("invoice_id", "reference")
+        )
+        remaining = {
+            invoice.pk: invoice.item_total - invoice.total_paid_amount for invoice in by_number.values()
+        }
+
+        payments = []
+        for index, data in valid:
+            invoice = by_number.get(data["invoice_no"])
+            if invoice is None:
+                report[index - 1] = _import_row(index, data, "error", errors={"invoice_no": ["Invoice not found."]})
+                continue
+            key = (invoice.pk, data["reference"])
+            if data["reference"] and key in seen:
+                report[index - 1] = _import_row(index, data, "duplicate")
+                continue
+            if data["amount"] > remaining[invoice.pk]:
+                report[index - 1] = _import_row(
+                    index, data, "error", errors={"amount": ["Payment amount cannot exceed remaining balance"]}
+                )
+                continue
+
+            remaining[invoice.pk] -= data["amount"]
+            seen.add(key)
+            payments.append(
+                Payment(
+                    invoice=invoice,
+                    amount=data["amount"],
+                    payment_method=data["method"],
+                    reference=data["reference"],
+                )
+            )
+            report[index - 1] = _import_row(index, data, "created")
+
+        if payments:
+            created = Payment.objects.bulk_create(payments)
+            touched = {payment.invoice_id for payment in created}
+            _sync_paid_totals(touched)
+            paid = {}
+            for payment in created:
+                paid[payment.invoice] = paid.get(payment.invoice, 0) + payment.amount
+            for model, owner_field in LEDGERS:
+                changes = {}
+                for invoice, amount in paid.items():
+                    if invoice.status == "cancelled":
+                        continue
+                    owner = changes.setdefault(
+                        getattr(invoice, f"{owner_field}_id"), {"paid_total": 0, "outstanding": 0}
+                    )
+                    owner["paid_total"] += amount
+                    owner["outstanding"] -= amount
+                shift_balances(model, owner_field, changes)
+            rows_created = iter(created)
+            for entry in report:
+                if entry["status"] == "created":
+                    entry["payment_id"] = next(rows_created).pk
+            # bulk_create skips the signal that logs single payments.
+            for payment in created:
+                record_activity(payment.invoice_id, payment_event(payment))
+
+    return report
+
+
+def _sync_paid_totals(invoice_ids):
+    """Recompute paid/remaining/status for ``invoice_ids`` from their payments in one UPDATE."""
+    money = DecimalField(max_digits=12, decimal_places=2)
+    paid = Coalesce(
+        Subquery(
+            Payment.objects.filter(invoice=OuterRef("pk"))
+            .order_by()
+            .values("invoice")
+            .annotate(total=Sum("amount"))
+            .values("total")
+        ),
+        Value(Decimal("0")),
+        output_field=money,
+    )
+    Invoice.objects.filter(pk__in=invoice_ids).update(
+        total_paid_amount=paid,
+        remaining_amount=F("item_total") - paid,
+        updated_at=timezone.now(),
+        payment_status=Case(
+            When(LessThanOrEqual(paid, 0), then=Value("pending")),
+            When(LessThan(paid, F("item_total")), then=Value("partially_paid")),
+            default=Value("paid"),
+        ),
+    )
+
+
+def _import_row(index, row, status, errors=None):
+    entry = {
+        "row": index,
+        "invoice_no": row.get("invoice_no") if isinstance(row, dict) else None,
+        "status": status,
+        "payment_id": None,
+    }
+    if errors:
+        entry["errors"] = errors
+    return entry
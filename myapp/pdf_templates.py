@@ -0,0 +1,288 @@
+"""
+Invoice PDF templates.
+
+Each template's paragraph and table styles are built once per process on
+first use, and company stamp/signature images are decoded once and kept in
+a small LRU cache, so rendering an invoice only lays out its own text.
+Within a document, the accent rule every page shares is stored once as a
+ReportLab Form XObject and referenced from each page; the footer text and
+page number are drawn per page.
+
+``Invoice.selected_template`` picks the template; unknown names fall back
+to ``DEFAULT_TEMPLATE``.
+"""
+import io
+import logging
+import threading
+from collections import OrderedDict
+from decimal import Decimal
+from xml.sax.saxutils import escape
+from functools import cached_property
+
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+from reportlab.lib.utils import ImageReader
+from reportlab.platypus import Flowable, Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TEMPLATE = "classic"
+IMAGE_CACHE_SIZE = 64
+LINE_TABLE_HEADER = ["Item Name", "Quantity", "Unit Price", "GST", "Total"]
+# Minimum line row height; rows grow to fit a wrapped item name.
+LINE_ROW_HEIGHT = 18
+# Table's default top + bottom and left + right cell padding.
+LINE_CELL_PADDING = 6
+LINE_COLUMN_SHARES = (0.34, 0.12, 0.16, 0.22, 0.16)
+
+_image_cache = OrderedDict()
+_image_lock = threading.Lock()
+
+
+def format_money(value):
+    try:
+        decimal_value = Decimal(value)
+    except Exception:
+        decimal_value = Decimal("0")
+    return f"{decimal_value:.2f}"
+
+
+def build_client_address(client):
+    parts = [
+        getattr(client, "address", "") or "",
+        getattr(client, "city", "") or "",
+        getattr(client, "state", "") or "",
+        getattr(client, "pincode", "") or "",
+    ]
+    return ", ".join([part for part in parts if part]) or "-"
+
+
+def company_image(field):
+    """
+    Return a decoded ImageReader for a stamp/signature field, cached by file
+    name. Storage never overwrites a name, so a new upload gets a new key.
+    """
+    if not field:
+        return None
+    key = field.name
+    with _image_lock:
+        if key in _image_cache:
+            _image_cache.move_to_end(key)
+            return _image_cache[key]
+
+    try:
+        with field.open("rb") as handle:
+            reader = ImageReader(io.BytesIO(handle.read()))
+        reader.getRGBData()
+    except Exception:
+        logger.warning("Could not load company image %s", field.name, exc_info=True)
+        return None
+
+    with _image_lock:
+        _image_cache[key] = reader
+        while len(_image_cache) > IMAGE_CACHE_SIZE:
+            _image_cache.popitem(last=False)
+    return reader
+
+
+class CachedImage(Flowable):
+    """Draws an already decoded image scaled to fit ``max_width`` x ``max_height``."""
+
+    def __init__(self, reader, max_width=120, max_height=60):
+        super().__init__()
+        image_width, image_height = reader.getSize()
+        scale = min(max_width / image_width, max_height / image_height, 1)
+        self.reader = reader
+        self.width = image_width * scale
+        self.height = image_height * scale
+
+    def draw(self):
+        self.canv.drawImage(self.reader, 0, 0, self.width, self.height, mask="auto")
+
+
+class LineChunks(Flowable):
+    """
+    The invoice line table, laid out one page-sized Table at a time.
+
+    ``rows`` can be any iterator (e.g. over ``QuerySet.iterator()``); rows
+    are only pulled when the page they land on is being laid out, so a huge
+    invoice never exists as one giant Table. The flowable always reports
+    itself taller than the frame while rows remain, which makes platypus
+    call ``split`` for a chunk that fits and then re-queue the remainder.
+    """
+
+    def __init__(self, template, rows):
+        super().__init__()
+        self.template = template
+        self.rows = iter(rows)
+        self.pending = None
+
+    def _peek(self):
+        if self.pending is None:
+            self.pending = next(self.rows, None)
+        return self.pending
+
+    def wrap(self, availWidth, availHeight):
+        if self._peek() is None:
+            return availWidth, 0
+        return availWidth, availHeight + 1
+
+    def split(self, availWidth, availHeight):
+        # Rows are measured as they are pulled; one that does not fit stays
+        # pending for the next page.
+        rows, heights = [], []
+        used = LINE_ROW_HEIGHT  # the header row
+        while self._peek() is not None:
+            height = self.template.line_row_height(self.pending, availWidth)
+            if used + height > availHeight:
+                break
+            rows.append(self.pending)
+            heights.append(height)
+            used += height
+            self.pending = None
+        if not rows:
+            return []
+        # platypus marks a flowable that could not be split on a full page;
+        # clear it so the next page starts fresh.
+        self.__dict__.pop("_postponed", None)
+        return [self.template.line_table(rows, availWidth, heights), self]
+
+    def draw(self):
+        pass
+
+
+class InvoiceTemplate:
+    def __init__(self, name, accent, stripe, font="Helvetica", bold_font="Helvetica-Bold", grid=True):
+        self.name = name
+        self.accent = colors.HexColor(accent)
+        self.stripe = colors.HexColor(stripe)
+        self.font = font
+        self.bold_font = bold_font
+        self.grid = grid
+
+    @cached_property
+    def styles(self):
+        base = getSampleStyleSheet()
+        return {
+            "title": ParagraphStyle(f"{self.name}-title", parent=base["Title"], fontName=self.bold_font, textColor=self.accent),
+            "heading": ParagraphStyle(f"{self.name}-heading", parent=base["Heading3"], fontName=self.bold_font),
+            "normal": ParagraphStyle(f"{self.name}-normal", parent=base["Normal"], fontName=self.font),
+            # Matches the table's default cell font so wrapped and plain cells line up.
+            "cell": ParagraphStyle(f"{self.name}-cell", parent=base["Normal"], fontName=self.font, fontSize=10, leading=12),
+        }
+
+    @cached_property
+    def table_style(self):
+        commands = [
+            ("BACKGROUND", (0, 0), (-1, 0), self.accent),
+            ("TEXTCOLOR", (0, 0), (-1, 0), colors.whitesmoke),
+            ("FONTNAME", (0, 0), (-1, 0), self.bold_font),
+            ("FONTNAME", (0, 1), (-1, -1), self.font),
+            ("ALIGN", (1, 0), (-1, -1), "CENTER"),
+            ("VALIGN", (0, 0), (-1, -1), "MIDDLE"),
+            ("ROWBACKGROUNDS", (0, 1), (-1, -1), [colors.white, self.stripe]),
+        ]
+        if self.grid:
+            commands.append(("GRID", (0, 0), (-1, -1), 0.75, colors.black))
+        else:
+            commands.append(("LINEBELOW", (0, -1), (-1, -1), 0.75, self.accent))
+        return TableStyle(commands)
+
+    def line_row(self, invoice_item):
+        return [
+            Paragraph(escape(invoice_item.item.item_name), self.styles["cell"]),
+            str(invoice_item.quantity),
+            format_money(invoice_item.price),
+            f"{format_money(invoice_item.gst_amount())} ({format_money(invoice_item.gst_rate)}%)",
+            format_money(invoice_item.total_amount()),
+        ]
+
+    @staticmethod
+    def line_row_height(row, width):
+        """Height of a line row once its item name wraps to the column."""
+        _, name_height = row[0].wrap(width * LINE_COLUMN_SHARES[0] - LINE_CELL_PADDING, 1e6)
+        return max(LINE_ROW_HEIGHT, name_height + LINE_CELL_PADDING)
+
+    def line_table(self, rows, width, heights=None):
+        if heights is None:
+            heights = [self.line_row_height(row, width) for row in rows]
+        table = Table(
+            [LINE_TABLE_HEADER, *rows],
+            colWidths=[width * share for share in LINE_COLUMN_SHARES],
+            rowHeights=[LINE_ROW_HEIGHT, *heights],
+        )
+        table.setStyle(self.table_style)
+        return table
+
+    def header_story(self, invoice):
+        styles = self.styles
+        client = invoice.client
+        return [
+            Paragraph(f"Company Name: {invoice.company.business_name}", styles["title"]),
+            Spacer(1, 8),
+            Paragraph(f"Invoice Title: {invoice.invoice_title}", styles["normal"]),
+            Paragraph(f"Invoice Number: {invoice.invoice_no}", styles["normal"]),
+            Paragraph(f"Invoice Date: {invoice.invoice_date}", styles["normal"]),
+            Paragraph(f"Status: {invoice.status}", styles["normal"]),
+            Spacer(1, 14),
+            Paragraph("Client Details", styles["heading"]),
+            Paragraph(f"Client Name: {client.business_name}", styles["normal"]),
+            Paragraph(f"Client Email: {client.email or '-'}", styles["normal"]),
+            Paragraph(f"Client Address: {build_client_address(client)}", styles["normal"]),
+            Spacer(1, 14),
+        ]
+
+    def footer_story(self, invoice):
+        styles = self.styles
+        story = [
+            Spacer(1, 14),
+            Paragraph(f"Subtotal: {format_money(invoice.item_subtotal_amount)}", styles["normal"]),
+            Paragraph(f"GST: {format_money(invoice.item_subtotal_gst)}", styles["normal"]),
+            Paragraph(f"Grand Total: {format_money(invoice.item_total)}", styles["heading"]),
+        ]
+        for field in (invoice.company.stamp, invoice.company.signature):
+            reader = company_image(field)
+            if reader is not None:
+                story += [Spacer(1, 10), CachedImage(reader)]
+        return story
+
+    def page_callback(self, invoice):
+        form_name = f"{self.name}-frame"
+        footer = f"{invoice.company.business_name} - {invoice.invoice_no}"
+
+        def draw(canvas, doc):
+            width, height = doc.pagesize
+            if not getattr(doc, "frame_form_defined", False):
+                canvas.beginForm(form_name)
+                canvas.setStrokeColor(self.accent)
+                canvas.setLineWidth(3)
+                canvas.line(doc.leftMargin, height - 30, width - doc.rightMargin, height - 30)
+                canvas.endForm()
+                doc.frame_form_defined = True
+            canvas.doForm(form_name)
+            canvas.setFont(self.font, 8)
+            canvas.setFillColor(colors.grey)
+            canvas.drawString(doc.leftMargin, 30, footer)
+            canvas.drawRightString(width - doc.rightMargin, 30, f"Page {doc.page}")
+
+        return draw
+
+    def build(self, invoice, story, output):
+        doc = SimpleDocTemplate(output, pagesize=A4, title=f"Invoice {invoice.invoice_no}")
+        on_page = self.page_callback(invoice)
+        doc.build(story, onFirstPage=on_page, onLaterPages=on_page)
+
+
+TEMPLATES = {
+    template.name: template
+    for template in (
+        InvoiceTemplate("classic", accent="#334155", stripe="#f8fafc"),
+        InvoiceTemplate("modern", accent="#0f766e", stripe="#f0fdfa"),
+        InvoiceTemplate("minimal", accent="#111827", stripe="#ffffff", font="Times-Roman", bold_font="Times-Bold", grid=False),
+    )
+}
+
+
+def get_template(name):
+    return TEMPLATES.get(name) or TEMPLATES[DEFAULT_TEMPLATE]
@@ -1,5 +1,7 @@
 from rest_framework.permissions import BasePermission
 
+from .authentication import MetricsTokenAuthentication
+
 
 class IsAuthenticatedUser(BasePermission):
     """
@@ -23,6 +25,18 @@ class AdminFullAccessPermission(BasePermission):
         )
 
 
+class MetricsScrapePermission(BasePermission):
+    """
+    Allows the Prometheus scraper in with ``Authorization: Bearer
+    <METRICS_TOKEN>`` when a token is configured; admins always.
+    """
+
+    def has_permission(self, request, view):
+        if request.auth is MetricsTokenAuthentication:
+            return True
+        return AdminFullAccessPermission().has_permission(request, view)
+
+
 class OwnerOrAdminPermission(BasePermission):
     """
     Object-level access:
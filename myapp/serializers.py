@@ -1,10 +1,93 @@
+from decimal import Decimal
+
 from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
 from django.contrib.auth.models import User
+from django.core.exceptions import ObjectDoesNotExist
 from django.core.validators import RegexValidator
-from .models import Invoice, Company, Client , Item , InvoiceItem, Payment
+from django.db import transaction
+from django.db.models import Q
+from .cache import get_tenant_object
+from .models import (
+    Activity, Invoice, Company, Client , Item , InvoiceEmail, InvoiceItem, Payment, RecurringInvoice, RecurringInvoiceLine,
+)
+
+
+def parse_field_list(value):
+    return {name.strip() for name in (value or '').split(',') if name.strip()}
+
+
+class DynamicFieldsMixin:
+    """
+    Sparse fieldsets driven by the request query string of reads:
+    - ``?fields=id,invoice_no`` keeps only the listed fields.
+    - Fields named in ``Meta.expandable_fields`` are left out of list
+      responses unless requested with ``?expand=`` (or named in ``fields``).
+    Writes always validate and return the full field set.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request is None or request.method not in SAFE_METHODS:
+            return
+
+        fields = parse_field_list(request.query_params.get('fields'))
+        expand = parse_field_list(request.query_params.get('expand')) | fields
+        view = self.context.get('view')
+        is_list = getattr(view, 'action', None) == 'list'
+
+        for name in getattr(self.Meta, 'expandable_fields', ()):
+            if is_list and name not in expand:
+                self.fields.pop(name, None)
+
+        if fields:
+            for name in set(self.fields) - fields:
+                self.fields.pop(name)
+
+
+class TenantCachedRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    Primary key field that resolves the requesting user's own Company,
+    Client or Item through the tenant cache instead of a query per request.
+    Staff keep the plain queryset lookup.
+    """
+
+    def to_internal_value(self, data):
+        request = self.context.get('request')
+        if request is None or not request.user.is_authenticated or request.user.is_staff:
+            return super().to_internal_value(data)
+        try:
+            pk = int(data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        obj = get_tenant_object(self.get_queryset().model, request.user.id, pk)
+        if obj is None:
+            self.fail('does_not_exist', pk_value=data)
+        return obj
+
+
+class BalanceSerializer(serializers.Serializer):
+    invoice_count = serializers.IntegerField()
+    invoiced_total = serializers.DecimalField(max_digits=14, decimal_places=2)
+    paid_total = serializers.DecimalField(max_digits=14, decimal_places=2)
+    outstanding = serializers.DecimalField(max_digits=14, decimal_places=2)
+
+
+def serialize_balance(obj):
+    try:
+        balance = obj.balance
+    except ObjectDoesNotExist:
+        balance = {'invoice_count': 0, 'invoiced_total': 0, 'paid_total': 0, 'outstanding': 0}
+    return BalanceSerializer(balance).data
+
 
+class CompanySerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    balance = serializers.SerializerMethodField()
+
+    def get_balance(self, obj):
+        return serialize_balance(obj)
 
-class CompanySerializer(serializers.ModelSerializer):
     class Meta:
         model = Company
         fields = '__all__'
@@ -13,27 +96,32 @@ class CompanySerializer(serializers.ModelSerializer):
 
 
 
-class ClientSerializer(serializers.ModelSerializer):
-    company = serializers.PrimaryKeyRelatedField(
+class ClientSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    company = TenantCachedRelatedField(
         queryset=Company.objects.all(),
         required=False,
         allow_null=True
     )
+    balance = serializers.SerializerMethodField()
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         request = self.context.get('request')
         if request and request.user.is_authenticated and not request.user.is_staff:
-            self.fields['company'].queryset = Company.objects.filter(user=request.user)
+            if 'company' in self.fields:
+                self.fields['company'].queryset = Company.objects.filter(user=request.user)
 
     class Meta:
         model = Client
         fields = '__all__'
         read_only_fields = ('user',)
 
+    def get_balance(self, obj):
+        return serialize_balance(obj)
+
 
 
-class ItemSerializer(serializers.ModelSerializer):
+class ItemSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     amount = serializers.SerializerMethodField()
     gst_amount = serializers.SerializerMethodField()
     total_amount = serializers.SerializerMethodField()
@@ -65,11 +153,11 @@ class ItemSerializer(serializers.ModelSerializer):
     
 
 
-class InvoiceItemSerializer(serializers.ModelSerializer):
+class InvoiceItemSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     invoice = serializers.PrimaryKeyRelatedField(
         queryset=Invoice.objects.all()
     )
-    item = serializers.PrimaryKeyRelatedField(
+    item = TenantCachedRelatedField(
         queryset=Item.objects.all()
     )
     item_name = serializers.CharField(source='item.item_name', read_only=True)
@@ -97,8 +185,10 @@ class InvoiceItemSerializer(serializers.ModelSerializer):
         super().__init__(*args, **kwargs)
         request = self.context.get('request')
         if request and request.user.is_authenticated and not request.user.is_staff:
-            self.fields['invoice'].queryset = Invoice.objects.filter(user=request.user)
-            self.fields['item'].queryset = Item.objects.filter(user=request.user)
+            if 'invoice' in self.fields:
+                self.fields['invoice'].queryset = Invoice.objects.filter(user=request.user)
+            if 'item' in self.fields:
+                self.fields['item'].queryset = Item.objects.filter(user=request.user)
 
     def get_amount(self, obj):
         return obj.amount()
@@ -111,7 +201,98 @@ class InvoiceItemSerializer(serializers.ModelSerializer):
 
 
 
-class InvoiceSerializer(serializers.ModelSerializer):
+class InvoiceItemBulkSerializer(serializers.Serializer):
+    """
+    One line of a bulk line-item upload. ``item`` is resolved by the view
+    against a single pre-fetched map of the invoice owner's items; price and
+    GST rate default to the catalogue values.
+    """
+    item = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=1)
+    price = serializers.DecimalField(max_digits=10, decimal_places=2, required=False)
+    gst_rate = serializers.DecimalField(max_digits=5, decimal_places=2, required=False)
+
+
+class InvoiceSelectionSerializer(serializers.Serializer):
+    """Filter for batch operations over a tenant's invoices."""
+    company = serializers.IntegerField(required=False)
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+    status = serializers.ChoiceField(choices=Invoice.STATUS_CHOICES, required=False)
+
+    def validate(self, attrs):
+        if attrs.get('date_from') and attrs.get('date_to') and attrs['date_from'] > attrs['date_to']:
+            raise serializers.ValidationError("date_from must be on or before date_to.")
+        return attrs
+
+    def filter_queryset(self, queryset):
+        data = self.validated_data
+        if 'company' in data:
+            queryset = queryset.filter(company_id=data['company'])
+        if 'date_from' in data:
+            queryset = queryset.filter(invoice_date__gte=data['date_from'])
+        if 'date_to' in data:
+            queryset = queryset.filter(invoice_date__lte=data['date_to'])
+        if 'status' in data:
+            queryset = queryset.filter(status=data['status'])
+        return queryset
+
+
+class InvoiceFilterSerializer(InvoiceSelectionSerializer):
+    """Query parameters accepted by the invoice list endpoint."""
+    client = serializers.IntegerField(required=False)
+    payment_status = serializers.ChoiceField(choices=Invoice.PAYMENT_STATUS_CHOICES, required=False)
+    min_total = serializers.DecimalField(max_digits=12, decimal_places=2, required=False)
+    max_total = serializers.DecimalField(max_digits=12, decimal_places=2, required=False)
+    search = serializers.CharField(required=False, max_length=100)
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        data = self.validated_data
+        if 'client' in data:
+            queryset = queryset.filter(client_id=data['client'])
+        if 'payment_status' in data:
+            queryset = queryset.filter(payment_status=data['payment_status'])
+        if 'min_total' in data:
+            queryset = queryset.filter(item_total__gte=data['min_total'])
+        if 'max_total' in data:
+            queryset = queryset.filter(item_total__lte=data['max_total'])
+        if data.get('search'):
+            # Served by trigram indexes on PostgreSQL (migration 0010).
+            queryset = queryset.filter(
+                Q(invoice_no__icontains=data['search'])
+                | Q(client__business_name__icontains=data['search'])
+            )
+        return queryset
+
+
+class ClientFilterSerializer(serializers.Serializer):
+    """Query parameters accepted by the client list endpoint."""
+    company = serializers.IntegerField(required=False)
+    state = serializers.CharField(required=False, max_length=50)
+    city = serializers.CharField(required=False, max_length=50)
+    search = serializers.CharField(required=False, max_length=100)
+
+    def filter_queryset(self, queryset):
+        data = self.validated_data
+        if 'company' in data:
+            queryset = queryset.filter(company_id=data['company'])
+        if 'state' in data:
+            queryset = queryset.filter(state__iexact=data['state'])
+        if 'city' in data:
+            queryset = queryset.filter(city__iexact=data['city'])
+        if data.get('search'):
+            queryset = queryset.filter(
+                Q(business_name__icontains=data['search'])
+                | Q(email__icontains=data['search'])
+                | Q(gst_number__icontains=data['search'])
+            )
+        return queryset
+
+
+class InvoiceSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    company = TenantCachedRelatedField(queryset=Company.objects.all())
+    client = TenantCachedRelatedField(queryset=Client.objects.all())
     invoice_items = InvoiceItemSerializer(many=True, read_only=True)
     total_paid = serializers.SerializerMethodField()
     remaining_amount = serializers.SerializerMethodField()
@@ -140,21 +321,92 @@ class InvoiceSerializer(serializers.ModelSerializer):
             'total_paid',
             'remaining_amount',
         )
+        expandable_fields = ('invoice_items',)
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         request = self.context.get('request')
         if request and request.user.is_authenticated and not request.user.is_staff:
-            self.fields['company'].queryset = Company.objects.filter(user=request.user)
-            self.fields['client'].queryset = Client.objects.filter(user=request.user)
+            if 'company' in self.fields:
+                self.fields['company'].queryset = Company.objects.filter(user=request.user)
+            if 'client' in self.fields:
+                self.fields['client'].queryset = Client.objects.filter(user=request.user)
 
     def get_total_paid(self, obj):
+        # InvoiceViewSet annotates the sum; fall back for other callers.
+        payments_total = getattr(obj, 'payments_total', None)
+        if payments_total is not None:
+            return payments_total
         return sum(payment.amount for payment in obj.payments.all())
 
     def get_remaining_amount(self, obj):
         return obj.item_total - self.get_total_paid(obj)
 
 
+class RecurringInvoiceLineSerializer(serializers.ModelSerializer):
+    # Nested, so the request is only known at validation time; the tenant
+    # cache lookup limits non-staff users to their own items.
+    item = TenantCachedRelatedField(queryset=Item.objects.all())
+    item_name = serializers.CharField(source='item.item_name', read_only=True)
+    quantity = serializers.IntegerField(min_value=1)
+
+    class Meta:
+        model = RecurringInvoiceLine
+        fields = ['id', 'item', 'item_name', 'quantity', 'price', 'gst_rate']
+
+
+class RecurringInvoiceSerializer(serializers.ModelSerializer):
+    """
+    Schedule with its template lines. Lines are written with the schedule;
+    sending ``lines`` on update replaces them all.
+    """
+    company = TenantCachedRelatedField(queryset=Company.objects.all())
+    client = TenantCachedRelatedField(queryset=Client.objects.all())
+    lines = RecurringInvoiceLineSerializer(many=True, allow_empty=False)
+    next_run_date = serializers.DateField(required=False)
+
+    class Meta:
+        model = RecurringInvoice
+        fields = '__all__'
+        read_only_fields = ('user', 'last_run_at')
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request and request.user.is_authenticated and not request.user.is_staff:
+            self.fields['company'].queryset = Company.objects.filter(user=request.user)
+            self.fields['client'].queryset = Client.objects.filter(user=request.user)
+
+    def validate(self, attrs):
+        start_date = attrs.get('start_date', getattr(self.instance, 'start_date', None))
+        end_date = attrs.get('end_date', getattr(self.instance, 'end_date', None))
+        if end_date and start_date and end_date < start_date:
+            raise serializers.ValidationError({'end_date': 'end_date must be on or after start_date.'})
+        if self.instance is None and 'next_run_date' not in attrs:
+            attrs['next_run_date'] = start_date
+        return attrs
+
+    def create(self, validated_data):
+        lines = validated_data.pop('lines')
+        with transaction.atomic():
+            schedule = super().create(validated_data)
+            RecurringInvoiceLine.objects.bulk_create(
+                RecurringInvoiceLine(schedule=schedule, **line) for line in lines
+            )
+        return schedule
+
+    def update(self, instance, validated_data):
+        lines = validated_data.pop('lines', None)
+        with transaction.atomic():
+            schedule = super().update(instance, validated_data)
+            if lines is not None:
+                schedule.lines.all().delete()
+                RecurringInvoiceLine.objects.bulk_create(
+                    RecurringInvoiceLine(schedule=schedule, **line) for line in lines
+                )
+        return schedule
+
+
 class RegisterSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True, min_length=8)
     username = serializers.CharField(
@@ -194,5 +446,101 @@ class RegisterSerializer(serializers.ModelSerializer):
 class PaymentSerializer(serializers.ModelSerializer):
     class Meta:
         model = Payment
-        fields = ('id', 'invoice', 'amount', 'payment_method', 'created_at')
+        fields = ('id', 'invoice', 'amount', 'payment_method', 'reference', 'created_at')
         read_only_fields = ('id', 'invoice', 'created_at')
+
+
+class ClientImportRowSerializer(serializers.ModelSerializer):
+    """A CSV row for the client import; company ids are checked against the preloaded set."""
+    company = serializers.IntegerField(required=False, allow_null=True)
+
+    class Meta:
+        model = Client
+        fields = (
+            'business_name', 'company', 'email', 'mobile_number', 'gst_number',
+            'state', 'city', 'pincode', 'address',
+        )
+
+    def validate_company(self, value):
+        if value is not None and value not in self.context['company_ids']:
+            raise serializers.ValidationError('Unknown company.')
+        return value
+
+    def validate(self, attrs):
+        if 'company' in attrs:
+            attrs['company_id'] = attrs.pop('company')
+        return attrs
+
+
+class ItemImportRowSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Item
+        fields = ('item_code', 'item_name', 'gst_rate', 'quantity', 'price')
+
+
+class PaymentImportRowSerializer(serializers.Serializer):
+    """One settlement line from a bank statement import."""
+    invoice_no = serializers.CharField(max_length=50)
+    amount = serializers.DecimalField(max_digits=12, decimal_places=2, min_value=Decimal('0.01'))
+    method = serializers.ChoiceField(choices=Payment.PAYMENT_METHOD_CHOICES)
+    reference = serializers.CharField(max_length=100, required=False, allow_blank=True, default='')
+
+
+class InvoiceEmailSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = InvoiceEmail
+        fields = ('id', 'invoice', 'to_email', 'status', 'attempts', 'last_error', 'created_at', 'sent_at')
+        read_only_fields = fields
+
+
+class ActivitySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Activity
+        fields = ('id', 'event', 'created_at')
+        read_only_fields = fields
+
+
+class ReportQuerySerializer(InvoiceSelectionSerializer):
+    GROUP_BY_CHOICES = ('month', 'client', 'company')
+
+    group_by = serializers.ChoiceField(choices=GROUP_BY_CHOICES, default='month')
+
+
+class ExportQuerySerializer(InvoiceSelectionSerializer):
+    output = serializers.ChoiceField(choices=('csv', 'jsonl'), default='csv')
+
+
+def money_field():
+    return serializers.DecimalField(max_digits=14, decimal_places=2)
+
+
+class RevenueReportRowSerializer(serializers.Serializer):
+    key = serializers.CharField()
+    label = serializers.CharField()
+    invoice_count = serializers.IntegerField()
+    subtotal = money_field()
+    gst = money_field()
+    total = money_field()
+    paid = money_field()
+    outstanding = money_field()
+
+
+class GstReportRowSerializer(serializers.Serializer):
+    key = serializers.CharField()
+    label = serializers.CharField()
+    gst_rate = serializers.DecimalField(max_digits=5, decimal_places=2)
+    line_count = serializers.IntegerField()
+    taxable_amount = money_field()
+    gst_amount = money_field()
+
+
+class AgingReportRowSerializer(serializers.Serializer):
+    key = serializers.CharField()
+    label = serializers.CharField()
+    invoice_count = serializers.IntegerField()
+    current = money_field()
+    days_31_60 = money_field()
+    days_61_90 = money_field()
+    over_90 = money_field()
+    total = money_field()
+
@@ -1,15 +1,171 @@
 # myapp/signals.py
 
-from django.db.models.signals import post_save, post_delete
+from django.core.signals import request_finished
+from django.db import transaction
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
 from django.dispatch import receiver
-from .models import InvoiceItem
+from .activity import (
+    flush_activities,
+    invoice_email_sent,
+    invoice_pdf_downloaded,
+    payment_event,
+    record_activity,
+)
+from .balances import LEDGER_COLUMNS, apply_invoice_change
+from .cache import invalidate_tenant
+from .models import Client, ClientBalance, Company, CompanyBalance, Invoice, InvoiceItem, Item, Payment
+from .payments import remove_payment
+from .totals import apply_totals_delta, line_contribution_delta
+from .utils import discard_invoice_pdfs
+
+
+@receiver(pre_save, sender=InvoiceItem)
+@receiver(pre_delete, sender=InvoiceItem)
+def read_line_before_change(sender, instance, raw=False, **kwargs):
+    # Lines loaded with only()/defer() do not know what they contributed;
+    # read the stored totals so the delta does not count the line twice.
+    if raw or instance._state.adding or hasattr(instance, "_saved_line"):
+        return
+    instance._saved_line = (
+        InvoiceItem.objects.filter(pk=instance.pk).values_list("invoice_id", "line_amount", "line_gst").first()
+    )
 
 
 @receiver(post_save, sender=InvoiceItem)
-def update_invoice_totals_on_save(sender, instance, **kwargs):
-    instance.invoice.calculate_totals()
+def update_invoice_totals_on_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    for invoice_id, (amount, gst) in line_contribution_delta(instance).items():
+        apply_totals_delta(invoice_id, amount, gst)
+    instance._saved_line = (instance.invoice_id, *instance.line_totals())
+
+
+def deleted_without_invoice(model, origin):
+    """True unless the ``model`` rows are going because their invoice is being deleted."""
+    if isinstance(origin, QuerySet):
+        return origin.model is model
+    return origin is None or isinstance(origin, model)
 
 
 @receiver(post_delete, sender=InvoiceItem)
-def update_invoice_totals_on_delete(sender, instance, **kwargs):
-    instance.invoice.calculate_totals()
+def update_invoice_totals_on_delete(sender, instance, origin=None, **kwargs):
+    # In a cascade the invoice leaves the ledgers with its own post_delete.
+    if deleted_without_invoice(InvoiceItem, origin):
+        for invoice_id, (amount, gst) in line_contribution_delta(instance, deleting=True).items():
+            apply_totals_delta(invoice_id, amount, gst)
+    instance._saved_line = None
+
+
+@receiver(post_delete, sender=Payment)
+def update_invoice_on_payment_delete(sender, instance, origin=None, **kwargs):
+    # In a cascade the invoice leaves the ledgers with its own post_delete.
+    if deleted_without_invoice(Payment, origin):
+        remove_payment(instance)
+
+
+@receiver(pre_save, sender=Invoice)
+def read_invoice_before_save(sender, instance, raw=False, **kwargs):
+    # Lock and read the row being replaced so post_save can shift the
+    # ledgers by exactly the difference.
+    instance._ledger_before = None
+    if raw or instance._state.adding:
+        return
+    instance._ledger_before = (
+        Invoice.objects.select_for_update().filter(pk=instance.pk).values(*LEDGER_COLUMNS).first()
+    )
+
+
+@receiver(post_save, sender=Invoice)
+def update_balances_on_invoice_save(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    before = getattr(instance, "_ledger_before", None)
+    after = {name: getattr(instance, name) for name in LEDGER_COLUMNS}
+    if update_fields and before is not None:
+        # Columns left out of update_fields keep their stored values.
+        after = {
+            name: after[name] if {name, name.removesuffix("_id")} & set(update_fields) else before[name]
+            for name in LEDGER_COLUMNS
+        }
+    apply_invoice_change(before, after)
+
+
+@receiver(pre_delete, sender=Invoice)
+def read_invoice_before_delete(sender, instance, origin=None, **kwargs):
+    # Instances collected by a cascade were just loaded; the one the caller
+    # deletes directly may hold stale totals, so read its stored row.
+    if origin is instance:
+        instance._ledger_before = (
+            Invoice.objects.select_for_update().filter(pk=instance.pk).values(*LEDGER_COLUMNS).first()
+        )
+    else:
+        instance._ledger_before = {name: getattr(instance, name) for name in LEDGER_COLUMNS}
+
+
+@receiver(post_delete, sender=Invoice)
+def update_balances_on_invoice_delete(sender, instance, **kwargs):
+    apply_invoice_change(instance._ledger_before, None, create=False)
+
+
+@receiver(post_delete, sender=Invoice)
+def discard_pdfs_on_invoice_delete(sender, instance, **kwargs):
+    invoice_id = instance.pk
+    transaction.on_commit(lambda: discard_invoice_pdfs(invoice_id))
+
+
+@receiver(post_save, sender=Company)
+@receiver(post_save, sender=Client)
+def create_balance_row(sender, instance, created=False, raw=False, **kwargs):
+    # Start every owner with an empty ledger so invoice writes only ever
+    # need F() updates.
+    if created and not raw:
+        model = ClientBalance if sender is Client else CompanyBalance
+        model.objects.bulk_create([model(pk=instance.pk)], ignore_conflicts=True)
+
+
+@receiver(post_save, sender=Company)
+@receiver(post_save, sender=Client)
+@receiver(post_save, sender=Item)
+@receiver(post_delete, sender=Company)
+@receiver(post_delete, sender=Client)
+@receiver(post_delete, sender=Item)
+def invalidate_tenant_cache(sender, instance, **kwargs):
+    invalidate_tenant(sender, instance.user_id)
+
+
+# Audit log: events are buffered and written once the response has been sent.
+request_finished.connect(flush_activities, dispatch_uid="flush_invoice_activities")
+
+
+@receiver(post_save, sender=Invoice)
+def record_invoice_activity(sender, instance, created=False, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        record_activity(instance.pk, "Invoice created")
+    if instance.is_locked and not getattr(instance, "_saved_locked", False):
+        record_activity(instance.pk, "Invoice locked")
+    instance._saved_locked = instance.is_locked
+
+
+@receiver(post_save, sender=InvoiceItem)
+def record_line_activity(sender, instance, created=False, raw=False, **kwargs):
+    if created and not raw:
+        record_activity(instance.invoice_id, f"Line added: {instance.quantity} x {instance.item}")
+
+
+@receiver(post_save, sender=Payment)
+def record_payment_activity(sender, instance, created=False, raw=False, **kwargs):
+    if created and not raw:
+        record_activity(instance.invoice_id, payment_event(instance))
+
+
+@receiver(invoice_pdf_downloaded)
+def record_pdf_activity(sender, invoice_id, **kwargs):
+    record_activity(invoice_id, "PDF downloaded")
+
+
+@receiver(invoice_email_sent)
+def record_email_activity(sender, invoice_id, to_email, **kwargs):
+    record_activity(invoice_id, f"Email sent to {to_email}")
@@ -1,3 +1,1888 @@
-from django.test import TestCase
+import csv
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from datetime import date, timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db import IntegrityError, OperationalError, close_old_connections
+from django.http import FileResponse
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db.models import F
+from django.utils import timezone
+from PIL import Image as PILImage
+from reportlab.lib.utils import ImageReader
+from reportlab.platypus import Table
+from rest_framework.test import APIClient
+
+from .models import (
+    Activity,
+    Client,
+    ClientBalance,
+    Company,
+    CompanyBalance,
+    Invoice,
+    InvoiceEmail,
+    InvoiceItem,
+    InvoiceSequence,
+    Item,
+    Payment,
+    RecurringInvoice,
+    RecurringInvoiceLine,
+)
+from .activity import discard_activities, flush_activities, record_activity
+from .cache import cache_stats, get_tenant_object, reset_cache_stats
+from .exports import export_queryset, stream_csv
+from .metrics import registry
+from .outbox import process_email_outbox
+from .recurring import generate_due_invoices
+from .totals import deferred_invoice_totals
+from .pdf_templates import DEFAULT_TEMPLATE, LINE_ROW_HEIGHT, TEMPLATES, get_template
+from .serializers import InvoiceSerializer
+from .utils import (
+    PDF_CACHE_DIR,
+    generate_invoice_pdf,
+    invoice_pdf_fingerprint,
+    invoice_pdf_path,
+    open_invoice_pdf,
+    write_invoice_pdf,
+)
+
+
+class InvoiceFixturesMixin:
+    def setUp(self):
+        self.user = User.objects.create_user(username="owner", password="secret-pass-123")
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+        cache.clear()
+        discard_activities()
+        self.company = Company.objects.create(
+            user=self.user,
+            owner_name="Owner",
+            business_name="Acme Traders",
+            email="owner@example.com",
+            mobile_number="9999999999",
+            state="Punjab",
+            city="Ludhiana",
+            pincode="141001",
+        )
+        self.client_obj = Client.objects.create(
+            user=self.user,
+            company=self.company,
+            business_name="Globex",
+            email="billing@globex.example.com",
+            mobile_number="8888888888",
+            state="Punjab",
+            city="Ludhiana",
+            pincode="141001",
+        )
+        self.item = Item.objects.create(
+            user=self.user,
+            item_code="SKU-1",
+            item_name="Widget",
+            gst_rate=Decimal("18.00"),
+            quantity=1,
+            price=Decimal("100.00"),
+        )
+
+    def use_temp_media_root(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+
+    def run_on_commit(self):
+        """Run the on_commit callbacks registered inside the block; TestCase never commits."""
+        if isinstance(self, TestCase):
+            return self.captureOnCommitCallbacks(execute=True)
+        return nullcontext()
+
+    def create_invoice(self, lines=1, payments=0, **kwargs):
+        fields = {
+            "user": self.user,
+            "company": self.company,
+            "client": self.client_obj,
+            "selected_template": "classic",
+            "invoice_date": date(2026, 3, 1),
+            "status": "due",
+        }
+        fields.update(kwargs)
+        with self.run_on_commit():
+            invoice = Invoice.objects.create(**fields)
+            for _ in range(lines):
+                InvoiceItem.objects.create(
+                    invoice=invoice,
+                    item=self.item,
+                    quantity=2,
+                    price=Decimal("100.00"),
+                    gst_rate=Decimal("18.00"),
+                )
+            for _ in range(payments):
+                Payment.objects.create(invoice=invoice, amount=Decimal("10.00"), payment_method="cash")
+        # Write the fixture's audit events now rather than inside the next measured request.
+        flush_activities()
+        return invoice
+
+
+class InvoiceAPITestCase(InvoiceFixturesMixin, TestCase):
+    pass
+
+
+class InvoiceQueryCountTests(InvoiceAPITestCase):
+    def list_query_count(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.api.get("/api/invoices/", {"expand": "invoice_items"})
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries), response
+
+    def test_list_query_count_is_independent_of_invoice_count(self):
+        self.create_invoice(lines=2, payments=1)
+        baseline, _ = self.list_query_count()
+
+        for _ in range(10):
+            self.create_invoice(lines=3, payments=2)
+        queries, response = self.list_query_count()
+
+        self.assertEqual(queries, baseline)
+        self.assertEqual(len(response.data["results"]), 11)
+
+    def test_list_reports_payment_totals(self):
+        invoice = self.create_invoice(lines=1, payments=2)
+        invoice.refresh_from_db()
+
+        response = self.api.get(f"/api/invoices/{invoice.id}/")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["total_paid"], Decimal("20.00"))
+        self.assertEqual(response.data["remaining_amount"], invoice.item_total - Decimal("20.00"))
+        self.assertEqual(len(response.data["invoice_items"]), 1)
+        self.assertEqual(response.data["invoice_items"][0]["item_name"], "Widget")
+
+
+class PaginationAndFieldsetTests(InvoiceAPITestCase):
+    def test_list_is_cursor_paginated_newest_first(self):
+        invoices = [self.create_invoice(lines=0) for _ in range(3)]
+
+        first = self.api.get("/api/invoices/", {"page_size": 2})
+        second = self.api.get(first.data["next"])
+
+        self.assertEqual([row["id"] for row in first.data["results"]], [invoices[2].id, invoices[1].id])
+        self.assertEqual([row["id"] for row in second.data["results"]], [invoices[0].id])
+        self.assertIsNone(second.data["next"])
+
+    def test_list_omits_invoice_items_unless_expanded(self):
+        self.create_invoice(lines=2)
+
+        collapsed = self.api.get("/api/invoices/").data["results"][0]
+        expanded = self.api.get("/api/invoices/", {"expand": "invoice_items"}).data["results"][0]
+
+        self.assertNotIn("invoice_items", collapsed)
+        self.assertEqual(len(expanded["invoice_items"]), 2)
+
+    def test_detail_includes_invoice_items(self):
+        invoice = self.create_invoice(lines=1)
+
+        response = self.api.get(f"/api/invoices/{invoice.id}/")
+
+        self.assertIn("invoice_items", response.data)
+
+    def test_fields_param_limits_columns(self):
+        invoice = self.create_invoice(lines=1)
+
+        response = self.api.get("/api/invoices/", {"fields": "id,invoice_no"})
+
+        self.assertEqual(response.data["results"], [{"id": invoice.id, "invoice_no": invoice.invoice_no}])
+
+    def test_fields_param_does_not_apply_to_writes(self):
+        response = self.api.patch(
+            f"/api/clients/{self.client_obj.id}/?fields=id", {"business_name": "Renamed"}, format="json"
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["business_name"], "Renamed")
+        self.client_obj.refresh_from_db()
+        self.assertEqual(self.client_obj.business_name, "Renamed")
+
+    def test_other_collections_are_paginated(self):
+        response = self.api.get("/api/clients/", {"fields": "id,business_name"})
+
+        self.assertEqual(
+            response.data["results"],
+            [{"id": self.client_obj.id, "business_name": "Globex"}],
+        )
+
+
+class InvoiceNumberTests(InvoiceAPITestCase):
+    def test_numbers_are_sequential_per_prefix(self):
+        year = timezone.now().year
+        first = self.create_invoice(lines=0)
+        second = self.create_invoice(lines=0)
+
+        self.assertEqual(first.invoice_no, f"INV-{year}-0001")
+        self.assertEqual(second.invoice_no, f"INV-{year}-0002")
+
+    def test_company_prefix_is_used(self):
+        year = timezone.now().year
+        self.company.invoice_prefix = "ACME"
+        self.company.save()
+
+        invoice = self.create_invoice(lines=0)
+
+        self.assertEqual(invoice.invoice_no, f"ACME-{year}-0001")
+
+    def test_reserve_numbers_hands_out_a_block(self):
+        year = timezone.now().year
+        block = InvoiceSequence.reserve_numbers("INV", 3, year=year)
+        invoice = self.create_invoice(lines=0)
+        later = InvoiceSequence.reserve_numbers("INV", 1, year=year)
+
+        self.assertEqual(block, [f"INV-{year}-0001", f"INV-{year}-0002", f"INV-{year}-0003"])
+        self.assertEqual(invoice.invoice_no, f"INV-{year}-0004")
+        self.assertEqual(later, [f"INV-{year}-0005"])
+        self.assertNotIn(invoice.invoice_no, block)
+
+
+class InvoiceTotalsTests(InvoiceAPITestCase):
+    def add_line(self, invoice, quantity=1, price="10.00", gst_rate="18.00"):
+        return InvoiceItem.objects.create(
+            invoice=invoice,
+            item=self.item,
+            quantity=quantity,
+            price=Decimal(price),
+            gst_rate=Decimal(gst_rate),
+        )
+
+    def assertTotals(self, invoice, subtotal, gst):
+        invoice.refresh_from_db()
+        self.assertEqual(invoice.item_subtotal_amount, Decimal(subtotal))
+        self.assertEqual(invoice.item_subtotal_gst, Decimal(gst))
+        self.assertEqual(invoice.item_total, Decimal(subtotal) + Decimal(gst))
+        self.assertEqual(invoice.remaining_amount, invoice.item_total - invoice.total_paid_amount)
+
+    def test_line_changes_apply_deltas(self):
+        invoice = self.create_invoice(lines=0)
+        line = self.add_line(invoice, quantity=2, price="50.00")
+        self.add_line(invoice, quantity=1, price="10.00", gst_rate="5.00")
+        self.assertTotals(invoice, "110.00", "18.50")
+
+        line = InvoiceItem.objects.get(pk=line.pk)
+        line.quantity = 3
+        line.save()
+        self.assertTotals(invoice, "160.00", "27.50")
+
+        line.delete()
+        self.assertTotals(invoice, "10.00", "0.50")
+
+    def test_adding_a_line_does_not_reload_other_lines(self):
+        small = self.create_invoice(lines=1)
+        large = self.create_invoice(lines=20)
+
+        with CaptureQueriesContext(connection) as small_ctx:
+            self.add_line(small)
+        with CaptureQueriesContext(connection) as large_ctx:
+            self.add_line(large)
+
+        # Totals and balance ledgers are shifted by UPDATEs; no line is re-read.
+        self.assertEqual(len(large_ctx.captured_queries), len(small_ctx.captured_queries))
+        self.assertFalse(
+            any(query["sql"].startswith("SELECT") for query in large_ctx.captured_queries)
+        )
+        statements = [query["sql"] for query in large_ctx.captured_queries if "SAVEPOINT" not in query["sql"]]
+        # The line INSERT, the invoice UPDATE and one UPDATE per balance ledger.
+        self.assertLessEqual(len(statements), 4)
+
+    def test_lines_loaded_with_only_apply_deltas(self):
+        invoice = self.create_invoice(lines=0)
+        line = self.add_line(invoice, quantity=2, price="50.00")
+
+        line = InvoiceItem.objects.only("id", "quantity").get(pk=line.pk)
+        line.quantity = 3
+        line.save()
+        self.assertTotals(invoice, "150.00", "27.00")
+
+        InvoiceItem.objects.defer("line_amount").get(pk=line.pk).delete()
+        self.assertTotals(invoice, "0.00", "0.00")
+
+    def test_moving_a_line_updates_both_invoices(self):
+        source = self.create_invoice(lines=0)
+        target = self.create_invoice(lines=0)
+        line = self.add_line(source, quantity=1, price="100.00")
+
+        line.invoice = target
+        line.save()
+
+        self.assertTotals(source, "0.00", "0.00")
+        self.assertTotals(target, "100.00", "18.00")
+
+    def test_deferred_mode_recomputes_once(self):
+        invoice = self.create_invoice(lines=0)
+
+        with deferred_invoice_totals():
+            for _ in range(5):
+                self.add_line(invoice)
+            invoice.refresh_from_db()
+            self.assertEqual(invoice.item_total, Decimal("0"))
+
+        self.assertTotals(invoice, "50.00", "9.00")
+
+    def test_reconcile_command_reports_and_fixes_drift(self):
+        invoice = self.create_invoice(lines=2)
+        Invoice.objects.filter(pk=invoice.pk).update(item_total=Decimal("1.00"))
+
+        out = StringIO()
+        call_command("reconcile_invoice_totals", stdout=out)
+        self.assertIn("found 1 mismatches", out.getvalue())
+
+        call_command("reconcile_invoice_totals", "--fix", stdout=StringIO())
+        self.assertTotals(invoice, "400.00", "72.00")
+
+
+class BulkInvoiceItemTests(InvoiceAPITestCase):
+    def test_bulk_lines_are_created_with_few_queries(self):
+        invoice = self.create_invoice(lines=0)
+        other = Item.objects.create(
+            user=self.user,
+            item_code="SKU-2",
+            item_name="Gadget",
+            gst_rate=Decimal("5.00"),
+            quantity=1,
+            price=Decimal("20.00"),
+        )
+        payload = [{"item": self.item.id, "quantity": 1} for _ in range(150)]
+        payload += [{"item": other.id, "quantity": 2, "price": "25.00"} for _ in range(150)]
+
+        with self.run_on_commit():
+            response = self.api.post(f"/api/invoices/{invoice.id}/items/bulk/", payload, format="json")
+        flush_activities()
+
+        self.assertEqual(response.status_code, 201, response.data)
+        # Server-Timing counts the request path; the audit log is written after the response.
+        request_queries = int(re.search(r'desc="(\d+) queries"', response["Server-Timing"]).group(1))
+        self.assertLess(request_queries, 15)
+        self.assertEqual(list(invoice.activities.values_list("event", flat=True)), ["Invoice created", "300 lines added"])
+        self.assertEqual(len(response.data["invoice_items"]), 300)
+        self.assertEqual(invoice.invoice_items.count(), 300)
+        invoice.refresh_from_db()
+        self.assertEqual(invoice.item_subtotal_amount, Decimal("22500.00"))
+        self.assertEqual(invoice.item_subtotal_gst, Decimal("3075.00"))
+
+    def test_unknown_items_reject_the_whole_batch(self):
+        invoice = self.create_invoice(lines=0)
+        stranger = User.objects.create_user(username="stranger", password="secret-pass-123")
+        foreign = Item.objects.create(
+            user=stranger,
+            item_code="X",
+            item_name="Foreign",
+            gst_rate=Decimal("0"),
+            quantity=1,
+            price=Decimal("1.00"),
+        )
+
+        response = self.api.post(
+            f"/api/invoices/{invoice.id}/items/bulk/",
+            [{"item": self.item.id, "quantity": 1}, {"item": foreign.id, "quantity": 1}],
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data[1]["item"][0], "Unknown item.")
+        self.assertFalse(invoice.invoice_items.exists())
+
+    def test_locked_invoice_rejects_bulk_lines(self):
+        invoice = self.create_invoice(lines=0, status="paid")
+
+        response = self.api.post(
+            f"/api/invoices/{invoice.id}/items/bulk/",
+            [{"item": self.item.id, "quantity": 1}],
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, 400)
+
+
+class InvoicePdfCacheTests(InvoiceAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.use_temp_media_root()
+
+    def test_pdf_is_rendered_once_and_served_with_etag(self):
+        invoice = self.create_invoice(lines=2)
+
+        with mock.patch("myapp.utils.write_invoice_pdf", wraps=write_invoice_pdf) as render:
+            first = self.api.get(f"/api/invoices/{invoice.id}/pdf/")
+            second = self.api.get(f"/api/invoices/{invoice.id}/pdf/")
+
+        self.assertEqual(first.status_code, 200)
+        first_pdf = b"".join(first.streaming_content)
+        self.assertEqual(first_pdf, b"".join(second.streaming_content))
+        self.assertTrue(first_pdf.startswith(b"%PDF"))
+        self.assertEqual(render.call_count, 1)
+        self.assertTrue(first["ETag"])
+
+    def test_each_invoice_keeps_only_its_current_pdf(self):
+        invoice = self.create_invoice(lines=1)
+        directory = f"{PDF_CACHE_DIR}/{invoice.id}"
+        b"".join(self.api.get(f"/api/invoices/{invoice.id}/pdf/").streaming_content)
+
+        self.api.patch(f"/api/invoices/{invoice.id}/", {"invoice_title": "Revised"}, format="json")
+        b"".join(self.api.get(f"/api/invoices/{invoice.id}/pdf/").streaming_content)
+
+        fingerprint = invoice_pdf_fingerprint(Invoice.objects.get(pk=invoice.id))
+        self.assertEqual(default_storage.listdir(directory)[1], [f"{fingerprint}.pdf"])
+
+        with self.run_on_commit():
+            invoice.delete()
+        self.assertEqual(default_storage.listdir(directory)[1], [])
+
+    def test_a_concurrent_render_does_not_leave_a_duplicate(self):
+        invoice = self.create_invoice(lines=1)
+        path = invoice_pdf_path(invoice, invoice_pdf_fingerprint(invoice))
+        exists = default_storage.exists
+        checks = []
+
+        # Another request stores the same PDF between our check and our save.
+        def stored_meanwhile(name):
+            checks.append(name)
+            if len(checks) == 1:
+                os.makedirs(os.path.dirname(default_storage.path(path)))
+                with open(default_storage.path(path), "wb") as other:
+                    other.write(b"%PDF concurrent")
+                return False
+            return exists(name)
+
+        with mock.patch.object(default_storage, "exists", side_effect=stored_meanwhile):
+            with open_invoice_pdf(invoice) as pdf:
+                self.assertTrue(pdf.read().startswith(b"%PDF"))
+
+        self.assertEqual(default_storage.listdir(f"{PDF_CACHE_DIR}/{invoice.id}")[1], [path.rsplit("/", 1)[1]])
+
+    def test_matching_etag_returns_not_modified(self):
+        invoice = self.create_invoice(lines=1)
+        etag = self.api.get(f"/api/invoices/{invoice.id}/pdf/")["ETag"]
+
+        response = self.api.get(f"/api/invoices/{invoice.id}/pdf/", HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+
+    def test_editing_the_invoice_changes_the_etag(self):
+        invoice = self.create_invoice(lines=1)
+        etag = self.api.get(f"/api/invoices/{invoice.id}/pdf/")["ETag"]
+
+        InvoiceItem.objects.create(
+            invoice=invoice,
+            item=self.item,
+            quantity=1,
+            price=Decimal("5.00"),
+            gst_rate=Decimal("0"),
+        )
+        response = self.api.get(f"/api/invoices/{invoice.id}/pdf/", HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+
+@override_settings(
+    EMAIL_HOST_USER="sender@example.com",
+    EMAIL_HOST_PASSWORD="app-password",
+    DEFAULT_FROM_EMAIL="sender@example.com",
+    INVOICE_EMAIL_MAX_ATTEMPTS=2,
+)
+class InvoiceEmailOutboxTests(InvoiceAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.use_temp_media_root()
+
+    def test_send_email_is_queued_and_delivered_by_worker(self):
+        invoice = self.create_invoice(lines=1)
+
+        response = self.api.post(f"/api/invoices/{invoice.id}/send-email/")
+
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data["status"], "queued")
+        self.assertEqual(len(mail.outbox), 0)
+
+        call_command("send_queued_emails", "--once", stdout=StringIO())
+
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ["billing@globex.example.com"])
+        status_response = self.api.get(response.data["status_url"])
+        self.assertEqual(status_response.data["status"], "sent")
+        self.assertEqual(status_response.data["attempts"], 1)
+
+    def test_missing_client_email_is_rejected_up_front(self):
+        self.client_obj.email = ""
+        self.client_obj.save()
+        invoice = self.create_invoice(lines=1)
+
+        response = self.api.post(f"/api/invoices/{invoice.id}/send-email/")
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(InvoiceEmail.objects.exists())
+
+    def test_failures_are_retried_with_backoff_then_marked_failed(self):
+        invoice = self.create_invoice(lines=1)
+        outbox = InvoiceEmail.objects.create(invoice=invoice, to_email="billing@globex.example.com")
+
+        with mock.patch("myapp.outbox.build_invoice_email", side_effect=OSError("smtp down")), \
+                self.assertLogs("myapp.outbox", level="ERROR"):
+            process_email_outbox()
+            outbox.refresh_from_db()
+            self.assertEqual(outbox.status, "queued")
+            self.assertEqual(outbox.last_error, "smtp down")
+            self.assertGreater(outbox.next_attempt_at, timezone.now())
+
+            # Not due yet, so the worker leaves it alone.
+            self.assertEqual(process_email_outbox(), [])
+
+            InvoiceEmail.objects.filter(pk=outbox.pk).update(next_attempt_at=timezone.now())
+            process_email_outbox()
+
+        outbox.refresh_from_db()
+        self.assertEqual(outbox.status, "failed")
+        self.assertEqual(outbox.attempts, 2)
+
+
+@override_settings(
+    EMAIL_HOST_USER="sender@example.com",
+    EMAIL_HOST_PASSWORD="app-password",
+    DEFAULT_FROM_EMAIL="sender@example.com",
+)
+class BatchInvoiceEmailTests(InvoiceAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.use_temp_media_root()
+
+    def test_command_sends_matching_invoices_over_one_connection(self):
+        march = [self.create_invoice(lines=1) for _ in range(3)]
+        self.create_invoice(lines=1, invoice_date=date(2026, 4, 2))
+        no_email_client = Client.objects.create(
+            user=self.user,
+            business_name="No Mail Ltd",
+            mobile_number="1",
+            state="Punjab",
+            city="Ludhiana",
+            pincode="141001",
+        )
+        skipped = self.create_invoice(lines=1, client=no_email_client)
+
+        out = StringIO()
+        with mock.patch("myapp.outbox.get_connection", wraps=mail.get_connection) as get_connection:
+            call_command(
+                "send_invoice_emails",
+                "--date-from=2026-03-01",
+                "--date-to=2026-03-31",
+                "--workers=2",
+                stdout=out,
+            )
+
+        self.assertEqual(get_connection.call_count, 1)
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(
+            sorted(message.subject for message in mail.outbox),
+            sorted(f"Invoice {invoice.invoice_no}" for invoice in march),
+        )
+        self.assertIn(f"{skipped.invoice_no}: skipped", out.getvalue())
+        self.assertIn("Sent 3 of 4 invoices.", out.getvalue())
+
+    def test_bulk_endpoint_queues_one_email_per_invoice(self):
+        self.create_invoice(lines=1, status="due")
+        self.create_invoice(lines=1, status="due")
+        self.create_invoice(lines=1, status="cancelled")
+
+        response = self.api.post("/api/invoices/send-emails/", {"status": "due"}, format="json")
+
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data["queued"], 2)
+        self.assertEqual(InvoiceEmail.objects.filter(status="queued").count(), 2)
+        self.assertEqual(len(mail.outbox), 0)
+
+
+class InvoicePdfExportTests(InvoiceAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.use_temp_media_root()
+
+    def test_export_streams_a_zip_of_matching_invoices(self):
+        march = [self.create_invoice(lines=2) for _ in range(4)]
+        self.create_invoice(lines=1, invoice_date=date(2026, 5, 1))
+
+        with override_settings(PDF_EXPORT_WORKERS=3):
+            response = self.api.get("/api/invoices/export-pdf/", {"date_to": "2026-03-31"})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "application/zip")
+        # A thread stands in for the spawned render processes.
+        with ThreadPoolExecutor(max_workers=1) as pool, \
+                mock.patch("myapp.utils.render_pool", return_value=pool) as render_pool:
+            archive = zipfile.ZipFile(BytesIO(b"".join(response.streaming_content)))
+        render_pool.assert_called_with(3)
+        self.assertEqual(
+            sorted(archive.namelist()),
+            sorted(f"invoice-{invoice.invoice_no}.pdf" for invoice in march),
+        )
+        for name in archive.namelist():
+            self.assertTrue(archive.read(name).startswith(b"%PDF"))
+
+    def test_export_only_includes_own_invoices(self):
+        stranger = User.objects.create_user(username="stranger", password="secret-pass-123")
+        other_api = APIClient()
+        other_api.force_authenticate(stranger)
+        self.create_invoice(lines=1)
+
+        response = other_api.get("/api/invoices/export-pdf/")
+
+        archive = zipfile.ZipFile(BytesIO(b"".join(response.streaming_content)))
+        self.assertEqual(archive.namelist(), [])
+
+
+class ReportTests(InvoiceAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.other_client = Client.objects.create(
+            user=self.user,
+            company=self.company,
+            business_name="Initech",
+            mobile_number="7777777777",
+            state="Punjab",
+            city="Ludhiana",
+            pincode="141001",
+        )
+        today = timezone.localdate()
+        # 200.00 + 18% GST = 236.00 per line
+        paid = self.create_invoice(lines=1, invoice_date=today)
+        self.api.post(f"/api/invoices/{paid.id}/payments/", {"amount": "10.00", "payment_method": "cash"})
+        self.create_invoice(lines=2, invoice_date=today - timedelta(days=45), client=self.other_client)
+        self.create_invoice(lines=1, invoice_date=today - timedelta(days=120))
+        self.create_invoice(lines=5, status="cancelled", invoice_date=today)
+
+    def test_summary_totals_and_aging(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.api.get("/api/reports/")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertLessEqual(len(ctx.captured_queries), 3)
+        revenue = response.data["revenue"]
+        self.assertEqual(revenue["invoice_count"], 3)
+        self.assertEqual(revenue["total"], "944.00")
+        self.assertEqual(revenue["gst"], "144.00")
+        self.assertEqual(revenue["paid"], "10.00")
+        self.assertEqual(revenue["outstanding"], "934.00")
+        aging = response.data["aging"]
+        self.assertEqual(aging["current"], "226.00")
+        self.assertEqual(aging["days_31_60"], "472.00")
+        self.assertEqual(aging["days_61_90"], "0.00")
+        self.assertEqual(aging["over_90"], "236.00")
+
+    def test_revenue_grouped_by_client(self):
+        response = self.api.get("/api/reports/revenue/", {"group_by": "client"})
+
+        rows = {row["label"]: row for row in response.data}
+        self.assertEqual(rows["Globex"]["invoice_count"], 2)
+        self.assertEqual(rows["Globex"]["total"], "472.00")
+        self.assertEqual(rows["Initech"]["total"], "472.00")
+
+    def test_gst_by_rate(self):
+        InvoiceItem.objects.create(
+            invoice=Invoice.objects.filter(status="due").first(),
+            item=self.item,
+            quantity=1,
+            price=Decimal("100.00"),
+            gst_rate=Decimal("5.00"),
+        )
+
+        response = self.api.get("/api/reports/gst/", {"group_by": "company"})
+
+        self.assertEqual(
+            [(row["key"], row["gst_rate"], row["taxable_amount"], row["gst_amount"]) for row in response.data],
+            [
+                (str(self.company.id), "5.00", "100.00", "5.00"),
+                (str(self.company.id), "18.00", "800.00", "144.00"),
+            ],
+        )
+
+        response = self.api.get("/api/reports/gst/", {"group_by": "client"})
+
+        self.assertEqual(
+            [(row["label"], row["gst_rate"], row["gst_amount"]) for row in response.data],
+            [("Globex", "5.00", "5.00"), ("Globex", "18.00", "72.00"), ("Initech", "18.00", "72.00")],
+        )
+
+    def test_gst_report_sums_the_rounded_line_gst(self):
+        invoice = Invoice.objects.filter(status="due").first()
+        for _ in range(3):
+            InvoiceItem.objects.create(
+                invoice=invoice, item=self.item, quantity=1, price=Decimal("0.10"), gst_rate=Decimal("5.00")
+            )
+
+        response = self.api.get("/api/reports/gst/", {"group_by": "company"})
+
+        # Each line's 0.005 GST rounds to 0.01, as on the invoice itself.
+        self.assertEqual(
+            [(row["gst_rate"], row["taxable_amount"], row["gst_amount"]) for row in response.data][0],
+            ("5.00", "0.30", "0.03"),
+        )
+
+    def test_aging_grouped_by_month(self):
+        response = self.api.get("/api/reports/aging/", {"group_by": "month"})
+
+        self.assertEqual(sum(Decimal(row["total"]) for row in response.data), Decimal("934.00"))
+        self.assertEqual(response.data, sorted(response.data, key=lambda row: row["key"]))
+
+
+class InvoiceFilterTests(InvoiceAPITestCase):
+    def ids(self, params):
+        response = self.api.get("/api/invoices/", params)
+        self.assertEqual(response.status_code, 200, response.data)
+        return [row["id"] for row in response.data["results"]]
+
+    def test_unpaid_invoices_for_a_client_in_a_month(self):
+        other_client = Client.objects.create(
+            user=self.user,
+            business_name="Initech",
+            mobile_number="7777777777",
+            state="Punjab",
+            city="Ludhiana",
+            pincode="141001",
+        )
+        match = self.create_invoice(lines=1, invoice_date=date(2026, 3, 10))
+        paid = self.create_invoice(lines=1, invoice_date=date(2026, 3, 11))
+        self.api.post(f"/api/invoices/{paid.id}/payments/", {"amount": "236.00", "payment_method": "cash"})
+        self.create_invoice(lines=1, invoice_date=date(2026, 4, 1))
+        self.create_invoice(lines=1, invoice_date=date(2026, 3, 12), client=other_client)
+
+        ids = self.ids(
+            {
+                "client": self.client_obj.id,
+                "payment_status": "pending",
+                "date_from": "2026-03-01",
+                "date_to": "2026-03-31",
+            }
+        )
+
+        self.assertEqual(ids, [match.id])
+
+    def test_amount_range_and_ordering(self):
+        small = self.create_invoice(lines=1)
+        large = self.create_invoice(lines=3)
+        self.create_invoice(lines=0)
+
+        self.assertEqual(self.ids({"min_total": "100", "ordering": "item_total"}), [small.id, large.id])
+        self.assertEqual(self.ids({"max_total": "300", "min_total": "1"}), [small.id])
+
+    def test_search_matches_invoice_no_and_client_name(self):
+        invoice = self.create_invoice(lines=0)
+        self.create_invoice(lines=0)
+
+        self.assertEqual(self.ids({"search": invoice.invoice_no}), [invoice.id])
+        self.assertEqual(len(self.ids({"search": "glob"})), 2)
+
+    def test_invalid_filter_is_rejected(self):
+        response = self.api.get("/api/invoices/", {"payment_status": "bogus"})
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_client_search(self):
+        response = self.api.get("/api/clients/", {"search": "GLOB", "ordering": "business_name"})
+
+        self.assertEqual([row["id"] for row in response.data["results"]], [self.client_obj.id])
+
+
+class BalanceLedgerTests(InvoiceAPITestCase):
+    def balance(self, owner):
+        owner.refresh_from_db()
+        return owner.balance
+
+    def test_ledgers_follow_lines_payments_and_cancellation(self):
+        invoice = self.create_invoice(lines=2)
+        self.create_invoice(lines=1)
+        self.assertEqual(self.balance(self.client_obj).invoiced_total, Decimal("708.00"))
+
+        self.api.post(f"/api/invoices/{invoice.id}/payments/", {"amount": "100.00", "payment_method": "cash"})
+        client_balance = self.balance(self.client_obj)
+        self.assertEqual(client_balance.paid_total, Decimal("100.00"))
+        self.assertEqual(client_balance.outstanding, Decimal("608.00"))
+        self.assertEqual(self.balance(self.company).outstanding, Decimal("608.00"))
+
+        invoice.refresh_from_db()
+        invoice.status = "cancelled"
+        invoice.save()
+        client_balance = self.balance(self.client_obj)
+        self.assertEqual(client_balance.invoice_count, 1)
+        self.assertEqual(client_balance.outstanding, Decimal("236.00"))
+
+    def test_deleting_an_invoice_updates_ledgers(self):
+        invoice = self.create_invoice(lines=1)
+
+        invoice.delete()
+
+        self.assertEqual(self.balance(self.client_obj).invoice_count, 0)
+        self.assertEqual(self.balance(self.company).outstanding, Decimal("0"))
+
+    def test_balances_are_exposed_on_endpoints(self):
+        self.create_invoice(lines=1)
+
+        client = self.api.get(f"/api/clients/{self.client_obj.id}/").data
+        company = self.api.get(f"/api/companies/{self.company.id}/").data
+
+        self.assertEqual(client["balance"]["outstanding"], "236.00")
+        self.assertEqual(company["balance"]["invoice_count"], 1)
+
+    def test_writes_shift_ledgers_instead_of_resumming(self):
+        invoice = self.create_invoice(lines=1)
+        # A concurrent writer's change that a re-sum computed earlier would overwrite.
+        ClientBalance.objects.update(outstanding=F("outstanding") + 1000)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.api.post(f"/api/invoices/{invoice.id}/payments/", {"amount": "36.00", "payment_method": "cash"})
+            invoice.refresh_from_db()
+            invoice.status = "cancelled"
+            invoice.save()
+
+        self.assertFalse([q for q in queries if 'SUM("myapp_invoice".' in q["sql"]])
+        client_balance = self.balance(self.client_obj)
+        self.assertEqual(client_balance.outstanding, Decimal("1000.00"))
+        self.assertEqual(client_balance.paid_total, Decimal("0"))
+        self.assertEqual(client_balance.invoice_count, 0)
+
+    def test_moving_an_invoice_moves_its_contribution(self):
+        other = Client.objects.create(
+            user=self.user, business_name="Initech", mobile_number="1", state="P", city="L", pincode="1"
+        )
+        invoice = self.create_invoice(lines=1)
+        invoice.refresh_from_db()
+
+        invoice.client = other
+        invoice.save()
+
+        self.assertEqual(self.balance(self.client_obj).invoice_count, 0)
+        self.assertEqual(self.balance(self.client_obj).outstanding, Decimal("0"))
+        self.assertEqual(self.balance(other).outstanding, Decimal("236.00"))
+        self.assertEqual(self.balance(self.company).outstanding, Decimal("236.00"))
+
+    def test_deleting_a_client_removes_its_invoices_from_the_company_ledger(self):
+        other = Client.objects.create(
+            user=self.user, business_name="Initech", mobile_number="1", state="P", city="L", pincode="1"
+        )
+        self.create_invoice(lines=1)
+        self.create_invoice(lines=2, client=other)
+
+        other.delete()
+
+        self.assertEqual(self.balance(self.company).invoice_count, 1)
+        self.assertEqual(self.balance(self.company).invoiced_total, Decimal("236.00"))
+
+    def test_rebuild_command_repairs_drift(self):
+        self.create_invoice(lines=1)
+        ClientBalance.objects.update(outstanding=Decimal("1.00"))
+        CompanyBalance.objects.all().delete()
+
+        call_command("rebuild_balances", stdout=StringIO())
+
+        self.assertEqual(self.balance(self.client_obj).outstanding, Decimal("236.00"))
+        self.assertEqual(self.balance(self.company).outstanding, Decimal("236.00"))
+
+
+class PaymentRecordingTests(InvoiceAPITestCase):
+    def pay(self, invoice, amount, key=None):
+        headers = {"HTTP_IDEMPOTENCY_KEY": key} if key else {}
+        return self.api.post(
+            f"/api/invoices/{invoice.id}/payments/",
+            {"amount": amount, "payment_method": "online"},
+            **headers,
+        )
+
+    def test_retry_with_same_idempotency_key_does_not_duplicate(self):
+        invoice = self.create_invoice(lines=1)
+
+        first = self.pay(invoice, "50.00", key="retry-1")
+        second = self.pay(invoice, "50.00", key="retry-1")
+
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second["Idempotent-Replayed"], "true")
+        self.assertEqual(second.data["payment_id"], first.data["payment_id"])
+        self.assertEqual(invoice.payments.count(), 1)
+        invoice.refresh_from_db()
+        self.assertEqual(invoice.total_paid_amount, Decimal("50.00"))
+
+    def test_replay_returns_the_original_totals(self):
+        invoice = self.create_invoice(lines=1)
+        first = self.pay(invoice, "50.00", key="retry-1")
+        self.pay(invoice, "20.00")
+
+        replay = self.pay(invoice, "50.00", key="retry-1")
+
+        self.assertEqual(replay.status_code, 200)
+        self.assertEqual(replay.data["total_paid_amount"], "50.00")
+        self.assertEqual(replay.data["remaining_amount"], "186.00")
+        self.assertEqual(replay.data["payment_status"], "partially_paid")
+        self.assertEqual(str(first.data["remaining_amount"]), "186.00")
+
+    def test_reference_is_stored(self):
+        invoice = self.create_invoice(lines=1)
+
+        self.api.post(
+            f"/api/invoices/{invoice.id}/payments/",
+            {"amount": "10.00", "payment_method": "online", "reference": "UTR-42"},
+        )
+
+        self.assertEqual(invoice.payments.get().reference, "UTR-42")
+
+    def test_overlong_idempotency_key_is_rejected(self):
+        invoice = self.create_invoice(lines=1)
+
+        response = self.pay(invoice, "50.00", key="k" * 101)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(invoice.payments.exists())
+
+    def test_reused_key_with_different_amount_conflicts(self):
+        invoice = self.create_invoice(lines=1)
+        self.pay(invoice, "50.00", key="retry-1")
+
+        response = self.pay(invoice, "60.00", key="retry-1")
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(invoice.payments.count(), 1)
+
+    def test_overpayment_is_rejected(self):
+        invoice = self.create_invoice(lines=1)
+        self.pay(invoice, "200.00")
+
+        response = self.pay(invoice, "36.01")
+
+        self.assertEqual(response.status_code, 400)
+        invoice.refresh_from_db()
+        self.assertEqual(invoice.total_paid_amount, Decimal("200.00"))
+        self.assertEqual(invoice.payment_status, "partially_paid")
+
+        self.assertEqual(self.pay(invoice, "36.00").data["payment_status"], "paid")
+
+
+class PaymentImportTests(InvoiceAPITestCase):
+    def test_json_import_reports_each_row(self):
+        first = self.create_invoice(lines=1)
+        second = self.create_invoice(lines=1)
+        rows = [
+            {"invoice_no": first.invoice_no, "amount": "100.00", "method": "online", "reference": "TX1"},
+            {"invoice_no": first.invoice_no, "amount": "136.00", "method": "cash", "reference": "TX2"},
+            {"invoice_no": first.invoice_no, "amount": "0.01", "method": "cash", "reference": "TX3"},
+            {"invoice_no": second.invoice_no, "amount": "36.00", "method": "online", "reference": "TX4"},
+            {"invoice_no": "NOPE-2026-0001", "amount": "1.00", "method": "cash"},
+            {"invoice_no": second.invoice_no, "amount": "-5", "method": "cash"},
+        ]
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.api.post("/api/invoices/payments/import/", rows, format="json")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [row["status"] for row in response.data["rows"]],
+            ["created", "created", "error", "created", "error", "error"],
+        )
+        self.assertEqual(response.data["created"], 3)
+        self.assertEqual(len([q for q in queries if q["sql"].startswith("INSERT") and "myapp_payment" in q["sql"]]), 1)
+
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual((first.total_paid_amount, first.remaining_amount, first.payment_status), (Decimal("236.00"), Decimal("0.00"), "paid"))
+        self.assertEqual((second.total_paid_amount, second.payment_status), (Decimal("36.00"), "partially_paid"))
+        self.assertEqual(ClientBalance.objects.get(client=self.client_obj).paid_total, Decimal("272.00"))
+
+    def test_reimporting_csv_skips_posted_references(self):
+        invoice = self.create_invoice(lines=1)
+        statement = f"invoice_no,amount,method,reference\n{invoice.invoice_no},50.00,online,BANK-1\n"
+
+        def upload():
+            return self.api.post(
+                "/api/invoices/payments/import/",
+                {"file": SimpleUploadedFile("statement.csv", statement.encode())},
+                format="multipart",
+            )
+
+        self.assertEqual(upload().data["created"], 1)
+        response = upload()
+
+        self.assertEqual(response.data["duplicate"], 1)
+        self.assertEqual(invoice.payments.get().reference, "BANK-1")
+        invoice.refresh_from_db()
+        self.assertEqual(invoice.total_paid_amount, Decimal("50.00"))
+
+    def test_csv_upload_stops_reading_at_the_row_cap(self):
+        invoice = self.create_invoice(lines=1)
+        statement = "invoice_no,amount,method,reference\n" + "".join(
+            f"{invoice.invoice_no},1.00,online,BANK-{n}\n" for n in range(3)
+        )
+
+        with mock.patch("myapp.views.MAX_IMPORT_ROWS", 2):
+            response = self.api.post(
+                "/api/invoices/payments/import/",
+                {"file": SimpleUploadedFile("statement.csv", statement.encode())},
+                format="multipart",
+            )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("At most 2 rows", response.data["detail"])
+        self.assertFalse(invoice.payments.exists())
+
+    def test_other_tenants_invoices_are_not_matched(self):
+        invoice = self.create_invoice(lines=1)
+        other = User.objects.create_user(username="other", password="x")
+        self.api.force_authenticate(other)
+
+        response = self.api.post(
+            "/api/invoices/payments/import/",
+            [{"invoice_no": invoice.invoice_no, "amount": "10.00", "method": "cash"}],
+            format="json",
+        )
+
+        self.assertEqual(response.data["rows"][0]["status"], "error")
+        self.assertFalse(invoice.payments.exists())
+
+    def test_management_command(self):
+        invoice = self.create_invoice(lines=1)
+        with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as handle:
+            handle.write(f'[{{"invoice_no": "{invoice.invoice_no}", "amount": "236.00", "method": "cash"}}]')
+
+        out = StringIO()
+        call_command("import_payments", handle.name, user=self.user.username, stdout=out)
+
+        self.assertIn("Posted 1 of 1 payments.", out.getvalue())
+        invoice.refresh_from_db()
+        self.assertEqual(invoice.payment_status, "paid")
+
+
+class ExportTests(InvoiceAPITestCase):
+    def export(self, kind, **params):
+        response = self.api.get(f"/api/exports/{kind}/", params)
+        self.assertEqual(response.status_code, 200)
+        return response, b"".join(response.streaming_content).decode()
+
+    def test_invoice_csv_export(self):
+        invoice = self.create_invoice(lines=2)
+        User.objects.create_user(username="other", password="x")
+
+        response, body = self.export("invoices")
+
+        self.assertEqual(response["Content-Type"], "text/csv")
+        rows = list(csv.DictReader(StringIO(body)))
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]["invoice_no"], invoice.invoice_no)
+        self.assertEqual(rows[0]["client"], "Globex")
+        self.assertEqual(rows[0]["item_total"], "472.00")
+
+    def test_payments_jsonl_export_is_tenant_scoped(self):
+        invoice = self.create_invoice(lines=1, payments=2)
+        other = User.objects.create_user(username="other", password="x")
+        self.api.force_authenticate(other)
+        self.assertEqual(self.export("payments", output="jsonl")[1], "")
+
+        self.api.force_authenticate(self.user)
+        response, body = self.export("payments", output="jsonl")
+
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        rows = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual([row["invoice_no"] for row in rows], [invoice.invoice_no] * 2)
+
+    def test_export_streams_in_chunks(self):
+        invoice = self.create_invoice(lines=5)
+        columns, rows = export_queryset("invoice-items", Invoice.objects.filter(pk=invoice.pk))
+
+        chunks = list(stream_csv(columns, rows, chunk_size=2))
+
+        self.assertEqual(len(chunks), 3)
+        self.assertEqual(len("".join(chunks).splitlines()), 6)
+
+    def test_filters_apply_to_child_exports(self):
+        self.create_invoice(lines=1, status="paid")
+        self.create_invoice(lines=3, status="due")
+
+        _, body = self.export("invoice-items", status="due")
+
+        self.assertEqual(len(body.splitlines()), 4)
+
+
+class RecordImportTests(InvoiceAPITestCase):
+    def upload(self, kind, content):
+        return self.api.post(
+            f"/api/{kind}/import/",
+            {"file": SimpleUploadedFile(f"{kind}.csv", content.encode())},
+            format="multipart",
+        )
+
+    def test_item_import_upserts_and_reports_bad_rows(self):
+        content = (
+            "item_code,item_name,gst_rate,quantity,price\n"
+            "SKU-1,Renamed Widget,12,1,150.00\n"
+            "SKU-2,Gadget,18,1,20.00\n"
+            "SKU-3,Broken,18,1,not-a-price\n"
+            "SKU-2,Gadget again,18,1,25.00\n"
+        )
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.upload("items", content)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data["created"], response.data["updated"]), (1, 1))
+        self.assertEqual([error["row"] for error in response.data["errors"]], [4, 5])
+        self.assertIn("price", response.data["errors"][0]["errors"])
+        self.assertLessEqual(len(queries), 6)
+
+        self.item.refresh_from_db()
+        self.assertEqual((self.item.item_name, self.item.price), ("Renamed Widget", Decimal("150.00")))
+        self.assertEqual(Item.objects.get(user=self.user, item_code="SKU-2").price, Decimal("20.00"))
+
+    def test_client_import_checks_company_ownership(self):
+        other = User.objects.create_user(username="other", password="x")
+        foreign = Company.objects.create(
+            user=other, owner_name="O", business_name="Other Co", email="o@example.com",
+            mobile_number="1", state="S", city="C", pincode="1",
+        )
+        content = (
+            "business_name,company,email,mobile_number,state,city,pincode\n"
+            f"Initech,{self.company.id},,555,Punjab,Ludhiana,141001\n"
+            f"Hooli,{foreign.id},,555,Punjab,Ludhiana,141001\n"
+            "Globex,,new@globex.example.com,777,Punjab,Ludhiana,141001\n"
+        )
+
+        response = self.upload("clients", content)
+
+        self.assertEqual((response.data["created"], response.data["updated"]), (1, 1))
+        self.assertEqual(response.data["errors"][0]["row"], 3)
+        initech = Client.objects.get(user=self.user, business_name="Initech")
+        self.assertEqual((initech.company, initech.email), (self.company, None))
+        self.client_obj.refresh_from_db()
+        self.assertEqual(self.client_obj.email, "new@globex.example.com")
+        self.assertIsNone(self.client_obj.company)
+
+    def test_matched_rows_only_need_the_columns_they_change(self):
+        response = self.upload("items", "item_code,price\nSKU-1,75.00\nSKU-NEW,5.00\n")
+
+        self.assertEqual((response.data["created"], response.data["updated"]), (0, 1))
+        self.assertEqual(response.data["errors"][0]["row"], 3)
+        self.assertIn("item_name", response.data["errors"][0]["errors"])
+        self.item.refresh_from_db()
+        self.assertEqual((self.item.item_name, self.item.price), ("Widget", Decimal("75.00")))
+
+    def test_missing_key_column_is_rejected(self):
+        response = self.upload("items", "item_name,price\nWidget,1\n")
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_codes_shared_by_existing_items_are_reported_not_guessed(self):
+        response = self.api.post(
+            "/api/items/",
+            {"item_code": "SKU-1", "item_name": "Dup", "gst_rate": "18", "quantity": 1, "price": "1.00"},
+        )
+        self.assertEqual(response.status_code, 201)
+
+        response = self.upload("items", "item_code,item_name,gst_rate,quantity,price\nSKU-1,New,18,1,5.00\n")
+
+        self.assertEqual((response.data["created"], response.data["updated"]), (0, 0))
+        self.assertIn("2 existing records", response.data["errors"][0]["errors"]["item_code"][0])
+        self.assertEqual(
+            sorted(Item.objects.filter(user=self.user, item_code="SKU-1").values_list("item_name", flat=True)),
+            ["Dup", "Widget"],
+        )
+
+    def test_database_errors_reject_only_the_offending_rows(self):
+        bulk_create = Item.objects.bulk_create
+
+        def failing_bulk_create(objs, **kwargs):
+            if any(obj.item_code == "SKU-BAD" for obj in objs):
+                raise IntegrityError("simulated")
+            return bulk_create(objs, **kwargs)
+
+        content = (
+            "item_code,item_name,gst_rate,quantity,price\n"
+            "SKU-1,Renamed Widget,12,1,150.00\n"
+            "SKU-BAD,Bad,18,1,1.00\n"
+            "SKU-2,Gadget,18,1,20.00\n"
+        )
+        with mock.patch.object(Item.objects, "bulk_create", side_effect=failing_bulk_create):
+            response = self.upload("items", content)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data["created"], response.data["updated"]), (1, 1))
+        self.assertEqual([error["row"] for error in response.data["errors"]], [3])
+        self.assertFalse(Item.objects.filter(item_code="SKU-BAD").exists())
+
+    def test_management_command(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False) as handle:
+            handle.write("item_code,item_name,gst_rate,quantity,price\nSKU-9,Nine,5,1,9.00\n")
+
+        out = StringIO()
+        call_command("import_records", "items", handle.name, user=self.user.username, stdout=out)
+
+        self.assertIn("1 created, 0 updated, 0 rejected.", out.getvalue())
+
+
+@override_settings(TENANT_CACHE_ENABLED=True)
+class TenantCacheTests(InvoiceAPITestCase):
+    def post_invoice(self, **overrides):
+        payload = {
+            "company": self.company.id,
+            "client": self.client_obj.id,
+            "selected_template": "classic",
+            "invoice_date": "2026-03-01",
+            "status": "due",
+            **overrides,
+        }
+        return self.api.post("/api/invoices/", payload, format="json")
+
+    def reference_selects(self, queries):
+        tables = ('"myapp_company"', '"myapp_client"')
+        return [q["sql"] for q in queries if q["sql"].startswith("SELECT") and q["sql"].split(" WHERE")[0].endswith(tables)]
+
+    def test_repeat_creates_reuse_cached_company_and_client(self):
+        reset_cache_stats()
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.post_invoice().status_code, 201)
+        self.assertEqual(len(self.reference_selects(queries)), 2)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.post_invoice().status_code, 201)
+
+        self.assertEqual(self.reference_selects(queries), [])
+        self.assertEqual(cache_stats()["company"], {"hits": 1, "misses": 1})
+
+    def test_saving_a_row_invalidates_the_tenant(self):
+        self.assertEqual(get_tenant_object(Item, self.user.id, self.item.id).price, Decimal("100.00"))
+
+        self.api.patch(f"/api/items/{self.item.id}/", {"price": "120.00"})
+
+        self.assertEqual(get_tenant_object(Item, self.user.id, self.item.id).price, Decimal("120.00"))
+
+    @override_settings(TENANT_CACHE_ENABLED=False)
+    def test_without_a_shared_cache_rows_are_read_from_the_database(self):
+        self.assertEqual(self.post_invoice().status_code, 201)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.post_invoice().status_code, 201)
+
+        self.assertEqual(len(self.reference_selects(queries)), 2)
+
+    def test_other_tenants_rows_are_not_resolved(self):
+        other = User.objects.create_user(username="other", password="x")
+        self.api.force_authenticate(other)
+
+        response = self.post_invoice()
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("company", response.data)
+        self.assertIsNone(get_tenant_object(Company, other.id, self.company.id))
+
+
+class ConditionalRequestTests(InvoiceAPITestCase):
+    def test_unchanged_invoice_returns_304_with_one_query(self):
+        invoice = self.create_invoice(lines=2)
+        url = f"/api/invoices/{invoice.id}/"
+        etag = self.api.get(url)["ETag"]
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.api.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(len(queries), 1)
+
+    def test_child_writes_change_the_etag(self):
+        invoice = self.create_invoice(lines=1)
+        url = f"/api/invoices/{invoice.id}/"
+
+        etag = self.api.get(url)["ETag"]
+        self.api.post(f"/api/invoices/{invoice.id}/payments/", {"amount": "10.00", "payment_method": "cash"})
+        self.assertEqual(self.api.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        etag = self.api.get(url)["ETag"]
+        self.api.patch(f"/api/items/{self.item.id}/", {"item_name": "Renamed"})
+        response = self.api.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["invoice_items"][0]["item_name"], "Renamed")
+
+    def test_renaming_a_client_leaves_its_invoices_untouched(self):
+        invoice = self.create_invoice(lines=1)
+        url = f"/api/invoices/{invoice.id}/"
+        updated_at = Invoice.objects.get(pk=invoice.pk).updated_at
+        etag = self.api.get(url)["ETag"]
+        list_etag = self.api.get("/api/invoices/")["ETag"]
+
+        self.api.patch(f"/api/clients/{self.client_obj.id}/", {"business_name": "Renamed Client"})
+
+        self.assertEqual(Invoice.objects.get(pk=invoice.pk).updated_at, updated_at)
+        response = self.api.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["client_name"], "Renamed Client")
+        self.assertEqual(self.api.get("/api/invoices/", HTTP_IF_NONE_MATCH=list_etag).status_code, 200)
+
+    def test_deleting_a_payment_changes_the_etag(self):
+        invoice = self.create_invoice(lines=1)
+        self.api.post(f"/api/invoices/{invoice.id}/payments/", {"amount": "50.00", "payment_method": "cash"})
+        url = f"/api/invoices/{invoice.id}/"
+        etag = self.api.get(url)["ETag"]
+
+        Payment.objects.filter(invoice=invoice).delete()
+
+        response = self.api.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["total_paid_amount"], "0.00")
+        self.assertEqual(str(response.data["remaining_amount"]), response.data["item_total"])
+        self.assertEqual(response.data["payment_status"], "pending")
+        self.client_obj.refresh_from_db()
+        self.assertEqual(self.client_obj.balance.paid_total, Decimal("0"))
+        self.assertEqual(self.client_obj.balance.outstanding, Decimal("236.00"))
+
+    def test_if_modified_since(self):
+        invoice = self.create_invoice(lines=1)
+        url = f"/api/invoices/{invoice.id}/"
+        last_modified = self.api.get(url)["Last-Modified"]
+
+        self.assertEqual(self.api.get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+
+        Invoice.objects.filter(pk=invoice.pk).update(updated_at=timezone.now() + timedelta(seconds=5))
+        self.assertEqual(self.api.get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 200)
+
+    def test_list_etag_tracks_changes_and_deletes(self):
+        self.create_invoice(lines=1)
+        doomed = self.create_invoice(lines=1)
+        etag = self.api.get("/api/invoices/")["ETag"]
+
+        self.assertEqual(self.api.get("/api/invoices/", HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(
+            self.api.get("/api/invoices/", {"fields": "id"}, HTTP_IF_NONE_MATCH=etag).status_code, 200
+        )
+
+        doomed.delete()
+        self.assertEqual(self.api.get("/api/invoices/", HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class PerformanceMiddlewareTests(InvoiceAPITestCase):
+    def setUp(self):
+        super().setUp()
+        registry.reset()
+
+    def test_server_timing_reports_queries(self):
+        self.create_invoice(lines=1)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.api.get("/api/invoices/")
+
+        self.assertIn(f'desc="{len(queries)} queries"', response["Server-Timing"])
+        self.assertIn("render;dur=", response["Server-Timing"])
+
+    def test_render_timing_includes_serialization(self):
+        invoice = self.create_invoice(lines=1)
+        to_representation = InvoiceSerializer.to_representation
+
+        def slow(serializer, instance):
+            time.sleep(0.05)
+            return to_representation(serializer, instance)
+
+        for url in (f"/api/invoices/{invoice.id}/", "/api/invoices/"):
+            with mock.patch.object(InvoiceSerializer, "to_representation", slow):
+                response = self.api.get(url)
+
+            render = float(re.search(r"render;dur=([\d.]+)", response["Server-Timing"]).group(1))
+            self.assertGreaterEqual(render, 50, url)
+
+    @override_settings(METRICS_TOKEN="scrape-me")
+    def test_metrics_endpoint(self):
+        self.api.get("/api/invoices/")
+        self.api.force_authenticate(None)
+
+        self.assertEqual(self.api.get("/metrics").status_code, 403)
+        response = self.api.get("/metrics", HTTP_AUTHORIZATION="Bearer scrape-me")
+
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        self.assertIn('http_requests_total{route="invoice-list",method="GET",status="200"} 1', body)
+        self.assertIn('http_request_duration_seconds_count{route="invoice-list",method="GET"} 1', body)
+
+    @override_settings(PERFORMANCE_QUERY_BUDGETS={"invoice-list": 0})
+    def test_query_budget_is_flagged(self):
+        with self.assertLogs("myapp.middleware", "WARNING") as logs:
+            self.api.get("/api/invoices/")
+        self.api.get("/api/clients/")
+
+        self.assertIn("invoice-list", logs.output[0])
+        self.assertIn('http_query_budget_exceeded_total{route="invoice-list",method="GET"} 1', registry.render())
+        self.assertIn('http_query_budget_exceeded_total{route="client-list",method="GET"} 0', registry.render())
+
+
+class BenchmarkCommandTests(TestCase):
+    def run_benchmark(self, output, **options):
+        call_command(
+            "benchmark_api",
+            tenants=1, clients=2, items=2, invoices=4, lines=3, repeat=1,
+            output=output, stdout=StringIO(), **options,
+        )
+        with open(output) as handle:
+            return json.load(handle)
+
+    def test_report_covers_hot_paths_and_compares_to_baseline(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+
+        report = self.run_benchmark(f"{directory}/first.json")
+
+        self.assertEqual(
+            set(report["scenarios"]),
+            {"invoice_list", "invoice_list_expanded", "invoice_detail", "line_create",
+             "payment_post", "pdf_render", "email_prepare"},
+        )
+        self.assertEqual(
+            report["meta"]["dataset"],
+            {"tenants": 1, "clients": 2, "items": 2, "invoices": 4, "invoice_items": 12, "payments": 1},
+        )
+        # Scenario writes are rolled back so the next run sees the same data.
+        self.assertEqual(InvoiceItem.objects.count(), 12)
+        self.assertEqual(Payment.objects.filter(amount=Decimal("0.01")).count(), 0)
+
+        second = self.run_benchmark(f"{directory}/second.json", baseline=f"{directory}/first.json", cleanup=True)
+
+        for name, row in report["scenarios"].items():
+            self.assertEqual(row["queries"], second["scenarios"][name]["queries"], name)
+        self.assertFalse(Invoice.objects.exists())
+
+
+class PdfTemplateTests(InvoiceAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.use_temp_media_root()
+
+    def test_selected_template_is_used_and_unknown_falls_back(self):
+        self.assertIs(get_template("modern"), TEMPLATES["modern"])
+        self.assertIs(get_template("no-such-template"), TEMPLATES[DEFAULT_TEMPLATE])
+
+        invoice = self.create_invoice(lines=1, selected_template="modern")
+        with mock.patch.object(TEMPLATES["modern"], "build", wraps=TEMPLATES["modern"].build) as build:
+            pdf = generate_invoice_pdf(invoice).getvalue()
+
+        self.assertTrue(pdf.startswith(b"%PDF"))
+        build.assert_called_once()
+
+    def test_styles_are_compiled_once(self):
+        template = TEMPLATES["classic"]
+        invoice = self.create_invoice(lines=1)
+        generate_invoice_pdf(invoice)
+        styles, table_style = template.styles, template.table_style
+
+        generate_invoice_pdf(invoice)
+
+        self.assertIs(template.styles, styles)
+        self.assertIs(template.table_style, table_style)
+
+    def test_company_stamp_is_decoded_once(self):
+        image = BytesIO()
+        PILImage.new("RGB", (40, 20), "red").save(image, format="PNG")
+        self.company.stamp.save("stamp.png", ContentFile(image.getvalue()))
+        invoice = self.create_invoice(lines=1)
+
+        with mock.patch("myapp.pdf_templates.ImageReader", wraps=ImageReader) as reader, \
+                mock.patch.object(type(self.company.stamp), "size", new_callable=mock.PropertyMock) as size:
+            generate_invoice_pdf(invoice)
+            generate_invoice_pdf(invoice)
+
+        self.assertEqual(reader.call_count, 1)
+        size.assert_not_called()
+
+    def test_template_change_changes_pdf_fingerprint(self):
+        invoice = self.create_invoice(lines=1)
+        before = invoice_pdf_fingerprint(invoice)
+
+        invoice.selected_template = "minimal"
+
+        self.assertNotEqual(invoice_pdf_fingerprint(invoice), before)
+
+
+class LargeInvoicePdfTests(InvoiceAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.use_temp_media_root()
+
+    def add_lines(self, invoice, count):
+        InvoiceItem.objects.bulk_create(
+            InvoiceItem(invoice=invoice, item=self.item, quantity=1, price=Decimal("1.00"), gst_rate=Decimal("0"))
+            for _ in range(count)
+        )
+
+    def test_lines_are_split_into_page_sized_tables(self):
+        invoice = self.create_invoice(lines=0)
+        self.add_lines(invoice, 250)
+
+        with mock.patch("myapp.pdf_templates.Table", wraps=Table) as table:
+            pdf = generate_invoice_pdf(invoice).getvalue()
+
+        rows = [len(call.args[0]) - 1 for call in table.call_args_list]
+        self.assertEqual(sum(rows), 250)
+        self.assertGreater(len(rows), 5)
+        self.assertLessEqual(max(rows), 45)
+        self.assertGreater(pdf.count(b"/Type /Page\n"), 5)
+
+    def test_long_item_names_wrap_and_shrink_the_chunk(self):
+        self.item.item_name = "Industrial grade stainless steel fastener assortment " * 2
+        self.item.save()
+        invoice = self.create_invoice(lines=0)
+        self.add_lines(invoice, 60)
+
+        with mock.patch("myapp.pdf_templates.Table", wraps=Table) as table:
+            generate_invoice_pdf(invoice)
+
+        rows = [len(call.args[0]) - 1 for call in table.call_args_list]
+        heights = [height for call in table.call_args_list for height in call.kwargs["rowHeights"][1:]]
+        self.assertEqual(sum(rows), 60)
+        self.assertGreater(min(heights), LINE_ROW_HEIGHT)
+        self.assertLess(max(rows), 45)
+
+    def test_fingerprint_does_not_read_the_lines(self):
+        invoice = self.create_invoice(lines=0)
+        self.add_lines(invoice, 50)
+        invoice = Invoice.objects.select_related("company", "client").get(pk=invoice.pk)
+
+        with CaptureQueriesContext(connection) as queries:
+            before = invoice_pdf_fingerprint(invoice)
+        self.assertEqual(len(queries), 1)
+
+        self.api.patch(f"/api/items/{self.item.id}/", {"item_name": "Renamed"})
+        self.assertNotEqual(invoice_pdf_fingerprint(invoice), before)
+
+    def test_pdf_view_streams_from_a_file_without_prefetching_lines(self):
+        invoice = self.create_invoice(lines=0)
+        self.add_lines(invoice, 120)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.api.get(f"/api/invoices/{invoice.id}/pdf/")
+            pdf = b"".join(response.streaming_content)
+
+        self.assertIsInstance(response, FileResponse)
+        self.assertTrue(pdf.startswith(b"%PDF"))
+        self.assertIn('filename="invoice-', response["Content-Disposition"])
+        self.assertFalse([q for q in queries if "myapp_invoiceitem" in q["sql"] and '"invoice_id" IN' in q["sql"]])
+
+
+@override_settings(
+    EMAIL_HOST_USER="sender@example.com",
+    EMAIL_HOST_PASSWORD="app-password",
+    DEFAULT_FROM_EMAIL="sender@example.com",
+)
+class RecurringInvoiceTests(InvoiceAPITestCase):
+    def create_schedule(self, start_date=date(2026, 1, 31), **kwargs):
+        schedule = RecurringInvoice.objects.create(
+            user=self.user,
+            company=self.company,
+            client=self.client_obj,
+            start_date=start_date,
+            next_run_date=start_date,
+            **kwargs,
+        )
+        RecurringInvoiceLine.objects.create(schedule=schedule, item=self.item, quantity=2)
+        RecurringInvoiceLine.objects.create(
+            schedule=schedule, item=self.item, quantity=1, price=Decimal("50.00"), gst_rate=Decimal("0")
+        )
+        return schedule
+
+    def test_schedule_is_created_with_lines_through_the_api(self):
+        other = User.objects.create_user(username="other", password="secret-pass-123")
+        foreign_item = Item.objects.create(
+            user=other, item_code="X", item_name="X", gst_rate=Decimal("0"), quantity=1, price=Decimal("1.00")
+        )
+        payload = {
+            "company": self.company.id,
+            "client": self.client_obj.id,
+            "interval": "monthly",
+            "start_date": "2026-02-01",
+            "lines": [{"item": self.item.id, "quantity": 3}],
+        }
+
+        response = self.api.post("/api/recurring-invoices/", payload, format="json")
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(response.data["next_run_date"], "2026-02-01")
+        self.assertEqual(response.data["lines"][0]["item_name"], "Widget")
+        schedule = RecurringInvoice.objects.get(pk=response.data["id"])
+        self.assertEqual(schedule.user, self.user)
+
+        payload["lines"] = [{"item": foreign_item.id, "quantity": 1}]
+        response = self.api.post("/api/recurring-invoices/", payload, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("lines", response.data)
+
+        response = self.api.patch(
+            f"/api/recurring-invoices/{schedule.id}/",
+            {"lines": [{"item": self.item.id, "quantity": 5}]},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(list(schedule.lines.values_list("quantity", flat=True)), [5])
+
+    def test_due_schedules_become_invoices_with_final_totals(self):
+        schedule = self.create_schedule(send_email=True)
+        self.create_schedule(start_date=date(2026, 2, 15))
+        year = timezone.now().year
+
+        report = generate_due_invoices(today=date(2026, 1, 31))
+
+        self.assertEqual(report, {"schedules": 1, "invoices": 1, "emails_queued": 1, "emails_skipped": 0})
+        invoice = Invoice.objects.get()
+        self.assertEqual(invoice.invoice_no, f"INV-{year}-0001")
+        self.assertEqual(invoice.invoice_date, date(2026, 1, 31))
+        self.assertEqual(invoice.item_subtotal_amount, Decimal("250.00"))
+        self.assertEqual(invoice.item_total, Decimal("286.00"))
+        self.assertEqual(invoice.remaining_amount, Decimal("286.00"))
+        self.assertEqual(invoice.payment_status, "pending")
+        self.assertEqual(invoice.invoice_items.count(), 2)
+        self.assertEqual(ClientBalance.objects.get(client=self.client_obj).outstanding, Decimal("286.00"))
+        self.assertEqual(InvoiceEmail.objects.get().invoice, invoice)
+        self.assertEqual(invoice.activities.get().event, f"Invoice created from recurring schedule #{schedule.id}")
+
+        schedule.refresh_from_db()
+        self.assertEqual(schedule.next_run_date, date(2026, 2, 28))
+        self.assertIsNotNone(schedule.last_run_at)
+
+        # Nothing is due again until the next run date.
+        self.assertEqual(generate_due_invoices(today=date(2026, 2, 1))["invoices"], 0)
+
+    def test_missed_runs_are_caught_up_and_finished_schedules_deactivated(self):
+        schedule = self.create_schedule(end_date=date(2026, 4, 15))
+
+        report = generate_due_invoices(today=date(2026, 6, 1), send_email=False)
+
+        self.assertEqual(report["invoices"], 3)
+        self.assertEqual(
+            list(Invoice.objects.order_by("invoice_date").values_list("invoice_date", flat=True)),
+            [date(2026, 1, 31), date(2026, 2, 28), date(2026, 3, 31)],
+        )
+        self.assertEqual(len(set(Invoice.objects.values_list("invoice_no", flat=True))), 3)
+        self.assertFalse(InvoiceEmail.objects.exists())
+        schedule.refresh_from_db()
+        self.assertFalse(schedule.is_active)
+
+    def test_numbers_are_reserved_outside_the_batch_transaction(self):
+        self.create_schedule()
+        self.create_schedule()
+        reserve = InvoiceSequence.reserve_numbers
+        depths = []
+
+        def record_depth(*args, **kwargs):
+            depths.append(len(connection.atomic_blocks))
+            return reserve(*args, **kwargs)
+
+        depth = len(connection.atomic_blocks)
+        with mock.patch.object(InvoiceSequence, "reserve_numbers", side_effect=record_depth):
+            report = generate_due_invoices(today=date(2026, 2, 28), send_email=False)
+
+        self.assertEqual(report["invoices"], 4)
+        # One block for the whole batch, taken before the batch transaction opens.
+        self.assertEqual(depths, [depth])
+        self.assertEqual(len(set(Invoice.objects.values_list("invoice_no", flat=True))), 4)
+
+    def test_query_count_does_not_grow_with_schedules(self):
+        def run(count, today):
+            for _ in range(count):
+                self.create_schedule(start_date=today)
+            with CaptureQueriesContext(connection) as queries:
+                generate_due_invoices(today=today)
+            return len(queries)
+
+        run(1, date(2026, 5, 1))  # Creates the number sequence row.
+        self.assertEqual(run(2, date(2026, 5, 2)), run(20, date(2026, 5, 3)))
+        self.assertEqual(Invoice.objects.count(), 23)
+
+    def test_command_reports_generated_invoices(self):
+        self.create_schedule()
+        out = StringIO()
+
+        call_command("generate_recurring_invoices", "--date", "2026-02-28", "--no-email", stdout=out)
+
+        self.assertIn("2 invoices from 1 schedules", out.getvalue())
+        self.assertFalse(InvoiceEmail.objects.exists())
+
+
+@override_settings(
+    EMAIL_HOST_USER="sender@example.com",
+    EMAIL_HOST_PASSWORD="app-password",
+    DEFAULT_FROM_EMAIL="sender@example.com",
+)
+class ActivityLogTests(InvoiceAPITestCase):
+    def events(self, invoice_id):
+        return list(Activity.objects.filter(invoice_id=invoice_id).order_by("id").values_list("event", flat=True))
+
+    def test_lifecycle_events_are_logged_and_paginated_newest_first(self):
+        self.use_temp_media_root()
+        with self.run_on_commit():
+            response = self.api.post(
+                "/api/invoices/",
+                {
+                    "company": self.company.id,
+                    "client": self.client_obj.id,
+                    "selected_template": "classic",
+                    "invoice_date": "2026-03-01",
+                    "status": "due",
+                },
+                format="json",
+            )
+            invoice_id = response.data["id"]
+            self.api.post(
+                "/api/invoice-items/",
+                {"invoice": invoice_id, "item": self.item.id, "quantity": 1, "price": "100.00", "gst_rate": "18.00"},
+                format="json",
+            )
+            self.api.post(f"/api/invoices/{invoice_id}/payments/", {"amount": "118.00", "payment_method": "cash"})
+            self.api.patch(f"/api/invoices/{invoice_id}/", {"status": "paid"}, format="json")
+            b"".join(self.api.get(f"/api/invoices/{invoice_id}/pdf/").streaming_content)
+            self.api.post(f"/api/invoices/{invoice_id}/send-email/")
+            process_email_outbox()
+        flush_activities()
+
+        self.assertEqual(
+            self.events(invoice_id),
+            [
+                "Invoice created",
+                "Line added: 1 x Widget",
+                "Payment of 118.00 recorded (cash)",
+                "Invoice locked",
+                "PDF downloaded",
+                "Email sent to billing@globex.example.com",
+            ],
+        )
+
+        first = self.api.get(f"/api/invoices/{invoice_id}/activities/?page_size=4")
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(
+            [row["event"] for row in first.data["results"]],
+            ["Email sent to billing@globex.example.com", "PDF downloaded", "Invoice locked", "Payment of 118.00 recorded (cash)"],
+        )
+        second = self.api.get(first.data["next"])
+        self.assertEqual([row["event"] for row in second.data["results"]], ["Line added: 1 x Widget", "Invoice created"])
+
+        # The invoice list's ordering filter does not apply to the log.
+        ordered = self.api.get(f"/api/invoices/{invoice_id}/activities/?page_size=4&ordering=item_total")
+        self.assertEqual(ordered.status_code, 200)
+        self.assertEqual(ordered.data["results"], first.data["results"])
+
+    def test_rolled_back_writes_leave_no_events(self):
+        invoice = self.create_invoice(lines=0)
+
+        with self.run_on_commit():
+            try:
+                with transaction.atomic():
+                    InvoiceItem.objects.create(
+                        invoice=invoice, item=self.item, quantity=1, price=Decimal("1.00"), gst_rate=Decimal("0")
+                    )
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+        flush_activities()
+
+        self.assertEqual(self.events(invoice.id), ["Invoice created"])
+
+    def test_events_are_buffered_until_a_flush(self):
+        invoice = self.create_invoice(lines=0)
+
+        with self.assertNumQueries(0), self.run_on_commit():
+            record_activity(invoice.id, "Reviewed")
+            record_activity(invoice.id, "Reviewed again")
+        self.assertEqual(self.events(invoice.id), ["Invoice created"])
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(flush_activities(), 2)
+        statements = [q["sql"].split()[0] for q in queries if "SAVEPOINT" not in q["sql"]]
+        self.assertEqual(statements, ["SELECT", "INSERT"])
+        self.assertEqual(self.events(invoice.id), ["Invoice created", "Reviewed", "Reviewed again"])
+
+    @override_settings(ACTIVITY_BUFFER_SIZE=3)
+    def test_buffer_is_flushed_when_full_or_stale(self):
+        invoice = self.create_invoice(lines=0)
+
+        with self.run_on_commit():
+            record_activity(invoice.id, "one")
+            record_activity(invoice.id, "two")
+        self.assertEqual(len(self.events(invoice.id)), 1)
+        with self.run_on_commit():
+            record_activity(invoice.id, "three")
+        self.assertEqual(len(self.events(invoice.id)), 4)
+
+        with self.run_on_commit():
+            record_activity(invoice.id, "four")
+        with mock.patch("myapp.activity.time.monotonic", return_value=time.monotonic() + 60), self.run_on_commit():
+            record_activity(invoice.id, "five")
+        self.assertEqual(self.events(invoice.id)[-2:], ["four", "five"])
+
+    def test_events_of_deleted_invoices_are_dropped(self):
+        kept = self.create_invoice(lines=0)
+        deleted = self.create_invoice(lines=0)
+        with self.run_on_commit():
+            record_activity(kept.id, "kept")
+            record_activity(deleted.id, "lost")
+        deleted.delete()
+
+        self.assertEqual(flush_activities(), 1)
+        self.assertEqual(self.events(kept.id), ["Invoice created", "kept"])
+
+    def test_other_users_cannot_read_the_log(self):
+        invoice = self.create_invoice(lines=0)
+        other = User.objects.create_user(username="other", password="secret-pass-123")
+        self.api.force_authenticate(other)
+
+        response = self.api.get(f"/api/invoices/{invoice.id}/activities/")
+
+        self.assertEqual(response.status_code, 404)
+
+
+class ConcurrentPaymentTests(InvoiceFixturesMixin, TransactionTestCase):
+    def test_concurrent_payments_never_overpay(self):
+        invoice = self.create_invoice(lines=1)  # total 236.00
+        barrier = threading.Barrier(6)
+        statuses = []
+
+        def pay():
+            api = APIClient()
+            api.force_authenticate(self.user)
+            barrier.wait()
+            try:
+                response = api.post(
+                    f"/api/invoices/{invoice.id}/payments/",
+                    {"amount": "50.00", "payment_method": "cash"},
+                )
+                statuses.append(response.status_code)
+            except OperationalError:
+                # Shared-cache SQLite refuses concurrent writers outright instead of
+                # queueing them on a row lock; that must still never overpay.
+                statuses.append(None)
+            finally:
+                close_old_connections()
+
+        threads = [threading.Thread(target=pay) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        invoice.refresh_from_db()
+        paid = sum(payment.amount for payment in invoice.payments.all())
+        self.assertEqual(invoice.total_paid_amount, paid)
+        self.assertLessEqual(paid, invoice.item_total)
+        self.assertEqual(invoice.remaining_amount, invoice.item_total - paid)
+        if connection.vendor == "postgresql":
+            # Row locks queue the writers: four 50.00 payments fit in 236.00.
+            self.assertEqual(sorted(statuses), [201, 201, 201, 201, 400, 400])
+            self.assertEqual(paid, Decimal("200.00"))
@@ -0,0 +1,101 @@
+import threading
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, F, Value, When
+from django.utils import timezone
+
+from .balances import apply_balance_delta
+from .models import Invoice
+
+_state = threading.local()
+
+
+def _pending_invoice_ids():
+    return getattr(_state, "pending", None)
+
+
+def apply_totals_delta(invoice_id, amount, gst):
+    """
+    Shift an invoice's stored totals by one line's contribution in a single
+    UPDATE, without reloading the other lines.
+    """
+    pending = _pending_invoice_ids()
+    if pending is not None:
+        pending.add(invoice_id)
+        return
+
+    if not amount and not gst:
+        # The line changed without moving the totals; still mark the invoice modified.
+        touch_invoices([invoice_id])
+        return
+
+    total = amount + gst
+    with transaction.atomic():
+        Invoice.objects.filter(pk=invoice_id).update(
+            item_subtotal_amount=F("item_subtotal_amount") + amount,
+            item_subtotal_gst=F("item_subtotal_gst") + gst,
+            item_total=F("item_total") + total,
+            remaining_amount=F("remaining_amount") + total,
+            updated_at=timezone.now(),
+            # Right-hand side columns still hold the pre-update values.
+            payment_status=Case(
+                When(total_paid_amount=0, then=Value("pending")),
+                When(total_paid_amount__lt=F("item_total") + total, then=Value("partially_paid")),
+                default=Value("paid"),
+            ),
+        )
+        apply_balance_delta(invoice_id, total)
+
+
+@contextmanager
+def deferred_invoice_totals():
+    """
+    Collect the invoices touched inside the block and recompute each one once
+    on exit instead of updating them line by line. Nested blocks join the
+    outermost one.
+    """
+    if _pending_invoice_ids() is not None:
+        yield
+        return
+
+    _state.pending = set()
+    try:
+        yield
+        invoice_ids = _state.pending
+    finally:
+        _state.pending = None
+
+    recalculate_invoice_totals(invoice_ids)
+
+
+def recalculate_invoice_totals(invoice_ids):
+    invoices = Invoice.objects.filter(pk__in=invoice_ids).prefetch_related("invoice_items")
+    with transaction.atomic():
+        for invoice in invoices:
+            invoice.calculate_totals()
+
+
+def touch_invoices(invoice_ids):
+    """Bump ``updated_at`` so cached representations of these invoices go stale."""
+    Invoice.objects.filter(pk__in=invoice_ids).update(updated_at=timezone.now())
+
+
+def line_contribution_delta(instance, deleting=False):
+    """
+    Return ``{invoice_id: (amount, gst)}`` describing how a line save/delete
+    changes invoice totals, based on the values it was loaded with.
+    """
+    deltas = {}
+    saved = getattr(instance, "_saved_line", None)
+    if saved is not None:
+        invoice_id, amount, gst = saved
+        deltas[invoice_id] = (-amount, -gst)
+
+    if not deleting:
+        amount, gst = instance.line_totals()
+        old_amount, old_gst = deltas.get(instance.invoice_id, (Decimal("0"), Decimal("0")))
+        deltas[instance.invoice_id] = (old_amount + amount, old_gst + gst)
+
+    return deltas
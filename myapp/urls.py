@@ -3,12 +3,15 @@ from rest_framework.routers import DefaultRouter
 from .views import (
     ClientViewSet,
     CompanyViewSet,
+    ExportViewSet,
     InvoiceItemViewSet,
     InvoiceViewSet,
     ItemViewSet,
     LoginAPIView,
+    RecurringInvoiceViewSet,
     RefreshAPIView,
     RegisterAPIView,
+    ReportViewSet,
 )
 
 router = DefaultRouter()
@@ -17,6 +20,9 @@ router.register(r'invoices', InvoiceViewSet)
 router.register(r'clients', ClientViewSet)
 router.register(r'items', ItemViewSet)
 router.register(r'invoice-items', InvoiceItemViewSet)
+router.register(r'recurring-invoices', RecurringInvoiceViewSet)
+router.register(r'reports', ReportViewSet, basename='report')
+router.register(r'exports', ExportViewSet, basename='export')
 
 
 
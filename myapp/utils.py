@@ -1,92 +1,264 @@
+import hashlib
 import io
-from decimal import Decimal
+import json
+import multiprocessing
+import tempfile
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
+import django
 from django.conf import settings
+from django.core.files.base import ContentFile, File
+from django.core.files.storage import default_storage
 from django.core.mail import EmailMessage
-from reportlab.lib import colors
-from reportlab.lib.pagesizes import A4
-from reportlab.lib.styles import getSampleStyleSheet
-from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+from django.db.models import Count, Max
 
+from .pdf_templates import LineChunks, format_money, get_template
 
-def format_money(value):
-    try:
-        decimal_value = Decimal(value)
-    except Exception:
-        decimal_value = Decimal("0")
-    return f"{decimal_value:.2f}"
-
-
-def build_client_address(client):
-    parts = [
-        getattr(client, "address", "") or "",
-        getattr(client, "city", "") or "",
-        getattr(client, "state", "") or "",
-        getattr(client, "pincode", "") or "",
+
+def invoice_lines_for_pdf(invoice):
+    """
+    The invoice's lines in display order: the prefetched list when there is
+    one, otherwise streamed from the database in chunks.
+    """
+    if "invoice_items" in getattr(invoice, "_prefetched_objects_cache", {}):
+        return invoice.invoice_items.all()
+    return (
+        invoice.invoice_items.select_related("item")
+        .order_by("id")
+        .iterator(chunk_size=PDF_LINE_CHUNK_SIZE)
+    )
+
+
+def write_invoice_pdf(invoice, output):
+    """Render the invoice PDF into the binary file object ``output``."""
+    template = get_template(invoice.selected_template)
+    rows = (template.line_row(invoice_item) for invoice_item in invoice_lines_for_pdf(invoice))
+    story = [
+        *template.header_story(invoice),
+        LineChunks(template, rows),
+        *template.footer_story(invoice),
     ]
-    return ", ".join([part for part in parts if part]) or "-"
+    template.build(invoice, story, output)
 
 
 def generate_invoice_pdf(invoice):
     buffer = io.BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=A4)
-
-    styles = getSampleStyleSheet()
-    elements = []
-
-    elements.append(Paragraph(f"Company Name: {invoice.company.business_name}", styles["Title"]))
-    elements.append(Spacer(1, 8))
-    elements.append(Paragraph(f"Invoice Title: {invoice.invoice_title}", styles["Normal"]))
-    elements.append(Paragraph(f"Invoice Number: {invoice.invoice_no}", styles["Normal"]))
-    elements.append(Paragraph(f"Invoice Date: {invoice.invoice_date}", styles["Normal"]))
-    elements.append(Paragraph(f"Status: {invoice.status}", styles["Normal"]))
-
-    elements.append(Spacer(1, 14))
-    elements.append(Paragraph("Client Details", styles["Heading3"]))
-    elements.append(Paragraph(f"Client Name: {invoice.client.business_name}", styles["Normal"]))
-    elements.append(Paragraph(f"Client Email: {invoice.client.email or '-'}", styles["Normal"]))
-    elements.append(Paragraph(f"Client Address: {build_client_address(invoice.client)}", styles["Normal"]))
-
-    elements.append(Spacer(1, 14))
-    data = [["Item Name", "Quantity", "Unit Price", "GST", "Total"]]
-    for invoice_item in invoice.invoice_items.all():
-        data.append(
-            [
-                invoice_item.item.item_name,
-                str(invoice_item.quantity),
-                format_money(invoice_item.price),
-                f"{format_money(invoice_item.gst_amount())} ({format_money(invoice_item.gst_rate)}%)",
-                format_money(invoice_item.total_amount()),
-            ]
-        )
+    write_invoice_pdf(invoice, buffer)
+    buffer.seek(0)
+    return buffer
+
+
+# Bump when generate_invoice_pdf's output changes so cached files are not reused.
+PDF_RENDER_VERSION = 4
+PDF_CACHE_DIR = "invoice_pdfs"
+PDF_LINE_CHUNK_SIZE = 500
+
+
+def invoice_pdf_fingerprint(invoice):
+    """
+    Key of everything generate_invoice_pdf renders, built from the
+    ``updated_at`` of the invoice, its company, client and line items plus
+    the line count, so it costs one aggregate query rather than reading
+    every line. Any edit yields a new key, so cached files never need
+    explicit invalidation.
+    """
+    if "invoice_items" in getattr(invoice, "_prefetched_objects_cache", {}):
+        lines = invoice.invoice_items.all()
+        count = len(lines)
+        items_updated = max((line.item.updated_at for line in lines), default=None)
+    else:
+        lines = invoice.invoice_items.aggregate(count=Count("id"), items_updated=Max("item__updated_at"))
+        count, items_updated = lines["count"], lines["items_updated"]
+    content = [
+        PDF_RENDER_VERSION,
+        invoice.selected_template,
+        invoice.updated_at.isoformat(),
+        invoice.company.updated_at.isoformat(),
+        invoice.client.updated_at.isoformat(),
+        items_updated.isoformat() if items_updated else None,
+        count,
+    ]
+    return hashlib.sha256(json.dumps(content).encode()).hexdigest()
+
+
+def invoice_pdf_path(invoice, fingerprint):
+    return f"{PDF_CACHE_DIR}/{invoice.pk}/{fingerprint}.pdf"
+
+
+def discard_invoice_pdfs(invoice_id, keep=None):
+    """Delete the invoice's stored PDFs, except the one at ``keep``."""
+    directory = f"{PDF_CACHE_DIR}/{invoice_id}"
+    try:
+        _, names = default_storage.listdir(directory)
+    except FileNotFoundError:
+        return
+    for name in names:
+        if f"{directory}/{name}" != keep:
+            default_storage.delete(f"{directory}/{name}")
+
+
+def store_invoice_pdf(invoice, path, content):
+    """
+    Store a freshly rendered PDF at ``path`` and delete the copies it
+    supersedes. When a concurrent render stored ``path`` first, storage
+    saves ours under a suffixed name instead; that duplicate is removed.
+    """
+    saved = default_storage.save(path, content)
+    if saved != path:
+        default_storage.delete(saved)
+    else:
+        discard_invoice_pdfs(invoice.pk, keep=path)
+
+
+def open_invoice_pdf(invoice, fingerprint=None):
+    """
+    Return the stored PDF opened for reading, rendering and storing it
+    first if needed. Rendering goes through a temporary file, so the PDF is
+    never held in memory as a whole; a fresh render is served from it.
+    """
+    fingerprint = fingerprint or invoice_pdf_fingerprint(invoice)
+    path = invoice_pdf_path(invoice, fingerprint)
+    if default_storage.exists(path):
+        return default_storage.open(path, "rb")
+
+    rendered = tempfile.TemporaryFile()
+    try:
+        write_invoice_pdf(invoice, rendered)
+        store_invoice_pdf(invoice, path, File(rendered))
+    except BaseException:
+        rendered.close()
+        raise
+    rendered.seek(0)
+    return rendered
+
+
+def get_invoice_pdf(invoice, fingerprint=None):
+    """Return the rendered PDF bytes, reusing a stored copy when one exists."""
+    with open_invoice_pdf(invoice, fingerprint) as stored:
+        return stored.read()
 
-    item_table = Table(data, repeatRows=1)
-    item_table.setStyle(
-        TableStyle(
-            [
-                ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#334155")),
-                ("TEXTCOLOR", (0, 0), (-1, 0), colors.whitesmoke),
-                ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
-                ("ALIGN", (1, 0), (-1, -1), "CENTER"),
-                ("GRID", (0, 0), (-1, -1), 0.75, colors.black),
-                ("ROWBACKGROUNDS", (0, 1), (-1, -1), [colors.white, colors.HexColor("#f8fafc")]),
-            ]
+
+_render_pool = None
+
+
+def _init_render_worker():
+    # Spawned workers start from a fresh interpreter.
+    django.setup()
+
+
+def render_pool(max_workers=None):
+    """
+    The process's PDF render pool, started on first use and kept for the
+    life of the process. Workers are spawned rather than forked, so they
+    never inherit the parent's database connections.
+    """
+    global _render_pool
+    if _render_pool is None:
+        _render_pool = ProcessPoolExecutor(
+            max_workers=max_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_render_worker,
         )
-    )
+    return _render_pool
 
-    elements.append(item_table)
-    elements.append(Spacer(1, 14))
 
-    elements.append(Paragraph(f"Subtotal: {format_money(invoice.item_subtotal_amount)}", styles["Normal"]))
-    elements.append(Paragraph(f"GST: {format_money(invoice.item_subtotal_gst)}", styles["Normal"]))
-    elements.append(Paragraph(f"Grand Total: {format_money(invoice.item_total)}", styles["Heading3"]))
+def render_invoice_pdf_bytes(invoice):
+    return generate_invoice_pdf(invoice).getvalue()
 
-    doc.build(elements)
-    buffer.seek(0)
-    return buffer
+
+def iter_invoice_pdfs(invoices, max_workers=1, chunk_size=100):
+    """
+    Yield ``(invoice, pdf_bytes)`` pairs, serving cached PDFs directly and
+    rendering the misses in this process, or on ``render_pool`` in
+    completion order when ``max_workers`` is not 1.
+
+    ``invoices`` is consumed ``chunk_size`` at a time so a queryset iterator
+    keeps memory flat. Invoices must arrive with ``company``, ``client`` and
+    ``invoice_items__item`` loaded: workers never touch the database.
+    """
+    futures = {}
+    try:
+        for chunk in _chunked(invoices, chunk_size):
+            missing = {}
+            for invoice in chunk:
+                path = invoice_pdf_path(invoice, invoice_pdf_fingerprint(invoice))
+                if default_storage.exists(path):
+                    with default_storage.open(path, "rb") as cached:
+                        yield invoice, cached.read()
+                else:
+                    missing[path] = invoice
+
+            if max_workers == 1 or len(missing) < 2:
+                rendered = ((path, invoice, render_invoice_pdf_bytes(invoice)) for path, invoice in missing.items())
+            else:
+                pool = render_pool(max_workers)
+                futures = {
+                    pool.submit(render_invoice_pdf_bytes, invoice): path
+                    for path, invoice in missing.items()
+                }
+                rendered = (
+                    (futures[future], missing[futures[future]], future.result())
+                    for future in as_completed(futures)
+                )
+
+            for path, invoice, pdf_bytes in rendered:
+                store_invoice_pdf(invoice, path, ContentFile(pdf_bytes))
+                yield invoice, pdf_bytes
+    finally:
+        # The pool outlives this call; drop renders nobody will collect.
+        for future in futures:
+            future.cancel()
 
 
-def send_invoice_email(invoice):
+def _chunked(iterable, size):
+    chunk = []
+    for value in iterable:
+        chunk.append(value)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class _ZipStreamBuffer(io.RawIOBase):
+    """Write-only sink that lets ZipFile emit an archive piece by piece."""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def stream_invoice_pdf_zip(invoices, max_workers=1):
+    """Yield a ZIP archive of invoice PDFs, one chunk per finished file."""
+    sink = _ZipStreamBuffer()
+    # PDFs are already compressed, so store them as-is.
+    with zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_STORED) as archive:
+        for invoice, pdf_bytes in iter_invoice_pdfs(invoices, max_workers=max_workers):
+            archive.writestr(f"invoice-{invoice.invoice_no}.pdf", pdf_bytes)
+            yield sink.drain()
+    yield sink.drain()
+
+
+def check_invoice_email(invoice):
+    """Raise ValueError if the invoice email cannot be sent; return the recipient."""
     client_email = getattr(invoice.client, "email", None)
     if not client_email:
         raise ValueError("Client email is missing for this invoice.")
@@ -97,7 +269,13 @@ def send_invoice_email(invoice):
     if not settings.DEFAULT_FROM_EMAIL:
         raise ValueError("DEFAULT_FROM_EMAIL is not configured.")
 
-    pdf_buffer = generate_invoice_pdf(invoice)
+    return client_email
+
+
+def build_invoice_email(invoice, to_email=None, connection=None, pdf_bytes=None):
+    client_email = check_invoice_email(invoice)
+    if pdf_bytes is None:
+        pdf_bytes = get_invoice_pdf(invoice)
 
     client_name = getattr(invoice.client, "name", None) or getattr(invoice.client, "business_name", "Client")
 
@@ -115,11 +293,12 @@ def send_invoice_email(invoice):
         subject=subject,
         body=message,
         from_email=settings.DEFAULT_FROM_EMAIL,
-        to=[client_email],
+        to=[to_email or client_email],
+        connection=connection,
     )
     email.attach(
         f"invoice-{invoice.invoice_no}.pdf",
-        pdf_buffer.getvalue(),
+        pdf_bytes,
         "application/pdf",
     )
-    email.send(fail_silently=False)
+    return email
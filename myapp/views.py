@@ -1,31 +1,103 @@
+import csv
+import hashlib
+import io
 import logging
+from django.conf import settings
 from django.core.exceptions import ObjectDoesNotExist
-from django.core.mail import BadHeaderError
-from django.http import HttpResponse
+from django.db import transaction
+from django.db.models import Count, DecimalField, F, Max, OuterRef, Prefetch, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, TruncMonth
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_etags, quote_etag
 from rest_framework import generics, status
 from rest_framework.decorators import action
 from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
-from rest_framework.viewsets import ModelViewSet
+from rest_framework.settings import api_settings
+from rest_framework.views import APIView
+from rest_framework.viewsets import ModelViewSet, ViewSet
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
+from datetime import timedelta
 from decimal import Decimal
-from .models import Client, Company, Invoice, InvoiceItem, Item, Payment
-from .permissions import IsAuthenticatedUser, OwnerOrAdminPermission
+from .filters import ListOrderingFilter, QueryParamFilterBackend
+from .models import Client, Company, Invoice, InvoiceItem, Item, Payment, RecurringInvoice, RecurringInvoiceLine
+from .authentication import MetricsTokenAuthentication
+from .metrics import registry
+from .middleware import timed_serializer_class
+from .pagination import FixedIdCursorPagination
+from .permissions import IsAuthenticatedUser, MetricsScrapePermission, OwnerOrAdminPermission
 from .serializers import (
+    ActivitySerializer,
+    AgingReportRowSerializer,
+    ExportQuerySerializer,
+    ClientFilterSerializer,
     ClientSerializer,
     CompanySerializer,
+    GstReportRowSerializer,
+    InvoiceEmailSerializer,
+    InvoiceFilterSerializer,
+    InvoiceItemBulkSerializer,
     InvoiceItemSerializer,
+    InvoiceSelectionSerializer,
     InvoiceSerializer,
     ItemSerializer,
     PaymentSerializer,
+    RecurringInvoiceSerializer,
     RegisterSerializer,
+    ReportQuerySerializer,
+    RevenueReportRowSerializer,
 )
-from .utils import generate_invoice_pdf, send_invoice_email
+from .activity import invoice_pdf_downloaded, record_activity
+from .cache import get_tenant_objects
+from .exports import EXPORT_FORMATS, EXPORTS, export_queryset, stream_export
+from .imports import import_records
+from .outbox import enqueue_invoice_email, enqueue_invoice_emails
+from .payments import IdempotencyConflict, import_payments, read_payment_rows, record_payment
+from .totals import apply_totals_delta
+from .utils import invoice_pdf_fingerprint, open_invoice_pdf, stream_invoice_pdf_zip
 
 logger = logging.getLogger(__name__)
 
+
+def csv_import_response(request, kind):
+    """Shared body of the client and item ``import`` actions."""
+    upload = request.FILES.get("file")
+    if upload is None:
+        return Response({"detail": "Upload a CSV file as 'file'."}, status=status.HTTP_400_BAD_REQUEST)
+
+    reader = csv.DictReader(io.TextIOWrapper(upload.file, encoding="utf-8-sig", newline=""))
+    try:
+        report = import_records(kind, request.user, reader)
+    except (ValueError, UnicodeDecodeError, csv.Error) as exc:
+        return Response({"detail": f"Could not import file: {exc}"}, status=status.HTTP_400_BAD_REQUEST)
+
+    logger.info(
+        "Imported %s for user_id=%s: %s created, %s updated, %s rejected",
+        kind, request.user.id, report["created"], report["updated"], len(report["errors"]),
+    )
+    return Response(report, status=status.HTTP_200_OK)
+
+class TimedSerializationMixin:
+    """
+    Count ``serializer.data`` towards PerformanceMiddleware's ``render``
+    timing; DRF builds it inside the view, before the body is rendered.
+    """
+
+    def get_serializer_class(self):
+        return timed_serializer_class(super().get_serializer_class())
+
+
+MAX_BULK_LINES = 1000
+MAX_IMPORT_ROWS = 10000
+# Statement uploads larger than this are rejected before they are read.
+MAX_IMPORT_BYTES = 5 * 1024 * 1024
+
 class RegisterAPIView(generics.CreateAPIView):
     serializer_class = RegisterSerializer
     permission_classes = [AllowAny]
@@ -39,7 +111,16 @@ class RefreshAPIView(TokenRefreshView):
     permission_classes = [AllowAny]
 
 
-class CompanyViewSet(ModelViewSet):
+class MetricsAPIView(APIView):
+    """Prometheus scrape endpoint for the PerformanceMiddleware registry."""
+    authentication_classes = [MetricsTokenAuthentication, *api_settings.DEFAULT_AUTHENTICATION_CLASSES]
+    permission_classes = [MetricsScrapePermission]
+
+    def get(self, request):
+        return HttpResponse(registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+class CompanyViewSet(TimedSerializationMixin, ModelViewSet):
     queryset = Company.objects.all()
     serializer_class = CompanySerializer
     permission_classes = [IsAuthenticatedUser, OwnerOrAdminPermission]
@@ -49,29 +130,149 @@ class CompanyViewSet(ModelViewSet):
 
     def get_queryset(self):
         if self.request.user.is_staff:
-            return Company.objects.all()
-        return Company.objects.filter(user=self.request.user)
+            return Company.objects.select_related("balance")
+        return Company.objects.filter(user=self.request.user).select_related("balance")
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
 
-class InvoiceViewSet(ModelViewSet):
+class InvoiceViewSet(TimedSerializationMixin, ModelViewSet):
     queryset = Invoice.objects.all()
     serializer_class = InvoiceSerializer
     permission_classes = [IsAuthenticatedUser, OwnerOrAdminPermission]
+    filter_backends = [QueryParamFilterBackend, ListOrderingFilter]
+    filter_serializer_class = InvoiceFilterSerializer
+    ordering_fields = ("id", "invoice_date", "invoice_no", "item_total", "remaining_amount")
+    ordering = ("-id",)
 
     def get_permissions(self):
         return [permission() for permission in self.permission_classes]
 
-    def get_queryset(self):
+    def get_tenant_queryset(self):
         if self.request.user.is_staff:
             return Invoice.objects.all()
         return Invoice.objects.filter(user=self.request.user)
 
+    def get_queryset(self):
+        queryset = self.get_tenant_queryset()
+        if self.action == "pdf":
+            # Lines are streamed by the renderer; prefetching would load them all.
+            return queryset.select_related("company", "client")
+        if self.action == "activities":
+            return queryset.only("id", "user")
+        if self.action not in ("list", "retrieve"):
+            # Writes and the other actions work on one invoice; building a
+            # serializer just to plan joins costs more than it saves.
+            return queryset
+
+        # Load only what the requested fieldset touches so a page costs a fixed
+        # number of queries instead of several per invoice.
+        fields = self.get_serializer().fields
+        if "company_name" in fields:
+            queryset = queryset.select_related("company")
+        if "client_name" in fields:
+            queryset = queryset.select_related("client")
+        if "invoice_items" in fields:
+            queryset = queryset.prefetch_related(
+                Prefetch(
+                    "invoice_items",
+                    queryset=InvoiceItem.objects.select_related("item").order_by("id"),
+                )
+            )
+        if "total_paid" in fields or "remaining_amount" in fields:
+            payments_total = (
+                Payment.objects.filter(invoice=OuterRef("pk"))
+                .values("invoice")
+                .annotate(total=Sum("amount"))
+                .values("total")
+            )
+            queryset = queryset.annotate(
+                payments_total=Coalesce(
+                    Subquery(payments_total),
+                    Value(Decimal("0")),
+                    output_field=DecimalField(max_digits=12, decimal_places=2),
+                )
+            )
+        return queryset
+
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
+    def representation_etag(self, *state):
+        """ETag for this URL's representation (fields/expand/cursor included) at ``state``."""
+        seed = "|".join(str(part) for part in (self.request.user.id, self.request.get_full_path(), *state))
+        return quote_etag(hashlib.sha1(seed.encode()).hexdigest())
+
+    def conditional_response(self, etag, last_modified=None):
+        """Return a 304 if the client's copy is current, else None."""
+        response = get_conditional_response(self.request, etag=etag, last_modified=last_modified)
+        if response is not None:
+            self.set_validators(response, etag, last_modified)
+        return response
+
+    @staticmethod
+    def set_validators(response, etag, last_modified=None):
+        response["ETag"] = etag
+        response["Cache-Control"] = "private, no-cache"
+        if last_modified is not None:
+            response["Last-Modified"] = http_date(last_modified)
+        return response
+
+    def tenant_rows(self, model):
+        if self.request.user.is_staff:
+            return model.objects.all()
+        return model.objects.filter(user=self.request.user)
+
+    def list(self, request, *args, **kwargs):
+        # Deletions do not move MAX(updated_at), so lists only get an ETag.
+        # Renamed companies, clients and items change the payload without
+        # touching invoices, so their latest updated_at is part of the state;
+        # the uncorrelated subqueries are evaluated once.
+        related = {
+            model._meta.model_name: Max(
+                Subquery(self.tenant_rows(model).order_by("-updated_at").values("updated_at")[:1])
+            )
+            for model in (Company, Client, Item)
+        }
+        state = self.filter_queryset(self.get_tenant_queryset()).aggregate(
+            last_updated=Max("updated_at"), count=Count("id"), **related
+        )
+        etag = self.representation_etag(*(state[name] for name in sorted(state)))
+        not_modified = self.conditional_response(etag)
+        if not_modified is not None:
+            return not_modified
+        return self.set_validators(super().list(request, *args, **kwargs), etag)
+
+    def retrieve(self, request, *args, **kwargs):
+        # The payload shows company, client and item fields, whose own
+        # updated_at moves when they are renamed.
+        items_updated = (
+            InvoiceItem.objects.filter(invoice=OuterRef("pk"))
+            .order_by("-item__updated_at")
+            .values("item__updated_at")[:1]
+        )
+        try:
+            versions = (
+                self.get_tenant_queryset()
+                .filter(pk=kwargs["pk"])
+                .annotate(items_updated=Subquery(items_updated))
+                .values_list("updated_at", "company__updated_at", "client__updated_at", "items_updated")
+                .first()
+            )
+        except (TypeError, ValueError):
+            versions = None
+        if versions is None:
+            return super().retrieve(request, *args, **kwargs)
+
+        updated_at = max(version for version in versions if version is not None)
+        etag = self.representation_etag(*versions)
+        last_modified = int(updated_at.timestamp())
+        not_modified = self.conditional_response(etag, last_modified)
+        if not_modified is not None:
+            return not_modified
+        return self.set_validators(super().retrieve(request, *args, **kwargs), etag, last_modified)
+
     def update(self, request, *args, **kwargs):
         invoice = self.get_object()
 
@@ -91,15 +292,62 @@ class InvoiceViewSet(ModelViewSet):
     @action(detail=True, methods=["get"], url_path="pdf")
     def pdf(self, request, pk=None):
         invoice = self.get_object()
-        pdf_buffer = generate_invoice_pdf(invoice)
-        filename = f"invoice-{invoice.invoice_no}.pdf"
-
-        return HttpResponse(
-            pdf_buffer.getvalue(),
+        fingerprint = invoice_pdf_fingerprint(invoice)
+        etag = quote_etag(fingerprint)
+        cache_headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+
+        if_none_match = parse_etags(request.headers.get("If-None-Match", ""))
+        if etag in if_none_match or "*" in if_none_match:
+            response = HttpResponseNotModified()
+            for header, value in cache_headers.items():
+                response[header] = value
+            return response
+
+        response = FileResponse(
+            open_invoice_pdf(invoice, fingerprint),
+            as_attachment=True,
+            filename=f"invoice-{invoice.invoice_no}.pdf",
             content_type="application/pdf",
-            headers={
-                "Content-Disposition": f'attachment; filename="{filename}"'
-            },
+        )
+        for header, value in cache_headers.items():
+            response[header] = value
+        invoice_pdf_downloaded.send(sender=Invoice, invoice_id=invoice.id)
+        return response
+
+    # Always newest first: ?ordering= names invoice columns, not activity ones.
+    @action(
+        detail=True,
+        methods=["get"],
+        url_path="activities",
+        pagination_class=FixedIdCursorPagination,
+        serializer_class=ActivitySerializer,
+    )
+    def activities(self, request, pk=None):
+        invoice = self.get_object()
+        page = self.paginate_queryset(invoice.activities.all())
+        return self.get_paginated_response(self.get_serializer(page, many=True).data)
+
+    @action(detail=False, methods=["get"], url_path="export-pdf")
+    def export_pdf(self, request):
+        selection = InvoiceSelectionSerializer(data=request.query_params)
+        selection.is_valid(raise_exception=True)
+        invoices = (
+            selection.filter_queryset(self.get_tenant_queryset())
+            .select_related("company", "client")
+            .prefetch_related(
+                Prefetch(
+                    "invoice_items",
+                    queryset=InvoiceItem.objects.select_related("item").order_by("id"),
+                )
+            )
+            .order_by("invoice_date", "id")
+        )
+
+        # Cache misses render on the process's shared, bounded render pool.
+        return StreamingHttpResponse(
+            stream_invoice_pdf_zip(invoices.iterator(chunk_size=100), max_workers=settings.PDF_EXPORT_WORKERS),
+            content_type="application/zip",
+            headers={"Content-Disposition": 'attachment; filename="invoices.zip"'},
         )
 
     @action(detail=True, methods=["post"], url_path="send-email")
@@ -107,28 +355,120 @@ class InvoiceViewSet(ModelViewSet):
         invoice = self.get_object()
 
         try:
-            send_invoice_email(invoice)
-            return Response(
-                {"message": "Invoice email sent successfully"},
-                status=status.HTTP_200_OK,
-            )
+            outbox = enqueue_invoice_email(invoice)
         except ValueError as exc:
             return Response(
                 {"detail": str(exc)},
                 status=status.HTTP_400_BAD_REQUEST,
             )
-        except (BadHeaderError, ObjectDoesNotExist) as exc:
+        except ObjectDoesNotExist as exc:
             return Response(
                 {"detail": f"Failed to prepare email: {exc}"},
                 status=status.HTTP_400_BAD_REQUEST,
             )
-        except Exception as exc:
-            logger.exception("Failed to send invoice email for invoice_id=%s", invoice.id)
-            return Response(
-                {"detail": f"Failed to send invoice email: {exc}"},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+
+        data = InvoiceEmailSerializer(outbox).data
+        data["message"] = "Invoice email queued for delivery"
+        data["status_url"] = request.build_absolute_uri(
+            reverse("invoice-email-status", kwargs={"pk": invoice.pk, "email_id": outbox.pk})
+        )
+        return Response(data, status=status.HTTP_202_ACCEPTED)
+
+    @action(detail=False, methods=["post"], url_path="send-emails")
+    def send_emails(self, request):
+        selection = InvoiceSelectionSerializer(data=request.data)
+        selection.is_valid(raise_exception=True)
+        invoices = selection.filter_queryset(self.get_tenant_queryset().select_related("client"))
+
+        report = enqueue_invoice_emails(invoices)
+        return Response(
+            {
+                "queued": sum(1 for row in report if row["status"] == "queued"),
+                "skipped": sum(1 for row in report if row["status"] == "skipped"),
+                "results": report,
+            },
+            status=status.HTTP_202_ACCEPTED,
+        )
+
+    @action(detail=True, methods=["get"], url_path="emails")
+    def emails(self, request, pk=None):
+        invoice = self.get_object()
+        serializer = InvoiceEmailSerializer(invoice.emails.order_by("-created_at"), many=True)
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+    @action(
+        detail=True,
+        methods=["get"],
+        url_path=r"emails/(?P<email_id>[0-9]+)",
+        url_name="email-status",
+    )
+    def email_status(self, request, pk=None, email_id=None):
+        invoice = self.get_object()
+        outbox = get_object_or_404(invoice.emails, pk=email_id)
+        return Response(InvoiceEmailSerializer(outbox).data, status=status.HTTP_200_OK)
+
+    @action(detail=True, methods=["post"], url_path="items/bulk")
+    def bulk_items(self, request, pk=None):
+        invoice = self.get_object()
+
+        if invoice.is_locked:
+            raise ValidationError("Cannot add items to a locked invoice.")
+
+        serializer = InvoiceItemBulkSerializer(
+            data=request.data,
+            many=True,
+            allow_empty=False,
+            max_length=MAX_BULK_LINES,
+        )
+        serializer.is_valid(raise_exception=True)
+        rows = serializer.validated_data
+
+        items = get_tenant_objects(Item, invoice.user_id, {row["item"] for row in rows})
+        errors = [{} if row["item"] in items else {"item": ["Unknown item."]} for row in rows]
+        if any(errors):
+            raise ValidationError(errors)
+
+        lines = []
+        for row in rows:
+            item = items[row["item"]]
+            lines.append(
+                InvoiceItem(
+                    invoice=invoice,
+                    item=item,
+                    quantity=row["quantity"],
+                    price=row.get("price", item.price),
+                    gst_rate=row.get("gst_rate", item.gst_rate),
+                )
             )
 
+        subtotal = Decimal("0")
+        gst = Decimal("0")
+        for line in lines:
+            amount, gst_amount = line.store_line_totals()
+            subtotal += amount
+            gst += gst_amount
+
+        # bulk_create skips the line signals, so apply the combined delta once.
+        with transaction.atomic():
+            InvoiceItem.objects.bulk_create(lines)
+            apply_totals_delta(invoice.id, subtotal, gst)
+        record_activity(invoice.id, f"{len(lines)} lines added")
+
+        invoice.refresh_from_db(
+            fields=["item_subtotal_amount", "item_subtotal_gst", "item_total", "remaining_amount", "payment_status"]
+        )
+        return Response(
+            {
+                "invoice_items": InvoiceItemSerializer(lines, many=True).data,
+                "item_subtotal_amount": invoice.item_subtotal_amount,
+                "item_subtotal_gst": invoice.item_subtotal_gst,
+                "item_total": invoice.item_total,
+                "remaining_amount": invoice.remaining_amount,
+                "payment_status": invoice.payment_status,
+            },
+            status=status.HTTP_201_CREATED,
+        )
+
     @action(detail=True, methods=["get", "post"], url_path="payments")
     def payments(self, request, pk=None):
         invoice = self.get_object()
@@ -143,6 +483,7 @@ class InvoiceViewSet(ModelViewSet):
 
         amount = serializer.validated_data.get("amount")
         payment_method = serializer.validated_data.get("payment_method")
+        reference = serializer.validated_data.get("reference", "")
 
         if amount is None or amount <= 0:
             return Response(
@@ -150,60 +491,108 @@ class InvoiceViewSet(ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        remaining = invoice.item_total - (invoice.total_paid_amount or Decimal("0"))
-        if amount > remaining:
-            print(f"Attempted to record payment of {amount} which exceeds remaining balance of {remaining}")
-            return Response(
-                {"detail": "Payment amount cannot exceed remaining balance"},
-                status=status.HTTP_400_BAD_REQUEST,
+        try:
+            payment, created = record_payment(
+                invoice,
+                amount,
+                payment_method,
+                idempotency_key=request.headers.get("Idempotency-Key"),
+                reference=reference,
             )
-
-        Payment.objects.create(
-            invoice=invoice,
-            amount=amount,
-            payment_method=payment_method,
+        except IdempotencyConflict as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_409_CONFLICT)
+        except ValueError as exc:
+            logger.info(
+                "Rejected payment of %s for invoice_id=%s: %s", amount, invoice.id, exc
+            )
+            return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+
+        totals = {
+            "total_paid_amount": invoice.total_paid_amount,
+            "remaining_amount": invoice.remaining_amount,
+            "payment_status": invoice.payment_status,
+        }
+        if not created and payment.balance_after:
+            # Replay what the original request returned, not today's totals.
+            totals = payment.balance_after
+        response = Response(
+            {"message": "Payment recorded successfully.", "payment_id": payment.id, **totals},
+            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK,
         )
-
-        invoice.total_paid_amount = (invoice.total_paid_amount or Decimal("0")) + amount
-        invoice.remaining_amount = invoice.item_total - invoice.total_paid_amount
-        if invoice.total_paid_amount == 0:
-            invoice.payment_status = "pending"
-        elif invoice.total_paid_amount < invoice.item_total:
-            invoice.payment_status = "partially_paid"
+        if not created:
+            response["Idempotent-Replayed"] = "true"
+        return response
+
+    @action(detail=False, methods=["post"], url_path="payments/import")
+    def import_payments(self, request):
+        """
+        Post a bank statement in one request. Send a JSON list of
+        {invoice_no, amount, method, reference} rows, or upload a CSV (or
+        .json) file as ``file``.
+        """
+        upload = request.FILES.get("file")
+        if upload is not None:
+            if upload.size > MAX_IMPORT_BYTES:
+                return Response(
+                    {"detail": f"Statement files can be at most {MAX_IMPORT_BYTES // (1024 * 1024)} MB."},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            fmt = "json" if upload.name.lower().endswith(".json") else "csv"
+            try:
+                rows = read_payment_rows(upload.file, fmt, limit=MAX_IMPORT_ROWS)
+            except (ValueError, UnicodeDecodeError, csv.Error) as exc:
+                return Response({"detail": f"Could not parse file: {exc}"}, status=status.HTTP_400_BAD_REQUEST)
+        elif isinstance(request.data, list):
+            rows = request.data
         else:
-            invoice.payment_status = "paid"
+            return Response(
+                {"detail": "Send a JSON list of payment rows or upload a file as 'file'."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
 
-        invoice.save(update_fields=["total_paid_amount", "remaining_amount", "payment_status"])
+        if not rows:
+            return Response({"detail": "No payment rows given."}, status=status.HTTP_400_BAD_REQUEST)
+        if len(rows) > MAX_IMPORT_ROWS:
+            return Response(
+                {"detail": f"At most {MAX_IMPORT_ROWS} rows can be imported at once."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
 
-        return Response(
-            {
-                "message": "Payment recorded successfully.",
-                "total_paid_amount": invoice.total_paid_amount,
-                "remaining_amount": invoice.remaining_amount,
-                "payment_status": invoice.payment_status,
-            },
-            status=status.HTTP_201_CREATED,
-        )
+        report = import_payments(self.get_tenant_queryset(), rows)
+        summary = {
+            outcome: sum(1 for row in report if row["status"] == outcome)
+            for outcome in ("created", "duplicate", "error")
+        }
+        logger.info("Imported payments for user_id=%s: %s", request.user.id, summary)
+        return Response({**summary, "rows": report}, status=status.HTTP_200_OK)
 
 
-class ClientViewSet(ModelViewSet):
+class ClientViewSet(TimedSerializationMixin, ModelViewSet):
     queryset = Client.objects.all()
     serializer_class = ClientSerializer
     permission_classes = [IsAuthenticatedUser, OwnerOrAdminPermission]
+    filter_backends = [QueryParamFilterBackend, ListOrderingFilter]
+    filter_serializer_class = ClientFilterSerializer
+    ordering_fields = ("id", "business_name")
+    ordering = ("-id",)
 
     def get_permissions(self):
         return [permission() for permission in self.permission_classes]
 
     def get_queryset(self):
         if self.request.user.is_staff:
-            return Client.objects.all()
-        return Client.objects.filter(user=self.request.user)
+            return Client.objects.select_related("balance")
+        return Client.objects.filter(user=self.request.user).select_related("balance")
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
+    @action(detail=False, methods=["post"], url_path="import")
+    def import_csv(self, request):
+        return csv_import_response(request, "clients")
 
-class ItemViewSet(ModelViewSet):
+
+class ItemViewSet(TimedSerializationMixin, ModelViewSet):
     queryset = Item.objects.all()
     serializer_class = ItemSerializer
     permission_classes = [IsAuthenticatedUser, OwnerOrAdminPermission]
@@ -219,8 +608,32 @@ class ItemViewSet(ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
+    @action(detail=False, methods=["post"], url_path="import")
+    def import_csv(self, request):
+        return csv_import_response(request, "items")
+
+
+class RecurringInvoiceViewSet(TimedSerializationMixin, ModelViewSet):
+    queryset = RecurringInvoice.objects.all()
+    serializer_class = RecurringInvoiceSerializer
+    permission_classes = [IsAuthenticatedUser, OwnerOrAdminPermission]
+
+    def get_permissions(self):
+        return [permission() for permission in self.permission_classes]
+
+    def get_queryset(self):
+        queryset = RecurringInvoice.objects.prefetch_related(
+            Prefetch("lines", queryset=RecurringInvoiceLine.objects.select_related("item").order_by("id"))
+        ).order_by("id")
+        if self.request.user.is_staff:
+            return queryset
+        return queryset.filter(user=self.request.user)
+
+    def perform_create(self, serializer):
+        serializer.save(user=self.request.user)
+
 
-class InvoiceItemViewSet(ModelViewSet):
+class InvoiceItemViewSet(TimedSerializationMixin, ModelViewSet):
     queryset = InvoiceItem.objects.all()
     serializer_class = InvoiceItemSerializer
     permission_classes = [IsAuthenticatedUser]
@@ -234,7 +647,181 @@ class InvoiceItemViewSet(ModelViewSet):
 
         if invoice.is_locked:
             raise ValidationError("Cannot add items to a locked invoice.")
-        if invoice.user != self.request.user or item.user != self.request.user:
+        if invoice.user_id != self.request.user.id or item.user_id != self.request.user.id:
             raise ValidationError("You can only add your own items to your own invoices.")
 
         serializer.save()
+
+
+class ReportViewSet(ViewSet):
+    """
+    Dashboard aggregates computed in the database.
+
+    Every action accepts company, date_from, date_to, status and group_by
+    (month, client or company). Cancelled invoices are left out unless
+    status is given explicitly.
+    """
+    permission_classes = [IsAuthenticatedUser]
+
+    GROUPS = {
+        "month": ("invoice_date", None),
+        "client": ("client_id", "client__business_name"),
+        "company": ("company_id", "company__business_name"),
+    }
+
+    def get_report_query(self):
+        query = ReportQuerySerializer(data=self.request.query_params)
+        query.is_valid(raise_exception=True)
+        return query
+
+    def get_invoices(self, query):
+        if self.request.user.is_staff:
+            invoices = Invoice.objects.all()
+        else:
+            invoices = Invoice.objects.filter(user=self.request.user)
+        if "status" not in query.validated_data:
+            invoices = invoices.exclude(status="cancelled")
+        return query.filter_queryset(invoices)
+
+    def group_rows(self, queryset, group_by, prefix="", breakdown=(), **aggregates):
+        """
+        Aggregate ``queryset`` per group. ``prefix`` reaches the invoice from
+        another model (e.g. ``"invoice__"``); ``breakdown`` columns split
+        each group further.
+        """
+        key_field, label_field = self.GROUPS[group_by]
+        key_expression = TruncMonth(prefix + key_field) if group_by == "month" else F(prefix + key_field)
+        label_field = label_field and prefix + label_field
+        columns = ["group_key", *([label_field] if label_field else []), *breakdown]
+        rows = (
+            queryset.annotate(group_key=key_expression)
+            .order_by()
+            .values(*columns)
+            .annotate(**aggregates)
+            .order_by("group_key", *breakdown)
+        )
+        for row in rows:
+            key = row.pop("group_key")
+            key = key.strftime("%Y-%m") if group_by == "month" else str(key)
+            row["key"] = key
+            row["label"] = row.pop(label_field) if label_field else key
+            yield row
+
+    @staticmethod
+    def revenue_aggregates():
+        return {
+            "invoice_count": Count("id"),
+            "subtotal": Sum("item_subtotal_amount", default=0),
+            "gst": Sum("item_subtotal_gst", default=0),
+            "total": Sum("item_total", default=0),
+            "paid": Sum("total_paid_amount", default=0),
+            "outstanding": Sum("remaining_amount", default=0),
+        }
+
+    @staticmethod
+    def aging_aggregates():
+        today = timezone.localdate()
+        day_30 = today - timedelta(days=30)
+        day_60 = today - timedelta(days=60)
+        day_90 = today - timedelta(days=90)
+        return {
+            "invoice_count": Count("id"),
+            "current": Sum("remaining_amount", filter=Q(invoice_date__gte=day_30), default=0),
+            "days_31_60": Sum(
+                "remaining_amount",
+                filter=Q(invoice_date__lt=day_30, invoice_date__gte=day_60),
+                default=0,
+            ),
+            "days_61_90": Sum(
+                "remaining_amount",
+                filter=Q(invoice_date__lt=day_60, invoice_date__gte=day_90),
+                default=0,
+            ),
+            "over_90": Sum("remaining_amount", filter=Q(invoice_date__lt=day_90), default=0),
+            "total": Sum("remaining_amount", default=0),
+        }
+
+    def list(self, request):
+        invoices = self.get_invoices(self.get_report_query())
+        revenue = invoices.aggregate(**self.revenue_aggregates())
+        aging = invoices.filter(remaining_amount__gt=0).aggregate(**self.aging_aggregates())
+        return Response(
+            {
+                "revenue": RevenueReportRowSerializer({"key": "all", "label": "All", **revenue}).data,
+                "aging": AgingReportRowSerializer({"key": "all", "label": "All", **aging}).data,
+            },
+            status=status.HTTP_200_OK,
+        )
+
+    @action(detail=False, methods=["get"])
+    def revenue(self, request):
+        query = self.get_report_query()
+        rows = self.group_rows(
+            self.get_invoices(query),
+            query.validated_data["group_by"],
+            **self.revenue_aggregates(),
+        )
+        return Response(RevenueReportRowSerializer(rows, many=True).data, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=["get"])
+    def gst(self, request):
+        query = self.get_report_query()
+        invoices = self.get_invoices(query)
+        rows = self.group_rows(
+            InvoiceItem.objects.filter(invoice__in=invoices.values("id")),
+            query.validated_data["group_by"],
+            prefix="invoice__",
+            breakdown=("gst_rate",),
+            line_count=Count("id"),
+            # The stored per-line values, rounded as invoice totals are.
+            taxable_amount=Sum("line_amount"),
+            gst_amount=Sum("line_gst"),
+        )
+        return Response(GstReportRowSerializer(rows, many=True).data, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=["get"])
+    def aging(self, request):
+        query = self.get_report_query()
+        rows = self.group_rows(
+            self.get_invoices(query).filter(remaining_amount__gt=0),
+            query.validated_data["group_by"],
+            **self.aging_aggregates(),
+        )
+        return Response(AgingReportRowSerializer(rows, many=True).data, status=status.HTTP_200_OK)
+
+
+
+class ExportViewSet(ViewSet):
+    """
+    Streaming exports of invoices, invoice items and payments.
+
+    ``GET /exports/<kind>/`` accepts the invoice filters company, date_from,
+    date_to and status, plus ``output=csv`` (default) or ``output=jsonl``.
+    """
+    permission_classes = [IsAuthenticatedUser]
+    lookup_value_regex = "|".join(EXPORTS)
+
+    def list(self, request):
+        return Response(
+            {
+                kind: request.build_absolute_uri(reverse("export-detail", args=[kind]))
+                for kind in EXPORTS
+            }
+        )
+
+    def retrieve(self, request, pk=None):
+        query = ExportQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+
+        if request.user.is_staff:
+            invoices = Invoice.objects.all()
+        else:
+            invoices = Invoice.objects.filter(user=request.user)
+        columns, rows = export_queryset(pk, query.filter_queryset(invoices))
+
+        output = query.validated_data["output"]
+        return StreamingHttpResponse(
+            stream_export(output, columns, rows),
+            content_type=EXPORT_FORMATS[output],
+            headers={"Content-Disposition": f'attachment; filename="{pk}.{output}"'},
+        )